@@ -1,5 +1,6 @@
 from pathlib import Path
 import click
+from chia.cmds.db_recompress_func import db_recompress_func
 from chia.cmds.db_upgrade_func import db_upgrade_func
 from chia.cmds.db_validate_func import db_validate_func
 
@@ -61,3 +62,30 @@ def db_validate_cmd(ctx: click.Context, validate_blocks: bool, **kwargs) -> None
         )
     except RuntimeError as e:
         print(f"FAILED: {e}")
+
+
+@db_cmd.command(
+    "recompress", short_help="compress the blocks in the (v2) blockchain database with a trained dictionary"
+)
+@click.option("--db", default=None, type=click.Path(), help="Specifies which database file to recompress")
+@click.option(
+    "--no-train",
+    default=False,
+    is_flag=True,
+    help="don't train a new compression dictionary, recompress with the most recent existing one",
+)
+@click.option("--samples", default=5000, type=int, help="number of blocks to train the dictionary on")
+@click.option("--dict-size", default=110 * 1024, type=int, help="size (in bytes) of the trained dictionary")
+@click.pass_context
+def db_recompress_cmd(ctx: click.Context, no_train: bool, samples: int, dict_size: int, **kwargs) -> None:
+    try:
+        in_db_path = kwargs.get("db")
+        db_recompress_func(
+            Path(ctx.obj["root_path"]),
+            None if in_db_path is None else Path(in_db_path),
+            train=not no_train,
+            num_samples=samples,
+            dict_size=dict_size,
+        )
+    except RuntimeError as e:
+        print(f"FAILED: {e}")
@@ -0,0 +1,116 @@
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from chia.util.config import load_config
+from chia.util.path import path_from_root
+
+
+def db_recompress_func(
+    root_path: Path,
+    in_db_path: Optional[Path] = None,
+    *,
+    train: bool,
+    num_samples: int,
+    dict_size: int,
+) -> None:
+    if in_db_path is None:
+        config: Dict[str, Any] = load_config(root_path, "config.yaml")["full_node"]
+        selected_network: str = config["selected_network"]
+        db_pattern: str = config["database_path"]
+        db_path_replaced: str = db_pattern.replace("CHALLENGE", selected_network)
+        in_db_path = path_from_root(root_path, db_path_replaced)
+
+    recompress_v2(in_db_path, train=train, num_samples=num_samples, dict_size=dict_size)
+
+    print(f"\n\nDATABASE RECOMPRESSED: {in_db_path}")
+    print("run VACUUM on the database to reclaim the freed space\n")
+
+
+def recompress_v2(in_path: Path, *, train: bool, num_samples: int, dict_size: int) -> None:
+    import sqlite3
+    from contextlib import closing
+
+    from chia.util.block_compression import BlockCompressor, frame_dict_id, load_dictionaries, train_dictionary
+
+    if not in_path.exists():
+        print(f"input file doesn't exist. {in_path}")
+        raise RuntimeError(f"can't find {in_path}")
+
+    print(f"opening file for writing: {in_path}")
+    with closing(sqlite3.connect(in_path)) as db:
+
+        try:
+            with closing(db.execute("SELECT * FROM database_version")) as cursor:
+                row = cursor.fetchone()
+                if row is None or row == []:
+                    raise RuntimeError("Database is missing version field")
+                if row[0] != 2:
+                    raise RuntimeError(f"Database has the wrong version ({row[0]} expected 2)")
+        except sqlite3.OperationalError:
+            raise RuntimeError("Database is missing version table")
+
+        db.execute("CREATE TABLE IF NOT EXISTS compression_dictionaries(dict_id integer PRIMARY KEY, dictionary blob)")
+        dictionaries = load_dictionaries(db)
+        compressor = BlockCompressor(dictionaries)
+
+        if train:
+            print(f"training compression dictionary on {num_samples} blocks")
+            with closing(
+                db.execute(
+                    "SELECT block FROM full_blocks WHERE in_main_chain=1 AND block IS NOT NULL "
+                    "ORDER BY RANDOM() LIMIT ?",
+                    (num_samples,),
+                )
+            ) as cursor:
+                samples = [compressor.decompress(row[0]) for row in cursor.fetchall()]
+
+            if len(samples) == 0:
+                raise RuntimeError("Database has no blocks to train a compression dictionary on")
+
+            dict_id = max(dictionaries.keys(), default=0) + 1
+            dict_data = train_dictionary(samples, dict_id, dict_size)
+            db.execute("INSERT INTO compression_dictionaries VALUES(?, ?)", (dict_id, dict_data))
+            db.commit()
+            compressor.add_dictionary(dict_id, dict_data)
+            print(f"added compression dictionary {dict_id} ({len(dict_data)} bytes)")
+
+        if compressor.current_dict_id is None:
+            print("no compression dictionary, nothing to do")
+            return
+
+        print(f"recompressing blocks with dictionary {compressor.current_dict_id}")
+
+        last_rowid = 0
+        num_blocks = 0
+        old_size = 0
+        new_size = 0
+        while True:
+            with closing(
+                db.execute(
+                    "SELECT rowid, block FROM full_blocks WHERE rowid>? ORDER BY rowid LIMIT 1000", (last_rowid,)
+                )
+            ) as cursor:
+                rows = cursor.fetchall()
+            if len(rows) == 0:
+                break
+
+            updates = []
+            for rowid, block in rows:
+                last_rowid = rowid
+                # blocks in the flat-file block archive are left alone
+                if block is None or frame_dict_id(block) == compressor.current_dict_id:
+                    continue
+                new_block = compressor.compress(compressor.decompress(block))
+                old_size += len(block)
+                new_size += len(new_block)
+                updates.append((new_block, rowid))
+
+            db.executemany("UPDATE full_blocks SET block=? WHERE rowid=?", updates)
+            db.commit()
+            num_blocks += len(updates)
+            print(
+                f"\r{num_blocks} blocks recompressed. "
+                f"{old_size / 1000000:0.1f} MB -> {new_size / 1000000:0.1f} MB ",
+                end="",
+            )
+        print("")
@@ -31,7 +31,7 @@ def validate_v2(in_path: Path, *, validate_blocks: bool) -> None:
     import sqlite3
     from contextlib import closing
 
-    import zstd
+    from chia.util.block_compression import BlockCompressor, load_dictionaries
 
     if not in_path.exists():
         print(f"input file doesn't exist. {in_path}")
@@ -70,6 +70,8 @@ def validate_v2(in_path: Path, *, validate_blocks: bool) -> None:
 
         print(f"peak height: {peak_height}")
 
+        compressor = BlockCompressor(load_dictionaries(in_db))
+
         print("traversing the full chain")
 
         current_height = peak_height
@@ -102,8 +104,10 @@ def validate_v2(in_path: Path, *, validate_blocks: bool) -> None:
                 if height > peak_height:
                     continue
 
-                if validate_blocks:
-                    block = FullBlock.from_bytes(zstd.decompress(row[4]))
+                # blocks in the flat-file block archive have no blob in the
+                # database, those are not validated
+                if validate_blocks and row[4] is not None:
+                    block = FullBlock.from_bytes(compressor.decompress(row[4]))
                     block_record = BlockRecord.from_bytes(row[5])
                     actual_header_hash = block.header_hash
                     actual_prev_hash = block.prev_header_hash
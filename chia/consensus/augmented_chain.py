@@ -0,0 +1,106 @@
+from typing import Dict, List, Optional
+
+from chia.consensus.block_record import BlockRecord
+from chia.consensus.blockchain_interface import BlockchainInterface
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.blockchain_format.sub_epoch_summary import SubEpochSummary
+from chia.types.full_block import FullBlock
+from chia.util.ints import uint32
+
+
+class AugmentedBlockchain(BlockchainInterface):
+    """
+    A view of a blockchain, extended by blocks that have been pre-validated,
+    but not added to it yet. The extra blocks must extend the main chain of
+    the underlying blockchain, in height order. This allows pre-validating
+    the next batch of blocks while the current one is still being added.
+
+    Block records added with add_block_record() (like the temporary ones
+    added during pre-validation) only affect this view, never the underlying
+    blockchain.
+    """
+
+    _underlying: BlockchainInterface
+    _extra_blocks: Dict[bytes32, FullBlock]
+    _extra_block_records: Dict[bytes32, BlockRecord]
+    _height_to_hash: Dict[uint32, bytes32]
+
+    def __init__(self, underlying: BlockchainInterface) -> None:
+        self._underlying = underlying
+        self._extra_blocks = {}
+        self._extra_block_records = {}
+        self._height_to_hash = {}
+
+    def add_extra_block(self, block: FullBlock, block_record: BlockRecord) -> None:
+        assert block.header_hash == block_record.header_hash
+        self._extra_blocks[block.header_hash] = block
+        self._extra_block_records[block_record.header_hash] = block_record
+        self._height_to_hash[block_record.height] = block_record.header_hash
+
+    def add_extra_block_record(self, block_record: BlockRecord) -> None:
+        """
+        Like add_extra_block(), for a block we only have the header of
+        """
+        self._extra_block_records[block_record.header_hash] = block_record
+        self._height_to_hash[block_record.height] = block_record.header_hash
+
+    def clean_extra_block_records(self, height: int) -> None:
+        """
+        Forgets the extra blocks and block records below height, like
+        Blockchain.clean_block_record()
+        """
+        for header_hash, block_record in list(self._extra_block_records.items()):
+            if block_record.height < height:
+                del self._extra_block_records[header_hash]
+                self._extra_blocks.pop(header_hash, None)
+                if self._height_to_hash.get(block_record.height) == header_hash:
+                    del self._height_to_hash[block_record.height]
+
+    @property
+    def extra_blocks(self) -> Dict[bytes32, FullBlock]:
+        return self._extra_blocks
+
+    def get_peak(self) -> Optional[BlockRecord]:
+        if len(self._height_to_hash) > 0:
+            return self._extra_block_records[self._height_to_hash[max(self._height_to_hash)]]
+        return self._underlying.get_peak()
+
+    def get_peak_height(self) -> Optional[uint32]:
+        if len(self._height_to_hash) > 0:
+            return max(self._height_to_hash)
+        return self._underlying.get_peak_height()
+
+    def block_record(self, header_hash: bytes32) -> BlockRecord:
+        block_record = self._extra_block_records.get(header_hash)
+        if block_record is not None:
+            return block_record
+        return self._underlying.block_record(header_hash)
+
+    def height_to_block_record(self, height: uint32) -> BlockRecord:
+        header_hash = self.height_to_hash(height)
+        assert header_hash is not None
+        return self.block_record(header_hash)
+
+    def get_ses_heights(self) -> List[uint32]:
+        return self._underlying.get_ses_heights()
+
+    def get_ses(self, height: uint32) -> SubEpochSummary:
+        return self._underlying.get_ses(height)
+
+    def height_to_hash(self, height: uint32) -> Optional[bytes32]:
+        header_hash = self._height_to_hash.get(height)
+        if header_hash is not None:
+            return header_hash
+        return self._underlying.height_to_hash(height)
+
+    def contains_block(self, header_hash: bytes32) -> bool:
+        return header_hash in self._extra_block_records or self._underlying.contains_block(header_hash)
+
+    def contains_height(self, height: uint32) -> bool:
+        return height in self._height_to_hash or self._underlying.contains_height(height)
+
+    def remove_block_record(self, header_hash: bytes32) -> None:
+        del self._extra_block_records[header_hash]
+
+    def add_block_record(self, block_record: BlockRecord) -> None:
+        self._extra_block_records[block_record.header_hash] = block_record
@@ -51,6 +51,7 @@ def create_foliage(
     get_plot_signature: Callable[[bytes32, G1Element], G2Element],
     get_pool_signature: Callable[[PoolTarget, Optional[G1Element]], Optional[G2Element]],
     seed: bytes = b"",
+    npc_result: Optional[NPCResult] = None,
 ) -> Tuple[Foliage, Optional[FoliageTransactionBlock], Optional[TransactionsInfo]]:
     """
     Creates a foliage for a given reward chain block. This may or may not be a tx block. In the case of a tx block,
@@ -71,6 +72,7 @@ def create_foliage(
         get_plot_signature: retrieve the signature corresponding to the plot public key
         get_pool_signature: retrieve the signature corresponding to the pool public key
         seed: seed to randomize block
+        npc_result: the result of running block_generator, if already known
 
     """
 
@@ -128,13 +130,14 @@ def create_foliage(
         # Calculate the cost of transactions
         if block_generator is not None:
             generator_block_heights_list = block_generator.block_height_list
-            result: NPCResult = get_name_puzzle_conditions(
-                block_generator,
-                constants.MAX_BLOCK_COST_CLVM,
-                cost_per_byte=constants.COST_PER_BYTE,
-                mempool_mode=True,
-            )
-            cost = result.cost
+            if npc_result is None:
+                npc_result = get_name_puzzle_conditions(
+                    block_generator,
+                    constants.MAX_BLOCK_COST_CLVM,
+                    cost_per_byte=constants.COST_PER_BYTE,
+                    mempool_mode=True,
+                )
+            cost = npc_result.cost
 
             removal_amount = 0
             addition_amount = 0
@@ -303,6 +306,7 @@ def create_unfinished_block(
     removals: Optional[List[Coin]] = None,
     prev_block: Optional[BlockRecord] = None,
     finished_sub_slots_input: List[EndOfSubSlotBundle] = None,
+    npc_result: Optional[NPCResult] = None,
 ) -> UnfinishedBlock:
     """
     Creates a new unfinished block using all the information available at the signage point. This will have to be
@@ -331,6 +335,7 @@ def create_unfinished_block(
         prev_block: previous block (already in chain) from the signage point
         blocks: dictionary from header hash to SBR of all included SBR
         finished_sub_slots_input: finished_sub_slots at the signage point
+        npc_result: the result of running block_generator, if already known
 
     Returns:
 
@@ -406,6 +411,7 @@ def create_unfinished_block(
         get_plot_signature,
         get_pool_signature,
         seed,
+        npc_result,
     )
     return UnfinishedBlock(
         finished_sub_slots,
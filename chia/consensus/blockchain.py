@@ -8,10 +8,11 @@ from concurrent.futures.process import ProcessPoolExecutor
 from enum import Enum
 from multiprocessing.context import BaseContext
 from pathlib import Path
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, List, Optional, Sequence, Set, Tuple
 
 from chia.consensus.block_body_validation import validate_block_body
 from chia.consensus.block_header_validation import validate_unfinished_header_block
+from chia.consensus.augmented_chain import AugmentedBlockchain
 from chia.consensus.block_record import BlockRecord
 from chia.consensus.blockchain_interface import BlockchainInterface
 from chia.consensus.constants import ConsensusConstants
@@ -23,7 +24,9 @@ from chia.consensus.multiprocess_validation import (
     PreValidationResult,
     _run_generator,
     pre_validate_blocks_multiprocessing,
+    start_pre_validate_blocks,
 )
+from chia.consensus.shared_block_records import SharedBlockRecords
 from chia.full_node.block_height_map import BlockHeightMap
 from chia.full_node.block_store import BlockStore
 from chia.full_node.coin_store import CoinStore
@@ -86,6 +89,10 @@ class Blockchain(BlockchainInterface):
     block_store: BlockStore
     # Used to verify blocks in parallel
     pool: Executor
+    # Recent block records, shared with the pool's workers. Created on first
+    # use, None if they're pickled to the workers instead
+    _shared_block_records: Optional[SharedBlockRecords]
+    _shared_block_records_created: bool
     # Set holding seen compact proofs, in order to avoid duplicates.
     _seen_compact_proofs: Set[Tuple[VDFInfo, uint32]]
 
@@ -137,6 +144,9 @@ class Blockchain(BlockchainInterface):
         self.block_store = block_store
         self.constants_json = recurse_jsonify(dataclasses.asdict(self.constants))
         self._shut_down = False
+        self._shared_block_records = None
+        # there's nothing to share with an InlineExecutor
+        self._shared_block_records_created = single_threaded
         await self._load_chain_from_store(blockchain_dir)
         self._seen_compact_proofs = set()
         self.hint_store = hint_store
@@ -145,6 +155,16 @@ class Blockchain(BlockchainInterface):
     def shut_down(self):
         self._shut_down = True
         self.pool.shutdown(wait=True)
+        self.__height_map.close()
+        if self._shared_block_records is not None:
+            self._shared_block_records.close()
+            self._shared_block_records = None
+
+    def _get_shared_block_records(self) -> Optional[SharedBlockRecords]:
+        if not self._shared_block_records_created:
+            self._shared_block_records_created = True
+            self._shared_block_records = SharedBlockRecords.create()
+        return self._shared_block_records
 
     async def _load_chain_from_store(self, blockchain_dir):
         """
@@ -193,6 +213,8 @@ class Blockchain(BlockchainInterface):
         block: FullBlock,
         pre_validation_result: PreValidationResult,
         fork_point_with_peak: Optional[uint32] = None,
+        *,
+        validate_signature: bool = True,
     ) -> Tuple[
         ReceiveBlockResult,
         Optional[Err],
@@ -210,6 +232,8 @@ class Blockchain(BlockchainInterface):
             block: The FullBlock to be validated.
             pre_validation_result: A result of successful pre validation
             fork_point_with_peak: The fork point, for efficiency reasons, if None, it will be recomputed
+            validate_signature: False to not validate the aggregate signature at all (below an assumed valid
+                block during long sync), even if it wasn't validated during pre validation
 
         Returns:
             The result of adding the block to the blockchain (NEW_PEAK, ADDED_AS_ORPHAN, INVALID_BLOCK,
@@ -247,7 +271,7 @@ class Blockchain(BlockchainInterface):
             fork_point_with_peak,
             self.get_block_generator,
             # If we did not already validate the signature, validate it now
-            validate_signature=not pre_validation_result.validated_signature,
+            validate_signature=validate_signature and not pre_validation_result.validated_signature,
         )
         if error_code is not None:
             return ReceiveBlockResult.INVALID_BLOCK, error_code, None, ([], {})
@@ -640,6 +664,104 @@ class Blockchain(BlockchainInterface):
             batch_size,
             wp_summaries,
             validate_signatures=validate_signatures,
+            shared_records=self._get_shared_block_records(),
+        )
+
+    async def start_pre_validate_blocks(
+        self,
+        blocks: List[FullBlock],
+        npc_results: Dict[uint32, NPCResult],
+        batch_size: int = 4,
+        wp_summaries: Optional[List[SubEpochSummary]] = None,
+        *,
+        validate_signatures: bool,
+        unapplied_blocks: Sequence[Tuple[FullBlock, BlockRecord]] = (),
+        block_bytes: Optional[Sequence[bytes]] = None,
+        header_digests: Optional[Sequence[Optional[bytes32]]] = None,
+    ) -> Tuple[List[BlockRecord], "asyncio.Future[List[PreValidationResult]]"]:
+        """
+        Submits the blocks to the pool for pre-validation, and returns their
+        block records and a future for the results, see
+        start_pre_validate_blocks() in multiprocess_validation. unapplied_blocks
+        are blocks (and their records) that extend the peak and have been
+        pre-validated, but not added yet. The blocks to validate may build on
+        top of them. block_bytes may be the serialized blocks, as received from
+        the network. header_digests are the digests of the headers that were
+        already validated, in a headers first sync.
+        """
+        if len(unapplied_blocks) == 0:
+            return await start_pre_validate_blocks(
+                self.constants,
+                self.constants_json,
+                self,
+                blocks,
+                self.pool,
+                True,
+                npc_results,
+                self.get_block_generator,
+                batch_size,
+                wp_summaries,
+                validate_signatures=validate_signatures,
+                block_bytes=block_bytes,
+                shared_records=self._get_shared_block_records(),
+                header_digests=header_digests,
+            )
+
+        chain = AugmentedBlockchain(self)
+        for block, block_record in unapplied_blocks:
+            chain.add_extra_block(block, block_record)
+
+        async def get_block_generator(
+            block: BlockInfo, additional_blocks: Optional[Dict[bytes32, FullBlock]] = None
+        ) -> Optional[BlockGenerator]:
+            # the generators of the unapplied blocks aren't in the database
+            # yet, so they may only be referenced through additional_blocks
+            if additional_blocks is None:
+                additional_blocks = {}
+            return await self.get_block_generator(block, {**chain.extra_blocks, **additional_blocks})
+
+        return await start_pre_validate_blocks(
+            self.constants,
+            self.constants_json,
+            chain,
+            blocks,
+            self.pool,
+            True,
+            npc_results,
+            get_block_generator,
+            batch_size,
+            wp_summaries,
+            validate_signatures=validate_signatures,
+            block_bytes=block_bytes,
+            shared_records=self._get_shared_block_records(),
+            header_digests=header_digests,
+        )
+
+    async def start_pre_validate_headers(
+        self,
+        chain: AugmentedBlockchain,
+        header_blocks: List[HeaderBlock],
+        wp_summaries: Optional[List[SubEpochSummary]] = None,
+        batch_size: int = 4,
+    ) -> Tuple[List[BlockRecord], "asyncio.Future[List[PreValidationResult]]"]:
+        """
+        Like start_pre_validate_blocks(), for the header blocks of a headers
+        first sync. chain extends this blockchain with the block records of
+        the headers before them.
+        """
+        return await start_pre_validate_blocks(
+            self.constants,
+            self.constants_json,
+            chain,
+            header_blocks,  # type: ignore[arg-type]
+            self.pool,
+            False,
+            {},
+            self.get_block_generator,
+            batch_size,
+            wp_summaries,
+            validate_signatures=False,
+            shared_records=self._get_shared_block_records(),
         )
 
     async def run_generator(self, unfinished_block: bytes, generator: BlockGenerator, height: uint32) -> NPCResult:
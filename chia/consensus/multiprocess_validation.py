@@ -16,6 +16,7 @@ from chia.consensus.difficulty_adjustment import get_next_sub_slot_iters_and_dif
 from chia.consensus.full_block_to_block_record import block_to_block_record
 from chia.consensus.get_block_challenge import get_block_challenge
 from chia.consensus.pot_iterations import calculate_iterations_quality, is_overflow_block
+from chia.consensus.shared_block_records import BlockRecordRefs, SharedBlockRecords, load_block_records
 from chia.full_node.mempool_check_conditions import get_name_puzzle_conditions
 from chia.types.block_protocol import BlockInfo
 from chia.types.blockchain_format.coin import Coin
@@ -28,7 +29,7 @@ from chia.types.unfinished_block import UnfinishedBlock
 from chia.util.block_cache import BlockCache
 from chia.util.condition_tools import pkm_pairs
 from chia.util.errors import Err, ValidationError
-from chia.util.generator_tools import get_block_header, tx_removals_and_additions
+from chia.util.generator_tools import get_block_header, get_header_digest, tx_removals_and_additions
 from chia.util.ints import uint16, uint32, uint64
 from chia.util.streamable import Streamable, dataclass_from_dict, streamable
 
@@ -55,8 +56,12 @@ def batch_pre_validate_blocks(
     expected_difficulty: List[uint64],
     expected_sub_slot_iters: List[uint64],
     validate_signatures: bool,
+    block_record_refs: Optional[BlockRecordRefs] = None,
+    validated_headers: Optional[List[Optional[Tuple[bytes32, uint64]]]] = None,
 ) -> List[bytes]:
     blocks: Dict[bytes32, BlockRecord] = {}
+    if block_record_refs is not None:
+        blocks = load_block_records(block_record_refs)
     for k, v in blocks_pickled.items():
         blocks[bytes32(k)] = BlockRecord.from_bytes(v)
     results: List[PreValidationResult] = []
@@ -98,15 +103,22 @@ def batch_pre_validate_blocks(
                     results.append(PreValidationResult(uint16(npc_result.error), None, npc_result, False))
                     continue
 
-                header_block = get_block_header(block, tx_additions, removals)
-                required_iters, error = validate_finished_header_block(
-                    constants,
-                    BlockCache(blocks),
-                    header_block,
-                    check_filter,
-                    expected_difficulty[i],
-                    expected_sub_slot_iters[i],
-                )
+                validated_header = None if validated_headers is None else validated_headers[i]
+                if validated_header is not None and get_header_digest(block) == validated_header[0]:
+                    # this exact header was validated during a headers first
+                    # sync. The transactions filter is checked with the body
+                    required_iters: Optional[uint64] = validated_header[1]
+                    error: Optional[ValidationError] = None
+                else:
+                    header_block = get_block_header(block, tx_additions, removals)
+                    required_iters, error = validate_finished_header_block(
+                        constants,
+                        BlockCache(blocks),
+                        header_block,
+                        check_filter,
+                        expected_difficulty[i],
+                        expected_sub_slot_iters[i],
+                    )
                 error_int: Optional[uint16] = None
                 if error is not None:
                     error_int = uint16(error.code.value)
@@ -174,6 +186,7 @@ async def pre_validate_blocks_multiprocessing(
     wp_summaries: Optional[List[SubEpochSummary]] = None,
     *,
     validate_signatures: bool = True,
+    shared_records: Optional[SharedBlockRecords] = None,
 ) -> List[PreValidationResult]:
     """
     This method must be called under the blockchain lock
@@ -190,6 +203,72 @@ async def pre_validate_blocks_multiprocessing(
         npc_results
         get_block_generator
     """
+    _, results = await start_pre_validate_blocks(
+        constants,
+        constants_json,
+        block_records,
+        blocks,
+        pool,
+        check_filter,
+        npc_results,
+        get_block_generator,
+        batch_size,
+        wp_summaries,
+        validate_signatures=validate_signatures,
+        shared_records=shared_records,
+    )
+    return await results
+
+
+def _completed(results: List[PreValidationResult]) -> "asyncio.Future[List[PreValidationResult]]":
+    future: "asyncio.Future[List[PreValidationResult]]" = asyncio.get_running_loop().create_future()
+    future.set_result(results)
+    return future
+
+
+async def _collect_results(futures: List["asyncio.Future[List[bytes]]"]) -> List[PreValidationResult]:
+    # Collect all results into one flat list
+    return [
+        PreValidationResult.from_bytes(result)
+        for batch_result in (await asyncio.gather(*futures))
+        for result in batch_result
+    ]
+
+
+async def start_pre_validate_blocks(
+    constants: ConsensusConstants,
+    constants_json: Dict,
+    block_records: BlockchainInterface,
+    blocks: Sequence[FullBlock],
+    pool: Executor,
+    check_filter: bool,
+    npc_results: Dict[uint32, NPCResult],
+    get_block_generator: Callable[[BlockInfo, Optional[Dict[bytes32, FullBlock]]], Awaitable[Optional[BlockGenerator]]],
+    batch_size: int,
+    wp_summaries: Optional[List[SubEpochSummary]] = None,
+    *,
+    validate_signatures: bool = True,
+    block_bytes: Optional[Sequence[bytes]] = None,
+    shared_records: Optional[SharedBlockRecords] = None,
+    header_digests: Optional[Sequence[Optional[bytes32]]] = None,
+) -> Tuple[List[BlockRecord], "asyncio.Future[List[PreValidationResult]]"]:
+    """
+    Like pre_validate_blocks_multiprocessing(), but returns as soon as the
+    blocks have been submitted to the pool, without waiting for the workers.
+    Everything that reads block_records and the database is done by the time
+    this returns, so the chain may be modified while the future is pending.
+
+    block_bytes may be the serialized blocks, as received from the network,
+    to send them to the workers without serializing them again. With
+    shared_records, the recent block records are passed to the workers
+    through shared memory, rather than pickled for every batch.
+    header_digests may be the digests (see get_header_digest()) of the
+    headers of the blocks that were already validated, in a headers first
+    sync. Those headers aren't validated again.
+
+    Returns the block records computed for the blocks (empty if pre-validation
+    failed early) and a future for the pre-validation results.
+    """
     prev_b: Optional[BlockRecord] = None
     # Collects all the recent blocks (up to the previous sub-epoch)
     recent_blocks: Dict[bytes32, BlockRecord] = {}
@@ -198,7 +277,7 @@ async def pre_validate_blocks_multiprocessing(
     num_blocks_seen = 0
     if blocks[0].height > 0:
         if not block_records.contains_block(blocks[0].prev_header_hash):
-            return [PreValidationResult(uint16(Err.INVALID_PREV_BLOCK_HASH.value), None, None, False)]
+            return [], _completed([PreValidationResult(uint16(Err.INVALID_PREV_BLOCK_HASH.value), None, None, False)])
         curr = block_records.block_record(blocks[0].prev_header_hash)
         num_sub_slots_to_look_for = 3 if curr.overflow else 2
         while (
@@ -223,6 +302,7 @@ async def pre_validate_blocks_multiprocessing(
         block_record_was_present.append(block_records.contains_block(block.header_hash))
 
     diff_ssis: List[Tuple[uint64, uint64]] = []
+    block_recs: List[BlockRecord] = []
     for block in blocks:
         if block.height != 0:
             assert block_records.contains_block(block.prev_header_hash)
@@ -246,7 +326,7 @@ async def pre_validate_blocks_multiprocessing(
             for i, block_i in enumerate(blocks):
                 if not block_record_was_present[i] and block_records.contains_block(block_i.header_hash):
                     block_records.remove_block_record(block_i.header_hash)
-            return [PreValidationResult(uint16(Err.INVALID_POSPACE.value), None, None, False)]
+            return [], _completed([PreValidationResult(uint16(Err.INVALID_POSPACE.value), None, None, False)])
 
         required_iters: uint64 = calculate_iterations_quality(
             constants.DIFFICULTY_CONSTANT_FACTOR,
@@ -265,14 +345,16 @@ async def pre_validate_blocks_multiprocessing(
                 None,
             )
         except ValueError:
-            return [PreValidationResult(uint16(Err.INVALID_SUB_EPOCH_SUMMARY.value), None, None, False)]
+            return [], _completed([PreValidationResult(uint16(Err.INVALID_SUB_EPOCH_SUMMARY.value), None, None, False)])
 
         if block_rec.sub_epoch_summary_included is not None and wp_summaries is not None:
             idx = int(block.height / constants.SUB_EPOCH_BLOCKS) - 1
             next_ses = wp_summaries[idx]
             if not block_rec.sub_epoch_summary_included.get_hash() == next_ses.get_hash():
                 log.error("sub_epoch_summary does not match wp sub_epoch_summary list")
-                return [PreValidationResult(uint16(Err.INVALID_SUB_EPOCH_SUMMARY.value), None, None, False)]
+                return [], _completed(
+                    [PreValidationResult(uint16(Err.INVALID_SUB_EPOCH_SUMMARY.value), None, None, False)]
+                )
         # Makes sure to not override the valid blocks already in block_records
         if not block_records.contains_block(block_rec.header_hash):
             block_records.add_block_record(block_rec)  # Temporarily add block to dict
@@ -282,6 +364,7 @@ async def pre_validate_blocks_multiprocessing(
             recent_blocks[block_rec.header_hash] = block_records.block_record(block_rec.header_hash)
             recent_blocks_compressed[block_rec.header_hash] = block_records.block_record(block_rec.header_hash)
         prev_b = block_rec
+        block_recs.append(block_rec)
         diff_ssis.append((difficulty, sub_slot_iters))
 
     block_dict: Dict[bytes32, FullBlock] = {}
@@ -290,23 +373,41 @@ async def pre_validate_blocks_multiprocessing(
         if not block_record_was_present[i]:
             block_records.remove_block_record(block.header_hash)
 
-    recent_sb_compressed_pickled = {bytes(k): bytes(v) for k, v in recent_blocks_compressed.items()}
+    recent_sb_pickled: Optional[Dict[bytes, bytes]] = None
+    recent_sb_compressed_pickled: Dict[bytes, bytes] = {}
+    recent_refs: Optional[BlockRecordRefs] = None
+    recent_compressed_refs: Optional[BlockRecordRefs] = None
+    if shared_records is not None:
+        # recent_blocks_compressed is a subset of recent_blocks
+        recent_refs = shared_records.refs(recent_blocks.values())
+        if recent_refs is not None:
+            location = dict(zip(recent_blocks.keys(), recent_refs[1]))
+            recent_compressed_refs = (recent_refs[0], [location[h] for h in recent_blocks_compressed.keys()])
+    if recent_refs is None:
+        recent_sb_compressed_pickled = {bytes(k): bytes(v) for k, v in recent_blocks_compressed.items()}
     npc_results_pickled = {}
     for k, v in npc_results.items():
         npc_results_pickled[k] = bytes(v)
-    futures = []
+    futures: List["asyncio.Future[List[bytes]]"] = []
     # Pool of workers to validate blocks concurrently
     for i in range(0, len(blocks), batch_size):
         end_i = min(i + batch_size, len(blocks))
         blocks_to_validate = blocks[i:end_i]
+        final_pickled: Dict[bytes, bytes] = {}
         if any([len(block.finished_sub_slots) > 0 for block in blocks_to_validate]):
-            final_pickled = {bytes(k): bytes(v) for k, v in recent_blocks.items()}
+            final_refs = recent_refs
+            if final_refs is None:
+                if recent_sb_pickled is None:
+                    recent_sb_pickled = {bytes(k): bytes(v) for k, v in recent_blocks.items()}
+                final_pickled = recent_sb_pickled
         else:
-            final_pickled = recent_sb_compressed_pickled
+            final_refs = recent_compressed_refs
+            if final_refs is None:
+                final_pickled = recent_sb_compressed_pickled
         b_pickled: Optional[List[bytes]] = None
         hb_pickled: Optional[List[bytes]] = None
         previous_generators: List[Optional[bytes]] = []
-        for block in blocks_to_validate:
+        for j, block in enumerate(blocks_to_validate, i):
             # We ONLY add blocks which are in the past, based on header hashes (which are validated later) to the
             # prev blocks dict. This is important since these blocks are assumed to be valid and are used as previous
             # generator references
@@ -321,15 +422,19 @@ async def pre_validate_blocks_multiprocessing(
                 assert get_block_generator is not None
                 if b_pickled is None:
                     b_pickled = []
-                b_pickled.append(bytes(block))
+                b_pickled.append(bytes(block) if block_bytes is None else block_bytes[j])
                 try:
                     block_generator: Optional[BlockGenerator] = await get_block_generator(block, prev_blocks_dict)
                 except ValueError:
-                    return [
-                        PreValidationResult(
-                            uint16(Err.FAILED_GETTING_GENERATOR_MULTIPROCESSING.value), None, None, False
-                        )
-                    ]
+                    for future in futures:
+                        future.cancel()
+                    return [], _completed(
+                        [
+                            PreValidationResult(
+                                uint16(Err.FAILED_GETTING_GENERATOR_MULTIPROCESSING.value), None, None, False
+                            )
+                        ]
+                    )
                 if block_generator is not None:
                     previous_generators.append(bytes(block_generator))
                 else:
@@ -348,19 +453,26 @@ async def pre_validate_blocks_multiprocessing(
                 b_pickled,
                 hb_pickled,
                 previous_generators,
-                npc_results_pickled,
+                # the workers only look up the results for their own blocks
+                {
+                    b.height: npc_results_pickled[b.height]
+                    for b in blocks_to_validate
+                    if b.height in npc_results_pickled
+                },
                 check_filter,
                 [diff_ssis[j][0] for j in range(i, end_i)],
                 [diff_ssis[j][1] for j in range(i, end_i)],
                 validate_signatures,
+                final_refs,
+                None
+                if header_digests is None
+                else [
+                    None if header_digests[j] is None else (header_digests[j], block_recs[j].required_iters)
+                    for j in range(i, end_i)
+                ],
             )
         )
-    # Collect all results into one flat list
-    return [
-        PreValidationResult.from_bytes(result)
-        for batch_result in (await asyncio.gather(*futures))
-        for result in batch_result
-    ]
+    return block_recs, asyncio.ensure_future(_collect_results(futures))
 
 
 def _run_generator(
@@ -0,0 +1,150 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from chia.consensus.block_record import BlockRecord
+from chia.types.blockchain_format.sized_bytes import bytes32
+
+try:
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:  # python 3.7
+    SharedMemory = None  # type: ignore[assignment,misc]
+
+log = logging.getLogger(__name__)
+
+# the default size of a shared memory segment. A BlockRecord is a few hundred
+# bytes, so this holds the records of tens of thousands of blocks
+DEFAULT_SEGMENT_SIZE = 32 * 1024 * 1024
+
+# the name of a shared memory segment, and the (offset, length) of each of the
+# serialized block records to load from it
+BlockRecordRefs = Tuple[str, List[Tuple[int, int]]]
+
+
+class SharedBlockRecords:
+    """
+    Serialized block records, in a shared memory segment that the
+    pre-validation workers read from. Instead of pickling the recent block
+    records for every batch of blocks, only their offsets in the segment are
+    sent, and each record is written once. Workers parse each record once too,
+    see load_block_records().
+
+    The header hash doesn't cover everything in a block record, so a record
+    is only reused if it's equal to the one already written for its header
+    hash. Usually it's the very same object, from the blockchain's cache. The
+    segment is append only. When it fills up, a new one is created, and the
+    one before the previous one is released (batches may still be reading
+    the previous one).
+    """
+
+    segment_size: int
+    _segment: "SharedMemory"
+    _previous: Optional["SharedMemory"]
+    # header hash -> the record written last for it, and its location
+    _offsets: Dict[bytes32, Tuple[BlockRecord, Tuple[int, int]]]
+    _used: int
+
+    def __init__(self, segment_size: int) -> None:
+        self.segment_size = segment_size
+        self._previous = None
+        self._segment = SharedMemory(create=True, size=segment_size)
+        self._offsets = {}
+        self._used = 0
+
+    @classmethod
+    def create(cls, segment_size: int = DEFAULT_SEGMENT_SIZE) -> Optional["SharedBlockRecords"]:
+        """
+        Returns None if shared memory isn't available on this platform, in
+        which case the records are pickled to the workers
+        """
+        if SharedMemory is None:
+            return None
+        try:
+            return cls(segment_size)
+        except OSError as e:
+            log.warning(f"failed to create shared memory for block records, falling back to pickling: {e}")
+            return None
+
+    def _new_segment(self) -> None:
+        if self._previous is not None:
+            self._previous.close()
+            self._previous.unlink()
+        self._previous = self._segment
+        self._segment = SharedMemory(create=True, size=self.segment_size)
+        self._offsets = {}
+        self._used = 0
+
+    def _write(self, block_record: BlockRecord) -> Optional[Tuple[int, int]]:
+        data = bytes(block_record)
+        if self._used + len(data) > self.segment_size:
+            return None
+        offset = self._used
+        self._segment.buf[offset : offset + len(data)] = data
+        self._used += len(data)
+        self._offsets[block_record.header_hash] = (block_record, (offset, len(data)))
+        return offset, len(data)
+
+    def refs(self, block_records: Iterable[BlockRecord]) -> Optional[BlockRecordRefs]:
+        """
+        Writes the records that aren't in the segment yet, and returns where
+        to find all of them. Returns None if they don't fit in a segment
+        """
+        block_records = list(block_records)
+        for attempt in range(2):
+            locations: List[Tuple[int, int]] = []
+            for block_record in block_records:
+                location: Optional[Tuple[int, int]] = None
+                written = self._offsets.get(block_record.header_hash)
+                if written is not None and (written[0] is block_record or written[0] == block_record):
+                    location = written[1]
+                    # so the next lookup for this record is an identity check
+                    self._offsets[block_record.header_hash] = (block_record, location)
+                else:
+                    location = self._write(block_record)
+                    if location is None:
+                        break
+                locations.append(location)
+            else:
+                return self._segment.name, locations
+            if attempt == 0:
+                self._new_segment()
+        return None
+
+    def close(self) -> None:
+        for segment in [self._previous, self._segment]:
+            if segment is not None:
+                segment.close()
+                segment.unlink()
+        self._previous = None
+
+
+# the segments this (worker) process has attached to, and the records it has
+# parsed from them, by segment name and offset
+_attached: Dict[str, "SharedMemory"] = {}
+_parsed: Dict[Tuple[str, int], BlockRecord] = {}
+
+
+def load_block_records(refs: BlockRecordRefs) -> Dict[bytes32, BlockRecord]:
+    """
+    Called in the pre-validation workers, to get the block records written by
+    SharedBlockRecords.refs()
+    """
+    name, locations = refs
+    segment = _attached.get(name)
+    if segment is None:
+        # the main process only writes to its two latest segments, so once
+        # we see a new one, the records in the others are no longer needed
+        for old_name in list(_attached.keys()):
+            _attached.pop(old_name).close()
+        for key in [k for k in _parsed.keys() if k[0] != name]:
+            del _parsed[key]
+        segment = SharedMemory(name=name)
+        _attached[name] = segment
+
+    block_records: Dict[bytes32, BlockRecord] = {}
+    for offset, length in locations:
+        block_record = _parsed.get((name, offset))
+        if block_record is None:
+            block_record = BlockRecord.from_bytes(bytes(segment.buf[offset : offset + length]))
+            _parsed[(name, offset)] = block_record
+        block_records[block_record.header_hash] = block_record
+    return block_records
@@ -0,0 +1,126 @@
+import mmap
+import os
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from chia.util.path import mkdir
+
+# segment files are rolled over once they reach this size
+DEFAULT_SEGMENT_SIZE = 128 * 1024 * 1024
+
+
+class BlockArchive:
+    """
+    An append-only store of (compressed) blocks in flat segment files. Blocks
+    are only ever appended, a block is located by its segment file number,
+    offset and length. Keeping track of those locations is up to the caller
+    (the BlockStore keeps them in the block_archive table).
+
+    Segments are read through read-only memory maps, so reading a block
+    returns a view into the page cache rather than a copy.
+
+    Appended blocks aren't durable until sync() is called, which must happen
+    before their locations are committed.
+    """
+
+    directory: Path
+    segment_size: int
+    _write_file: Optional[BinaryIO]
+    _write_file_no: int
+    _write_offset: int
+    _unsynced: bool
+    _maps: Dict[int, mmap.mmap]
+    # maps replaced by larger ones, that still had views into them
+    _retired_maps: List[mmap.mmap]
+
+    def __init__(self, directory: Path, segment_size: int = DEFAULT_SEGMENT_SIZE):
+        self.directory = directory
+        self.segment_size = segment_size
+        self._write_file = None
+        self._write_file_no = 0
+        self._write_offset = 0
+        self._unsynced = False
+        self._maps = {}
+        self._retired_maps = []
+        mkdir(directory)
+
+        # resume appending to the last segment
+        while self.segment_path(self._write_file_no + 1).exists():
+            self._write_file_no += 1
+
+    def segment_path(self, file_no: int) -> Path:
+        return self.directory / f"blocks{file_no:05d}.dat"
+
+    def _open_segment(self) -> BinaryIO:
+        if self._write_file is None:
+            self._write_file = open(self.segment_path(self._write_file_no), "ab")
+            self._write_offset = self._write_file.tell()
+        return self._write_file
+
+    def append(self, blob: bytes) -> Tuple[int, int]:
+        """
+        Appends the blob to the current segment and returns its (file_no, offset)
+        """
+        f = self._open_segment()
+        if self._write_offset > 0 and self._write_offset + len(blob) > self.segment_size:
+            self._close_segment()
+            self._write_file_no += 1
+            f = self._open_segment()
+
+        location = (self._write_file_no, self._write_offset)
+        f.write(blob)
+        # make the block visible to the memory maps before the DB transaction
+        # referencing it is committed
+        f.flush()
+        self._write_offset += len(blob)
+        self._unsynced = True
+        return location
+
+    def sync(self) -> None:
+        """
+        Flushes the blocks appended since the last sync to disk
+        """
+        if self._write_file is not None and self._unsynced:
+            os.fsync(self._write_file.fileno())
+        self._unsynced = False
+
+    def read(self, file_no: int, offset: int, length: int) -> memoryview:
+        m = self._maps.get(file_no)
+        if m is None or len(m) < offset + length:
+            # the segment has grown since we mapped it
+            with open(self.segment_path(file_no), "rb") as f:
+                new_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(new_map) < offset + length:
+                new_map.close()
+                raise ValueError(f"block at {file_no}:{offset} extends past the end of the block archive")
+            if m is not None:
+                self._retired_maps.append(m)
+            self._maps[file_no] = new_map
+            m = new_map
+            self._close_retired_maps()
+        return memoryview(m)[offset : offset + length]
+
+    def _close_retired_maps(self) -> None:
+        still_used = []
+        for m in self._retired_maps:
+            try:
+                m.close()
+            except BufferError:
+                # there are still views into this map, it's closed once
+                # they've been released
+                still_used.append(m)
+        self._retired_maps = still_used
+
+    def _close_segment(self) -> None:
+        if self._write_file is not None:
+            self._write_file.flush()
+            os.fsync(self._write_file.fileno())
+            self._write_file.close()
+            self._write_file = None
+        self._unsynced = False
+
+    def close(self) -> None:
+        self._close_segment()
+        self._retired_maps.extend(self._maps.values())
+        self._maps = {}
+        self._close_retired_maps()
@@ -0,0 +1,352 @@
+import asyncio
+import heapq
+import io
+import logging
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from chia.protocols.full_node_protocol import RequestBlocks
+from chia.protocols.protocol_message_types import ProtocolMessageTypes
+from chia.protocols.wallet_protocol import RequestHeaderBlocks, RespondHeaderBlocks
+from chia.server.ws_connection import WSChiaConnection
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.full_block import FullBlock
+from chia.types.header_block import HeaderBlock
+from chia.util.ints import uint32
+
+log = logging.getLogger(__name__)
+
+# the weight of a new measurement in the moving averages of PeerSyncStats
+STATS_ALPHA = 0.3
+
+# a batch of downloaded blocks: the peer it came from, the blocks, and the
+# blocks as they were serialized in the response
+BlockBatch = Tuple[WSChiaConnection, List[FullBlock], List[bytes]]
+
+# a batch of downloaded header blocks, see HeaderBlockDownloader
+HeaderBatch = Tuple[WSChiaConnection, List[HeaderBlock], List[bytes]]
+
+
+def parse_respond_blocks(data: bytes) -> Tuple[uint32, uint32, List[FullBlock], List[bytes]]:
+    """
+    Parses a serialized RespondBlocks message, like RespondBlocks.from_bytes(),
+    but also returns the serialized blocks, sliced from the message, so they
+    don't need to be serialized again to send them to the pre-validation
+    workers
+    """
+    f = io.BytesIO(data)
+    start_height = uint32.parse(f)
+    end_height = uint32.parse(f)
+    num_blocks = uint32.parse(f)
+    blocks: List[FullBlock] = []
+    block_bytes: List[bytes] = []
+    for _ in range(num_blocks):
+        offset = f.tell()
+        blocks.append(FullBlock.parse(f))
+        block_bytes.append(data[offset : f.tell()])
+    if f.read() != b"":
+        raise ValueError("unexpected data after RespondBlocks")
+    return start_height, end_height, blocks, block_bytes
+
+
+class ValidatedHeaders:
+    """
+    The header hashes and header digests (see get_header_digest()) of the
+    blocks whose headers were validated in the first phase of a headers first
+    sync, by height. They are packed in bytearrays, since there is one of each
+    for every block we sync.
+    """
+
+    start_height: Optional[int]
+    _header_hashes: bytearray
+    _digests: bytearray
+
+    def __init__(self) -> None:
+        self.start_height = None
+        self._header_hashes = bytearray()
+        self._digests = bytearray()
+
+    def __len__(self) -> int:
+        return len(self._header_hashes) // 32
+
+    @property
+    def end_height(self) -> Optional[int]:
+        if self.start_height is None:
+            return None
+        return self.start_height + len(self) - 1
+
+    def append(self, height: int, header_hash: bytes32, digest: bytes32) -> None:
+        if self.start_height is None:
+            self.start_height = height
+        assert height == self.start_height + len(self)
+        self._header_hashes += header_hash
+        self._digests += digest
+
+    def _index(self, height: int) -> Optional[int]:
+        if self.start_height is None or not self.start_height <= height < self.start_height + len(self):
+            return None
+        return (height - self.start_height) * 32
+
+    def header_hash(self, height: int) -> Optional[bytes32]:
+        index = self._index(height)
+        if index is None:
+            return None
+        return bytes32(self._header_hashes[index : index + 32])
+
+    def digest(self, height: int) -> Optional[bytes32]:
+        index = self._index(height)
+        if index is None:
+            return None
+        return bytes32(self._digests[index : index + 32])
+
+
+class PeerSyncStats:
+    """
+    Measurements of how fast a peer serves block requests during sync. The
+    latency is the time a request takes to complete, and the throughput is
+    the bytes we received from the peer during the request, divided by that
+    time. Both are exponential moving averages.
+    """
+
+    latency: Optional[float]
+    bytes_per_second: Optional[float]
+    requests: int
+    failures: int
+
+    def __init__(self) -> None:
+        self.latency = None
+        self.bytes_per_second = None
+        self.requests = 0
+        self.failures = 0
+
+    def record(self, num_bytes: int, duration: float) -> None:
+        self.requests += 1
+        duration = max(duration, 0.001)
+        rate = num_bytes / duration
+        if self.latency is None or self.bytes_per_second is None:
+            self.latency = duration
+            self.bytes_per_second = rate
+        else:
+            self.latency += STATS_ALPHA * (duration - self.latency)
+            self.bytes_per_second += STATS_ALPHA * (rate - self.bytes_per_second)
+
+    def record_failure(self) -> None:
+        self.requests += 1
+        self.failures += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "latency": self.latency,
+            "bytes_per_second": self.bytes_per_second,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+def select_peer(candidates: List[WSChiaConnection], peer_stats: Dict[bytes32, PeerSyncStats]) -> WSChiaConnection:
+    """
+    Picks one of the candidates at random, weighted by their throughput, so
+    that fast peers get most of the requests. Peers we haven't measured yet
+    get the weight of the fastest peer, so they get a chance to prove
+    themselves. Every failed request halves a peer's weight.
+    """
+    rates = [peer_stats[c.peer_node_id].bytes_per_second for c in candidates if c.peer_node_id in peer_stats]
+    best = max([r for r in rates if r is not None], default=1.0)
+    weights: List[float] = []
+    for c in candidates:
+        stats = peer_stats.get(c.peer_node_id)
+        if stats is None or stats.bytes_per_second is None:
+            weight = best
+        else:
+            weight = stats.bytes_per_second
+        if stats is not None:
+            weight /= 2 ** min(stats.failures, 30)
+        weights.append(max(weight, 1e-9))
+    return random.choices(candidates, weights=weights)[0]
+
+
+class BlockDownloader:
+    """
+    Downloads the blocks from start_height to end_height (inclusive) from all
+    the peers returned by get_peers(). The heights are split into ranges of
+    batch_size blocks, and up to max_in_flight ranges are requested
+    concurrently, at most one per peer. Downloaded ranges are buffered until
+    all the ranges below them have been downloaded too, so run() delivers the
+    blocks in height order, along with their serialized form. The number of buffered and outstanding ranges
+    together is bounded by max_in_flight.
+
+    A range that fails to download is retried on another peer. Peers that
+    don't respond are closed and removed from the list returned by
+    get_peers(), like before downloads were parallel. Once every remaining
+    peer has failed a range, run() raises an exception.
+
+    Every request is measured in peer_stats, which is used to pick the peer
+    to send the next range to, see select_peer(). The lowest pending range
+    is always assigned first, so the ranges validation is waiting for tend
+    to go to the fastest peers.
+
+    With validated_headers, blocks that don't match the headers validated in
+    a headers first sync are rejected, and requested from another peer.
+    """
+
+    def __init__(
+        self,
+        start_height: int,
+        end_height: int,
+        batch_size: int,
+        get_peers: Callable[[], List[WSChiaConnection]],
+        max_in_flight: int,
+        peer_stats: Optional[Dict[bytes32, PeerSyncStats]] = None,
+        timeout: int = 30,
+        validated_headers: Optional[ValidatedHeaders] = None,
+    ) -> None:
+        self.start_height = start_height
+        self.end_height = end_height
+        self.batch_size = batch_size
+        self.get_peers = get_peers
+        self.max_in_flight = max(max_in_flight, 1)
+        self.peer_stats = peer_stats if peer_stats is not None else {}
+        self.timeout = timeout
+        self.validated_headers = validated_headers
+
+    async def run(self, batch_queue: "asyncio.Queue[Any]") -> None:
+        """
+        Puts the downloaded batches of blocks, and the peer they were
+        downloaded from, in batch_queue, in height order
+        """
+        # the (start, end) heights of the ranges that haven't been requested
+        # yet, or need to be requested again. Lowest heights first
+        pending: List[Tuple[int, int]] = [
+            (start, min(start + self.batch_size - 1, self.end_height))
+            for start in range(self.start_height, self.end_height + 1, self.batch_size)
+        ]
+        # start height -> peers that failed to download that range
+        failed: Dict[int, Set[bytes32]] = {}
+        # task -> start and end heights, peer, and the time and peer.bytes_read
+        # when the request was sent
+        in_flight: Dict["asyncio.Task[Any]", Tuple[int, int, WSChiaConnection, float, int]] = {}
+        # start height -> downloaded range, waiting for the ranges below it
+        downloaded: Dict[int, Tuple[WSChiaConnection, List[Any], List[bytes]]] = {}
+        next_height = self.start_height
+
+        try:
+            while next_height <= self.end_height:
+                while next_height in downloaded:
+                    batch = downloaded.pop(next_height)
+                    await batch_queue.put(batch)
+                    next_height = batch[1][-1].height + 1
+                if next_height > self.end_height:
+                    break
+
+                busy = set(req[2] for req in in_flight.values())
+                while len(pending) > 0 and len(in_flight) + len(downloaded) < self.max_in_flight:
+                    start, end = pending[0]
+                    idle_peer = self._pick_peer(busy, failed.get(start, set()))
+                    if idle_peer is None:
+                        break
+                    heapq.heappop(pending)
+                    busy.add(idle_peer)
+                    task = asyncio.create_task(self._send_request(idle_peer, start, end))
+                    in_flight[task] = (start, end, idle_peer, time.monotonic(), idle_peer.bytes_read)
+
+                if len(in_flight) == 0:
+                    start, end = pending[0]
+                    raise RuntimeError(f"failed fetching {start} to {end} from peers")
+
+                done, _ = await asyncio.wait(in_flight.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    start, end, peer, request_time, bytes_read = in_flight.pop(task)
+                    fetched = await self._get_blocks(task, peer, start, end)
+                    stats = self.peer_stats.setdefault(peer.peer_node_id, PeerSyncStats())
+                    if fetched is None:
+                        stats.record_failure()
+                        failed.setdefault(start, set()).add(peer.peer_node_id)
+                        heapq.heappush(pending, (start, end))
+                    else:
+                        stats.record(max(peer.bytes_read - bytes_read, 0), time.monotonic() - request_time)
+                        downloaded[start] = (peer, fetched[0], fetched[1])
+        finally:
+            for task in in_flight.keys():
+                task.cancel()
+
+    def _pick_peer(self, busy: Set[WSChiaConnection], failed: Set[bytes32]) -> Optional[WSChiaConnection]:
+        peers = self.get_peers()
+        candidates: List[WSChiaConnection] = []
+        for peer in peers.copy():
+            if peer.closed:
+                peers.remove(peer)
+                continue
+            if peer not in busy and peer.peer_node_id not in failed:
+                candidates.append(peer)
+        if len(candidates) == 0:
+            return None
+        return select_peer(candidates, self.peer_stats)
+
+    async def _send_request(self, peer: WSChiaConnection, start: int, end: int) -> Any:
+        request = RequestBlocks(uint32(start), uint32(end), True)
+        return await peer.request_blocks(request, timeout=self.timeout, parse_response=False)
+
+    async def _get_response(self, task: "asyncio.Task[Any]", peer: WSChiaConnection, start: int, end: int) -> Any:
+        try:
+            response = task.result()
+        except Exception as e:
+            log.warning(f"failed fetching {start} to {end} from {peer.peer_host}: {e}")
+            return None
+        if response is None:
+            log.info(f"peer {peer.peer_host} did not respond to request for {start} to {end}, closing connection")
+            await peer.close()
+            peers = self.get_peers()
+            if peer in peers:
+                peers.remove(peer)
+        return response
+
+    async def _get_blocks(
+        self, task: "asyncio.Task[Any]", peer: WSChiaConnection, start: int, end: int
+    ) -> Optional[Tuple[List[Any], List[bytes]]]:
+        response = await self._get_response(task, peer, start, end)
+        if response is None:
+            return None
+        if response.type != ProtocolMessageTypes.respond_blocks.value:
+            log.info(f"peer {peer.peer_host} rejected request for {start} to {end}")
+            return None
+        try:
+            _, _, blocks, block_bytes = parse_respond_blocks(response.data)
+        except Exception as e:
+            log.warning(f"peer {peer.peer_host} responded with invalid blocks for {start} to {end}: {e}")
+            return None
+        if len(blocks) != end - start + 1 or any(b.height != start + i for i, b in enumerate(blocks)):
+            log.warning(f"peer {peer.peer_host} responded with the wrong blocks for {start} to {end}")
+            return None
+        if self.validated_headers is not None and any(
+            self.validated_headers.header_hash(b.height) != b.header_hash for b in blocks
+        ):
+            log.warning(f"peer {peer.peer_host} responded with blocks that don't match the validated headers")
+            return None
+        return blocks, block_bytes
+
+
+class HeaderBlockDownloader(BlockDownloader):
+    """
+    Downloads the header blocks from start_height to end_height, for the first
+    phase of a headers first sync, like BlockDownloader does for full blocks.
+    The batches have no serialized blocks.
+    """
+
+    async def _send_request(self, peer: WSChiaConnection, start: int, end: int) -> Any:
+        return await peer.request_header_blocks(RequestHeaderBlocks(uint32(start), uint32(end)), timeout=self.timeout)
+
+    async def _get_blocks(
+        self, task: "asyncio.Task[Any]", peer: WSChiaConnection, start: int, end: int
+    ) -> Optional[Tuple[List[Any], List[bytes]]]:
+        response = await self._get_response(task, peer, start, end)
+        if response is None:
+            return None
+        if not isinstance(response, RespondHeaderBlocks):
+            log.info(f"peer {peer.peer_host} rejected request for headers {start} to {end}")
+            return None
+        header_blocks = response.header_blocks
+        if len(header_blocks) != end - start + 1 or any(b.height != start + i for i, b in enumerate(header_blocks)):
+            log.warning(f"peer {peer.peer_host} responded with the wrong headers for {start} to {end}")
+            return None
+        return header_blocks, []
@@ -1,17 +1,29 @@
+import hashlib
 import logging
-from typing import Dict, List, Optional, Tuple
-from chia.util.ints import uint32
+import mmap
+import os
+import tempfile
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+from chia.util.ints import uint8, uint32, uint64
 from chia.types.blockchain_format.sized_bytes import bytes32
 from chia.types.blockchain_format.sub_epoch_summary import SubEpochSummary
 from pathlib import Path
 import aiofiles
 from dataclasses import dataclass
+from filelock import BaseFileLock, FileLock, Timeout
 from chia.util.streamable import Streamable, streamable
 from chia.util.files import write_file_async
 from chia.util.db_wrapper import DBWrapper2
 
 log = logging.getLogger(__name__)
 
+# when the memory mapped height-to-hash file needs to grow, make room for this
+# many more block hashes, to not have to remap it for every new block
+GROW_HEIGHTS = 10000
+
+# bumped whenever the format of the height-to-hash file changes
+HEIGHT_TO_HASH_VERSION = 1
+
 
 @streamable
 @dataclass(frozen=True)
@@ -19,6 +31,20 @@ class SesCache(Streamable):
     content: List[Tuple[uint32, bytes]]
 
 
+# written next to the height-to-hash file every time it's flushed. The first
+# size bytes of the file are trusted. Everything before tail_start was already
+# trusted by a previous stamp, the checksum covers the rest, which was just
+# flushed. Before the trusted part of the file is modified in place, the stamp
+# is replaced by one that no longer covers it
+@streamable
+@dataclass(frozen=True)
+class HeightToHashStamp(Streamable):
+    version: uint8
+    size: uint64
+    tail_start: uint64
+    tail_checksum: bytes32
+
+
 class BlockHeightMap:
     db: DBWrapper2
 
@@ -28,8 +54,25 @@ class BlockHeightMap:
     # Defines the path from genesis to the peak, no orphan blocks
     # this buffer contains all block hashes that are part of the current peak
     # ordered by height. i.e. __height_to_hash[0..32] is the genesis hash
-    # __height_to_hash[32..64] is the hash for height 1 and so on
-    __height_to_hash: bytearray
+    # __height_to_hash[32..64] is the hash for height 1 and so on. Only the
+    # first __size bytes are in use, the buffer may be larger.
+    # Normally this is a memory map of the height-to-hash file, so updates are
+    # written to the file in place. If another instance has the file open, we
+    # fall back to keeping our own copy in memory, and don't write the file
+    __height_to_hash: Union[mmap.mmap, bytearray]
+    __size: int
+
+    # the height-to-hash file backing the memory map, and the lock we hold on
+    # it. These are None when using the in-memory fallback
+    __height_to_hash_file: Optional[BinaryIO]
+    __height_to_hash_lock: Optional[BaseFileLock]
+
+    # the offset of the first byte of __height_to_hash that was modified since
+    # the memory map was last flushed to disk
+    __dirty_start: int
+
+    # the size of the height-to-hash file covered by its current stamp
+    __stamped_size: int
 
     # All sub-epoch summaries that have been included in the blockchain from the beginning until and including the peak
     # (height_included, SubEpochSummary). Note: ONLY for the blocks in the path to the peak
@@ -43,6 +86,9 @@ class BlockHeightMap:
     # the file we're saving the height-to-hash cache to
     __height_to_hash_filename: Path
 
+    # the file we're saving the HeightToHashStamp of the height-to-hash file to
+    __stamp_filename: Path
+
     # the file we're saving the sub epoch summary cache to
     __ses_filename: Path
 
@@ -53,10 +99,18 @@ class BlockHeightMap:
 
         self.__dirty = 0
         self.__height_to_hash = bytearray()
+        self.__size = 0
+        self.__height_to_hash_file = None
+        self.__height_to_hash_lock = None
+        self.__dirty_start = 0
+        self.__stamped_size = 0
         self.__sub_epoch_summaries = {}
         self.__height_to_hash_filename = blockchain_dir / "height-to-hash"
+        self.__stamp_filename = blockchain_dir / "height-to-hash.stamp"
         self.__ses_filename = blockchain_dir / "sub-epoch-summaries"
 
+        await self.__open_height_to_hash()
+
         async with self.db.read_db() as conn:
             if db.db_version == 2:
                 async with conn.execute("SELECT hash FROM current_peak WHERE key = 0") as cursor:
@@ -79,13 +133,6 @@ class BlockHeightMap:
                     if row is None:
                         return self
 
-        try:
-            async with aiofiles.open(self.__height_to_hash_filename, "rb") as f:
-                self.__height_to_hash = bytearray(await f.read())
-        except Exception:
-            # it's OK if this file doesn't exist, we can rebuild it
-            pass
-
         try:
             async with aiofiles.open(self.__ses_filename, "rb") as f:
                 self.__sub_epoch_summaries = {k: v for (k, v) in SesCache.from_bytes(await f.read()).content}
@@ -104,13 +151,8 @@ class BlockHeightMap:
         height = row[2]
 
         # allocate memory for height to hash map
-        # this may also truncate it, if thie file on disk had an invalid size
-        new_size = (height + 1) * 32
-        size = len(self.__height_to_hash)
-        if size > new_size:
-            del self.__height_to_hash[new_size:]
-        else:
-            self.__height_to_hash += bytearray([0] * (new_size - size))
+        # this may also shrink it, if the file on disk had an invalid size
+        self.__resize((height + 1) * 32)
 
         # if the peak hash is already in the height-to-hash map, we don't need
         # to load anything more from the DB
@@ -127,11 +169,166 @@ class BlockHeightMap:
 
         return self
 
+    async def __open_height_to_hash(self) -> None:
+        self.__height_to_hash_filename.parent.mkdir(parents=True, exist_ok=True)
+        lock = FileLock(str(self.__height_to_hash_filename) + ".lock")
+        try:
+            lock.acquire(timeout=0)
+        except Timeout:
+            log.warning(
+                f"{self.__height_to_hash_filename} is in use by another full node, keeping the height-to-hash map "
+                "in memory instead"
+            )
+            try:
+                async with aiofiles.open(self.__height_to_hash_filename, "rb") as f:
+                    self.__height_to_hash = bytearray(await f.read())
+            except Exception:
+                # it's OK if this file doesn't exist, we can rebuild it
+                pass
+            del self.__height_to_hash[self.__verified_size(self.__height_to_hash) :]
+            return
+
+        self.__height_to_hash_lock = lock
+        if not self.__height_to_hash_filename.exists():
+            self.__height_to_hash_filename.touch()
+        self.__height_to_hash_file = open(self.__height_to_hash_filename, "r+b")
+        # the size of the map is set once we know the height of the peak
+        self.__remap(self.__height_to_hash_filename.stat().st_size)
+        size = self.__verified_size(self.__height_to_hash)
+        if size < len(self.__height_to_hash):
+            # drop the part we can't trust
+            self.__remap(size)
+        self.__stamped_size = size
+        self.__dirty_start = size
+
+    def __verified_size(self, content: Union[mmap.mmap, bytearray]) -> int:
+        """
+        Returns how much of the height-to-hash file can be trusted, according
+        to its stamp. Anything past that may have been modified since the
+        file was last flushed, and has to be loaded from the DB
+        """
+        try:
+            with open(self.__stamp_filename, "rb") as f:
+                stamp = HeightToHashStamp.from_bytes(f.read())
+        except Exception:
+            log.info(f"{self.__stamp_filename} is missing or invalid, rebuilding the height-to-hash map")
+            return 0
+        if stamp.version != HEIGHT_TO_HASH_VERSION or stamp.size > len(content):
+            log.info(f"{self.__height_to_hash_filename} doesn't match its stamp, rebuilding the height-to-hash map")
+            return 0
+        if stamp.tail_start > stamp.size or (
+            self.__checksum(content, stamp.tail_start, stamp.size) != stamp.tail_checksum
+        ):
+            log.warning(
+                f"{self.__height_to_hash_filename} was modified since it was last flushed, "
+                "rebuilding the height-to-hash map"
+            )
+            return 0
+        return stamp.size
+
+    @staticmethod
+    def __checksum(content: Union[mmap.mmap, bytearray], start: int, end: int) -> bytes32:
+        with memoryview(content) as view:
+            with view[start:end] as data:
+                return bytes32(hashlib.sha256(data).digest())
+
+    def __write_stamp(self, size: int, tail_start: int) -> None:
+        # the stamp is replaced atomically, so it's either the previous or the
+        # new one after a crash
+        stamp = HeightToHashStamp(
+            uint8(HEIGHT_TO_HASH_VERSION),
+            uint64(size),
+            uint64(tail_start),
+            self.__checksum(self.__height_to_hash, tail_start, size),
+        )
+        with tempfile.NamedTemporaryFile(dir=self.__stamp_filename.parent, delete=False) as f:
+            f.write(bytes(stamp))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f.name, self.__stamp_filename)
+        self.__stamped_size = size
+
+    def __modify(self, offset: int) -> None:
+        """
+        Must be called before the height-to-hash map is modified (or
+        truncated) at offset
+        """
+        self.__dirty_start = min(self.__dirty_start, offset)
+        if offset < self.__stamped_size and isinstance(self.__height_to_hash, mmap.mmap):
+            # the file is about to change in a part the stamp vouches for
+            self.__write_stamp(offset, offset)
+
+    def __flush_height_to_hash(self) -> None:
+        if not isinstance(self.__height_to_hash, mmap.mmap):
+            return
+        if self.__dirty_start >= self.__size and self.__stamped_size == self.__size:
+            # nothing changed, the current stamp is still valid
+            return
+        # the memory map is the file, only the part we've modified needs to
+        # be written back to disk. The offset has to be page aligned
+        start = self.__dirty_start - self.__dirty_start % mmap.ALLOCATIONGRANULARITY
+        if start < self.__size:
+            self.__height_to_hash.flush(start, self.__size - start)
+        self.__dirty_start = self.__size
+        self.__write_stamp(self.__size, min(start, self.__size))
+
+    def close(self) -> None:
+        """
+        Flushes the height-to-hash map and releases the file backing it. The
+        map is kept in memory from then on
+        """
+        if not isinstance(self.__height_to_hash, mmap.mmap):
+            return
+        self.__flush_height_to_hash()
+        content = bytearray(self.__height_to_hash[: self.__size])
+        self.__height_to_hash.close()
+        self.__height_to_hash = content
+        assert self.__height_to_hash_file is not None
+        # drop the room left to grow into
+        self.__height_to_hash_file.truncate(self.__size)
+        self.__height_to_hash_file.close()
+        self.__height_to_hash_file = None
+        assert self.__height_to_hash_lock is not None
+        self.__height_to_hash_lock.release()
+        self.__height_to_hash_lock = None
+
+    def __remap(self, capacity: int) -> None:
+        f = self.__height_to_hash_file
+        assert f is not None
+        if isinstance(self.__height_to_hash, mmap.mmap):
+            self.__height_to_hash.close()
+        # not all platforms support resizing a memory map, and some can't
+        # resize a file while it's mapped, so we map it again instead
+        f.truncate(capacity)
+        if capacity < 32:
+            # a memory map can't be empty
+            capacity = 32
+            f.truncate(capacity)
+        self.__height_to_hash = mmap.mmap(f.fileno(), capacity)
+
+    def __resize(self, size: int) -> None:
+        if isinstance(self.__height_to_hash, bytearray):
+            if size < len(self.__height_to_hash):
+                del self.__height_to_hash[size:]
+            else:
+                self.__height_to_hash.extend(bytes(size - len(self.__height_to_hash)))
+        elif size > len(self.__height_to_hash):
+            self.__remap(size + GROW_HEIGHTS * 32)
+        elif size < self.__size:
+            # rollback, truncate the file
+            self.__modify(size)
+            self.__remap(size)
+        self.__size = size
+        self.__dirty_start = min(self.__dirty_start, size)
+
     def update_height(self, height: uint32, header_hash: bytes32, ses: Optional[SubEpochSummary]):
         # we're only updating the last hash. If we've reorged, we already rolled
         # back, making this the new peak
         idx = height * 32
-        assert idx <= len(self.__height_to_hash)
+        assert idx <= self.__size
+        if idx == self.__size:
+            self.__resize(idx + 32)
+        self.__modify(idx)
         self.__height_to_hash[idx : idx + 32] = header_hash
         if ses is not None:
             self.__sub_epoch_summaries[height] = bytes(ses)
@@ -140,14 +337,13 @@ class BlockHeightMap:
         if self.__dirty < 1000:
             return
 
-        assert (len(self.__height_to_hash) % 32) == 0
-        map_buf = self.__height_to_hash.copy()
+        assert (self.__size % 32) == 0
 
         ses_buf = bytes(SesCache([(k, v) for (k, v) in self.__sub_epoch_summaries.items()]))
 
         self.__dirty = 0
 
-        await write_file_async(self.__height_to_hash_filename, map_buf)
+        self.__flush_height_to_hash()
         await write_file_async(self.__ses_filename, ses_buf)
 
     # load height-to-hash map entries from the DB starting at height back in
@@ -183,6 +379,9 @@ class BlockHeightMap:
                         for r in await cursor.fetchall():
                             ordered[bytes32.fromhex(r[0])] = (r[2], bytes32.fromhex(r[1]), r[3])
 
+            # the heights of this window may be overwritten below. Doing this
+            # once per window saves updating the stamp for every height
+            self.__modify(window_end * 32)
             while height > window_end:
                 if prev_hash not in ordered:
                     raise ValueError(
@@ -210,16 +409,17 @@ class BlockHeightMap:
 
     def __set_hash(self, height: int, block_hash: bytes32):
         idx = height * 32
+        self.__modify(idx)
         self.__height_to_hash[idx : idx + 32] = block_hash
         self.__dirty += 1
 
     def get_hash(self, height: uint32) -> bytes32:
         idx = height * 32
-        assert idx + 32 <= len(self.__height_to_hash)
+        assert idx + 32 <= self.__size
         return bytes32(self.__height_to_hash[idx : idx + 32])
 
     def contains_height(self, height: uint32) -> bool:
-        return height * 32 < len(self.__height_to_hash)
+        return height * 32 < self.__size
 
     def rollback(self, fork_height: int):
         # fork height may be -1, in which case all blocks are different and we
@@ -230,7 +430,8 @@ class BlockHeightMap:
                 heights_to_delete.append(ses_included_height)
         for height in heights_to_delete:
             del self.__sub_epoch_summaries[height]
-        del self.__height_to_hash[(fork_height + 1) * 32 :]
+        if (fork_height + 1) * 32 < self.__size:
+            self.__resize((fork_height + 1) * 32)
 
     def get_ses(self, height: uint32) -> SubEpochSummary:
         return SubEpochSummary.from_bytes(self.__sub_epoch_summaries[height])
@@ -1,15 +1,17 @@
+import asyncio
 import logging
-from typing import Dict, List, Optional, Tuple, Any
-
-import zstd
+from typing import Dict, List, Optional, Tuple, Any, Union
 
 from chia.consensus.block_record import BlockRecord
+from chia.full_node.block_archive import BlockArchive
+from chia.full_node.full_block_cache import FullBlockCache
 from chia.types.blockchain_format.sized_bytes import bytes32
 from chia.types.full_block import FullBlock
 from chia.types.blockchain_format.program import SerializedProgram
 from chia.types.weight_proof import SubEpochChallengeSegment, SubEpochSegments
+from chia.util.block_compression import BlockCompressor, UnknownDictionaryError
 from chia.util.errors import Err
-from chia.util.db_wrapper import DBWrapper2
+from chia.util.db_wrapper import DBWrapper2, fetch_many
 from chia.util.ints import uint32
 from chia.util.lru_cache import LRUCache
 from chia.util.full_block_utils import generator_from_block
@@ -18,15 +20,24 @@ log = logging.getLogger(__name__)
 
 
 class BlockStore:
-    block_cache: LRUCache
+    block_cache: FullBlockCache
     db_wrapper: DBWrapper2
     ses_challenge_cache: LRUCache
+    compressor: BlockCompressor
+    archive: Optional[BlockArchive]
 
     @classmethod
-    async def create(cls, db_wrapper: DBWrapper2):
+    async def create(
+        cls, db_wrapper: DBWrapper2, block_cache_bytes: int = 100000000, archive: Optional[BlockArchive] = None
+    ):
         self = cls()
         # All full blocks which have been added to the blockchain. Header_hash -> block
         self.db_wrapper = db_wrapper
+        # if set, new blocks are stored in this flat-file archive instead of
+        # in the full_blocks table (where the block column is left NULL)
+        self.archive = archive
+        if archive is not None and self.db_wrapper.db_version != 2:
+            raise RuntimeError("the block archive requires a v2 blockchain database")
 
         async with self.db_wrapper.write_db() as conn:
 
@@ -74,6 +85,24 @@ class BlockStore:
                     "CREATE INDEX IF NOT EXISTS main_chain ON full_blocks(height, in_main_chain) WHERE in_main_chain=1"
                 )
 
+                # trained zstd dictionaries used to compress blocks. dict_id is
+                # the version of the dictionary, and is also recorded in the
+                # header of the compressed blocks
+                await conn.execute(
+                    "CREATE TABLE IF NOT EXISTS compression_dictionaries(dict_id integer PRIMARY KEY, dictionary blob)"
+                )
+
+                # the location of blocks stored in the flat-file block archive
+                await conn.execute(
+                    "CREATE TABLE IF NOT EXISTS block_archive("
+                    "header_hash blob PRIMARY KEY,"
+                    "height bigint,"
+                    "file_no int,"
+                    "offset bigint,"
+                    "length int)"
+                )
+                await conn.execute("CREATE INDEX IF NOT EXISTS block_archive_height ON block_archive(height)")
+
             else:
 
                 await conn.execute(
@@ -104,10 +133,25 @@ class BlockStore:
 
                 await conn.execute("CREATE INDEX IF NOT EXISTS peak on block_records(is_peak)")
 
-        self.block_cache = LRUCache(1000)
+        self.block_cache = FullBlockCache(block_cache_bytes)
         self.ses_challenge_cache = LRUCache(50)
+        self.compressor = BlockCompressor()
+        if self.db_wrapper.db_version == 2:
+            await self._load_compression_dictionaries()
+            async with self.db_wrapper.read_db() as conn:
+                if self.archive is None:
+                    async with conn.execute("SELECT 1 FROM block_archive LIMIT 1") as cursor:
+                        if await cursor.fetchone() is not None:
+                            raise RuntimeError(
+                                "the blockchain database has blocks in a block archive, "
+                                "but no block_archive_path is set"
+                            )
         return self
 
+    def close(self) -> None:
+        if self.archive is not None:
+            self.archive.close()
+
     def maybe_from_hex(self, field: Any) -> bytes:
         if self.db_wrapper.db_version == 2:
             return field
@@ -121,14 +165,79 @@ class BlockStore:
             return field.hex()
 
     def compress(self, block: FullBlock) -> bytes:
-        return zstd.compress(bytes(block))
+        return self.compressor.compress(bytes(block))
+
+    def decompress(self, block_bytes: Union[bytes, memoryview]) -> bytes:
+        return self.compressor.decompress(block_bytes)
+
+    async def _load_compression_dictionaries(self) -> None:
+        async with self.db_wrapper.read_db() as conn:
+            async with conn.execute("SELECT dict_id, dictionary FROM compression_dictionaries") as cursor:
+                for row in await cursor.fetchall():
+                    if not self.compressor.has_dictionary(row[0]):
+                        self.compressor.add_dictionary(row[0], row[1])
+
+    async def _decompress(self, block_bytes: Union[bytes, memoryview]) -> bytes:
+        """
+        Like decompress(), but if the block was compressed with a dictionary
+        that was added after we loaded them (by "chia db recompress" while
+        we're running), the dictionaries are loaded again
+        """
+        try:
+            return self.decompress(block_bytes)
+        except UnknownDictionaryError:
+            await self._load_compression_dictionaries()
+            return self.decompress(block_bytes)
 
     def maybe_decompress(self, block_bytes: bytes) -> FullBlock:
         if self.db_wrapper.db_version == 2:
-            return FullBlock.from_bytes(zstd.decompress(block_bytes))
+            return FullBlock.from_bytes(self.decompress(block_bytes))
         else:
             return FullBlock.from_bytes(block_bytes)
 
+    async def _archive_block(self, conn: Any, header_hash: bytes32, height: uint32, block_bytes: bytes) -> None:
+        assert self.archive is not None
+        blob = self.compressor.compress(block_bytes)
+        file_no, offset = self.archive.append(blob)
+        # the block must be on disk before the transaction referencing it is committed
+        self.db_wrapper.before_commit(self._sync_archive)
+        await conn.execute(
+            "INSERT OR REPLACE INTO block_archive VALUES(?, ?, ?, ?, ?)",
+            (header_hash, height, file_no, offset, len(blob)),
+        )
+
+    async def _sync_archive(self) -> None:
+        assert self.archive is not None
+        await asyncio.get_running_loop().run_in_executor(None, self.archive.sync)
+
+    async def _get_archived_blobs(self, header_hashes: List[bytes32]) -> Dict[bytes32, memoryview]:
+        """
+        Returns the (compressed) blocks stored in the block archive, as views
+        into the archive files
+        """
+        ret: Dict[bytes32, memoryview] = {}
+        if len(header_hashes) == 0:
+            return ret
+        if self.archive is None:
+            raise ValueError("block is stored in the block archive, but the block archive is disabled")
+        async with self.db_wrapper.read_db() as conn:
+            rows = await fetch_many(
+                conn,
+                "SELECT header_hash, file_no, offset, length FROM block_archive WHERE header_hash in ({})",
+                header_hashes,
+            )
+        for row in rows:
+            ret[bytes32(row[0])] = self.archive.read(row[1], row[2], row[3])
+        return ret
+
+    async def _get_block_blob(self, header_hash: bytes32, blob: Optional[bytes]) -> Union[bytes, memoryview]:
+        if blob is not None:
+            return blob
+        archived = await self._get_archived_blobs([header_hash])
+        if header_hash not in archived:
+            raise ValueError(f"block {header_hash.hex()} is missing from the block archive")
+        return archived[header_hash]
+
     async def rollback(self, height: int) -> None:
         if self.db_wrapper.db_version == 2:
             async with self.db_wrapper.write_db() as conn:
@@ -147,26 +256,32 @@ class BlockStore:
 
         assert header_hash == block.header_hash
 
-        block_bytes: bytes
-        if self.db_wrapper.db_version == 2:
-            block_bytes = self.compress(block)
-        else:
-            block_bytes = bytes(block)
-
-        self.block_cache.put(header_hash, block)
+        block_bytes = bytes(block)
+        self.block_cache.put(header_hash, block, block_bytes)
 
         async with self.db_wrapper.write_db() as conn:
+            blob: Optional[bytes]
+            if self.archive is not None:
+                # the archive is append-only, the old copy of the block is
+                # left behind
+                await self._archive_block(conn, header_hash, block.height, block_bytes)
+                blob = None
+            elif self.db_wrapper.db_version == 2:
+                blob = self.compressor.compress(block_bytes)
+            else:
+                blob = block_bytes
             await conn.execute(
                 "UPDATE full_blocks SET block=?,is_fully_compactified=? WHERE header_hash=?",
                 (
-                    block_bytes,
+                    blob,
                     int(block.is_fully_compactified()),
                     self.maybe_to_hex(header_hash),
                 ),
             )
 
     async def add_full_block(self, header_hash: bytes32, block: FullBlock, block_record: BlockRecord) -> None:
-        self.block_cache.put(header_hash, block)
+        block_bytes = bytes(block)
+        self.block_cache.put(header_hash, block, block_bytes)
 
         if self.db_wrapper.db_version == 2:
 
@@ -177,7 +292,7 @@ class BlockStore:
             )
 
             async with self.db_wrapper.write_db() as conn:
-                await conn.execute(
+                cursor = await conn.execute(
                     "INSERT OR IGNORE INTO full_blocks VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
                     (
                         header_hash,
@@ -186,10 +301,14 @@ class BlockStore:
                         ses,
                         int(block.is_fully_compactified()),
                         False,  # in_main_chain
-                        self.compress(block),
+                        None if self.archive is not None else self.compressor.compress(block_bytes),
                         bytes(block_record),
                     ),
                 )
+                # don't append blocks we already have to the archive
+                if self.archive is not None and cursor.rowcount > 0:
+                    await self._archive_block(conn, header_hash, block.height, block_bytes)
+                await cursor.close()
 
         else:
             async with self.db_wrapper.write_db() as conn:
@@ -200,7 +319,7 @@ class BlockStore:
                         block.height,
                         int(block.is_transaction_block()),
                         int(block.is_fully_compactified()),
-                        bytes(block),
+                        block_bytes,
                     ),
                 )
 
@@ -250,12 +369,9 @@ class BlockStore:
         return None
 
     def rollback_cache_block(self, header_hash: bytes32):
-        try:
-            self.block_cache.remove(header_hash)
-        except KeyError:
-            # this is best effort. When rolling back, we may not have added the
-            # block to the cache yet
-            pass
+        # this is best effort. When rolling back, we may not have added the
+        # block to the cache yet
+        self.block_cache.remove(header_hash)
 
     async def get_full_block(self, header_hash: bytes32) -> Optional[FullBlock]:
         cached = self.block_cache.get(header_hash)
@@ -264,32 +380,40 @@ class BlockStore:
             return cached
         log.debug(f"cache miss for block {header_hash.hex()}")
         async with self.db_wrapper.read_db() as conn:
-            async with conn.execute(
-                "SELECT block from full_blocks WHERE header_hash=?", (self.maybe_to_hex(header_hash),)
-            ) as cursor:
-                row = await cursor.fetchone()
-        if row is not None:
-            block = self.maybe_decompress(row[0])
-            self.block_cache.put(header_hash, block)
+            rows = list(
+                await conn.execute_fetchall(
+                    "SELECT block from full_blocks WHERE header_hash=?", (self.maybe_to_hex(header_hash),)
+                )
+            )
+        if len(rows) > 0:
+            if self.db_wrapper.db_version == 2:
+                block_bytes = await self._decompress(await self._get_block_blob(header_hash, rows[0][0]))
+            else:
+                block_bytes = rows[0][0]
+            block = FullBlock.from_bytes(block_bytes)
+            self.block_cache.put(header_hash, block, block_bytes)
             return block
         return None
 
     async def get_full_block_bytes(self, header_hash: bytes32) -> Optional[bytes]:
-        cached = self.block_cache.get(header_hash)
-        if cached is not None:
+        cached_bytes = self.block_cache.get_bytes(header_hash)
+        if cached_bytes is not None:
             log.debug(f"cache hit for block {header_hash.hex()}")
-            return bytes(cached)
+            return cached_bytes
         log.debug(f"cache miss for block {header_hash.hex()}")
         async with self.db_wrapper.read_db() as conn:
-            async with conn.execute(
-                "SELECT block from full_blocks WHERE header_hash=?", (self.maybe_to_hex(header_hash),)
-            ) as cursor:
-                row = await cursor.fetchone()
-        if row is not None:
+            rows = list(
+                await conn.execute_fetchall(
+                    "SELECT block from full_blocks WHERE header_hash=?", (self.maybe_to_hex(header_hash),)
+                )
+            )
+        if len(rows) > 0:
             if self.db_wrapper.db_version == 2:
-                return zstd.decompress(row[0])
+                block_bytes = await self._decompress(await self._get_block_blob(header_hash, rows[0][0]))
             else:
-                return row[0]
+                block_bytes = rows[0][0]
+            self.block_cache.put_bytes(header_hash, block_bytes)
+            return block_bytes
 
         return None
 
@@ -297,42 +421,59 @@ class BlockStore:
         if len(heights) == 0:
             return []
 
-        heights_db = tuple(heights)
-        formatted_str = f'SELECT block from full_blocks WHERE height in ({"?," * (len(heights_db) - 1)}?)'
         async with self.db_wrapper.read_db() as conn:
-            async with conn.execute(formatted_str, heights_db) as cursor:
-                ret: List[FullBlock] = []
-                for row in await cursor.fetchall():
-                    ret.append(self.maybe_decompress(row[0]))
-                return ret
+            rows = [
+                (bytes32(self.maybe_from_hex(row[0])), row[1])
+                for row in await fetch_many(
+                    conn, "SELECT header_hash, block from full_blocks WHERE height in ({})", heights
+                )
+            ]
+        archived = await self._get_archived_blobs([hh for hh, blob in rows if blob is None])
+        ret: List[FullBlock] = []
+        for header_hash, blob in rows:
+            # decompressing and parsing the block is the expensive part
+            block = self.block_cache.get(header_hash)
+            if block is None:
+                if self.db_wrapper.db_version == 2:
+                    block_bytes = await self._decompress(archived[header_hash] if blob is None else blob)
+                else:
+                    block_bytes = blob
+                block = FullBlock.from_bytes(block_bytes)
+                self.block_cache.put(header_hash, block, block_bytes)
+            ret.append(block)
+        return ret
 
     async def get_generator(self, header_hash: bytes32) -> Optional[SerializedProgram]:
 
-        cached = self.block_cache.get(header_hash)
+        cached = self.block_cache.parsed.get(header_hash)
         if cached is not None:
             log.debug(f"cache hit for block {header_hash.hex()}")
             return cached.transactions_generator
+        cached_bytes = self.block_cache.serialized.get(header_hash)
+        if cached_bytes is not None:
+            log.debug(f"cache hit for block {header_hash.hex()}")
+            return generator_from_block(cached_bytes)
 
         formatted_str = "SELECT block, height from full_blocks WHERE header_hash=?"
         async with self.db_wrapper.read_db() as conn:
-            async with conn.execute(formatted_str, (self.maybe_to_hex(header_hash),)) as cursor:
-                row = await cursor.fetchone()
-                if row is None:
-                    return None
-                if self.db_wrapper.db_version == 2:
-                    block_bytes = zstd.decompress(row[0])
-                else:
-                    block_bytes = row[0]
-
-                try:
-                    return generator_from_block(block_bytes)
-                except Exception as e:
-                    log.error(f"cheap parser failed for block at height {row[1]}: {e}")
-                    # this is defensive, on the off-chance that
-                    # generator_from_block() fails, fall back to the reliable
-                    # definition of parsing a block
-                    b = FullBlock.from_bytes(block_bytes)
-                    return b.transactions_generator
+            rows = list(await conn.execute_fetchall(formatted_str, (self.maybe_to_hex(header_hash),)))
+        if len(rows) == 0:
+            return None
+        row = rows[0]
+        if self.db_wrapper.db_version == 2:
+            block_bytes = await self._decompress(await self._get_block_blob(header_hash, row[0]))
+        else:
+            block_bytes = row[0]
+
+        try:
+            return generator_from_block(block_bytes)
+        except Exception as e:
+            log.error(f"cheap parser failed for block at height {row[1]}: {e}")
+            # this is defensive, on the off-chance that
+            # generator_from_block() fails, fall back to the reliable
+            # definition of parsing a block
+            b = FullBlock.from_bytes(block_bytes)
+            return b.transactions_generator
 
     async def get_generators_at(self, heights: List[uint32]) -> List[SerializedProgram]:
         assert self.db_wrapper.db_version == 2
@@ -341,28 +482,28 @@ class BlockStore:
             return []
 
         generators: Dict[uint32, SerializedProgram] = {}
-        heights_db = tuple(heights)
-        formatted_str = (
-            f"SELECT block, height from full_blocks "
-            f'WHERE in_main_chain=1 AND height in ({"?," * (len(heights_db) - 1)}?)'
-        )
         async with self.db_wrapper.read_db() as conn:
-            async with conn.execute(formatted_str, heights_db) as cursor:
-                async for row in cursor:
-                    block_bytes = zstd.decompress(row[0])
-
-                    try:
-                        gen = generator_from_block(block_bytes)
-                    except Exception as e:
-                        log.error(f"cheap parser failed for block at height {row[1]}: {e}")
-                        # this is defensive, on the off-chance that
-                        # generator_from_block() fails, fall back to the reliable
-                        # definition of parsing a block
-                        b = FullBlock.from_bytes(block_bytes)
-                        gen = b.transactions_generator
-                    if gen is None:
-                        raise ValueError(Err.GENERATOR_REF_HAS_NO_GENERATOR)
-                    generators[uint32(row[1])] = gen
+            rows = await fetch_many(
+                conn,
+                "SELECT header_hash, block, height from full_blocks WHERE in_main_chain=1 AND height in ({})",
+                heights,
+            )
+        archived = await self._get_archived_blobs([bytes32(row[0]) for row in rows if row[1] is None])
+        for row in rows:
+            block_bytes = await self._decompress(archived[bytes32(row[0])] if row[1] is None else row[1])
+
+            try:
+                gen = generator_from_block(block_bytes)
+            except Exception as e:
+                log.error(f"cheap parser failed for block at height {row[2]}: {e}")
+                # this is defensive, on the off-chance that
+                # generator_from_block() fails, fall back to the reliable
+                # definition of parsing a block
+                b = FullBlock.from_bytes(block_bytes)
+                gen = b.transactions_generator
+            if gen is None:
+                raise ValueError(Err.GENERATOR_REF_HAS_NO_GENERATOR)
+            generators[uint32(row[2])] = gen
 
         return [generators[h] for h in heights]
 
@@ -377,21 +518,22 @@ class BlockStore:
         all_blocks: Dict[bytes32, BlockRecord] = {}
         if self.db_wrapper.db_version == 2:
             async with self.db_wrapper.read_db() as conn:
-                async with conn.execute(
-                    "SELECT header_hash,block_record FROM full_blocks "
-                    f'WHERE header_hash in ({"?," * (len(header_hashes) - 1)}?)',
-                    tuple(header_hashes),
-                ) as cursor:
-                    for row in await cursor.fetchall():
-                        header_hash = bytes32(row[0])
-                        all_blocks[header_hash] = BlockRecord.from_bytes(row[1])
+                rows = await fetch_many(
+                    conn, "SELECT header_hash,block_record FROM full_blocks WHERE header_hash in ({})", header_hashes
+                )
+            for row in rows:
+                header_hash = bytes32(row[0])
+                all_blocks[header_hash] = BlockRecord.from_bytes(row[1])
         else:
-            formatted_str = f'SELECT block from block_records WHERE header_hash in ({"?," * (len(header_hashes) - 1)}?)'
             async with self.db_wrapper.read_db() as conn:
-                async with conn.execute(formatted_str, tuple([hh.hex() for hh in header_hashes])) as cursor:
-                    for row in await cursor.fetchall():
-                        block_rec: BlockRecord = BlockRecord.from_bytes(row[0])
-                        all_blocks[block_rec.header_hash] = block_rec
+                rows = await fetch_many(
+                    conn,
+                    "SELECT block from block_records WHERE header_hash in ({})",
+                    [hh.hex() for hh in header_hashes],
+                )
+            for row in rows:
+                block_rec: BlockRecord = BlockRecord.from_bytes(row[0])
+                all_blocks[block_rec.header_hash] = block_rec
 
         ret: List[BlockRecord] = []
         for hh in header_hashes:
@@ -409,22 +551,25 @@ class BlockStore:
         if len(header_hashes) == 0:
             return []
 
-        header_hashes_db: Tuple[Any, ...]
-        if self.db_wrapper.db_version == 2:
-            header_hashes_db = tuple(header_hashes)
-        else:
-            header_hashes_db = tuple([hh.hex() for hh in header_hashes])
-        formatted_str = (
-            f'SELECT header_hash, block from full_blocks WHERE header_hash in ({"?," * (len(header_hashes_db) - 1)}?)'
-        )
         all_blocks: Dict[bytes32, FullBlock] = {}
         async with self.db_wrapper.read_db() as conn:
-            async with conn.execute(formatted_str, header_hashes_db) as cursor:
-                for row in await cursor.fetchall():
-                    header_hash = bytes32(self.maybe_from_hex(row[0]))
-                    full_block: FullBlock = self.maybe_decompress(row[1])
-                    all_blocks[header_hash] = full_block
-                    self.block_cache.put(header_hash, full_block)
+            rows = [
+                (bytes32(self.maybe_from_hex(row[0])), row[1])
+                for row in await fetch_many(
+                    conn,
+                    "SELECT header_hash, block from full_blocks WHERE header_hash in ({})",
+                    [self.maybe_to_hex(hh) for hh in header_hashes],
+                )
+            ]
+        archived = await self._get_archived_blobs([hh for hh, blob in rows if blob is None])
+        for header_hash, blob in rows:
+            if self.db_wrapper.db_version == 2:
+                block_bytes = await self._decompress(archived[header_hash] if blob is None else blob)
+            else:
+                block_bytes = blob
+            full_block = FullBlock.from_bytes(block_bytes)
+            all_blocks[header_hash] = full_block
+            self.block_cache.put(header_hash, full_block, block_bytes)
         ret: List[FullBlock] = []
         for hh in header_hashes:
             if hh not in all_blocks:
@@ -437,23 +582,25 @@ class BlockStore:
         if self.db_wrapper.db_version == 2:
 
             async with self.db_wrapper.read_db() as conn:
-                async with conn.execute(
-                    "SELECT block_record FROM full_blocks WHERE header_hash=?",
-                    (header_hash,),
-                ) as cursor:
-                    row = await cursor.fetchone()
-            if row is not None:
-                return BlockRecord.from_bytes(row[0])
+                rows = list(
+                    await conn.execute_fetchall(
+                        "SELECT block_record FROM full_blocks WHERE header_hash=?",
+                        (header_hash,),
+                    )
+                )
+            if len(rows) > 0:
+                return BlockRecord.from_bytes(rows[0][0])
 
         else:
             async with self.db_wrapper.read_db() as conn:
-                async with conn.execute(
-                    "SELECT block from block_records WHERE header_hash=?",
-                    (header_hash.hex(),),
-                ) as cursor:
-                    row = await cursor.fetchone()
-            if row is not None:
-                return BlockRecord.from_bytes(row[0])
+                rows = list(
+                    await conn.execute_fetchall(
+                        "SELECT block from block_records WHERE header_hash=?",
+                        (header_hash.hex(),),
+                    )
+                )
+            if len(rows) > 0:
+                return BlockRecord.from_bytes(rows[0][0])
         return None
 
     async def get_block_records_in_range(
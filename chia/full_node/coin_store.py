@@ -1,39 +1,61 @@
-from typing import List, Optional, Set, Dict, Any, Tuple
+from typing import List, Optional, Set, Dict, Any, Iterable, Tuple
 
 from aiosqlite import Cursor
 
+from chia.full_node.unspent_coin_index import UnspentCoinIndex
 from chia.protocols.wallet_protocol import CoinState
 from chia.types.blockchain_format.coin import Coin
 from chia.types.blockchain_format.sized_bytes import bytes32
 from chia.types.coin_record import CoinRecord
-from chia.util.db_wrapper import DBWrapper2
+from chia.util.db_wrapper import DBWrapper2, fetch_many
 from chia.util.ints import uint32, uint64
 from chia.util.lru_cache import LRUCache
-from chia.util.chunks import chunks
 import time
 import logging
 
 log = logging.getLogger(__name__)
 
-MAX_SQLITE_PARAMETERS = 900
-
 
 class CoinStore:
     """
     This object handles CoinRecords in DB.
     A cache is maintained for quicker access to recent coins.
+    Optionally, a resident index of unspent coins (bounded by
+    unspent_index_bytes) is kept to serve lookups without hitting the DB.
+    An undo journal records the coins added and spent at each of the last
+    undo_journal_heights heights, to make rollbacks proportional to the number
+    of changed coins rather than the size of the table.
     """
 
     coin_record_cache: LRUCache
     cache_size: uint32
     db_wrapper: DBWrapper2
+    unspent_index: Optional[UnspentCoinIndex]
+    undo_journal_heights: int
+    # height -> (coin records added, coin records spent (as they were before the spend))
+    _undo_journal: Dict[int, Tuple[List[CoinRecord], List[CoinRecord]]]
+    # all changes at this height and above are recorded in the undo journal.
+    # None means the journal doesn't cover anything yet
+    _journal_start: Optional[int]
+    _undo_journal_enabled: bool
 
     @classmethod
-    async def create(cls, db_wrapper: DBWrapper2, cache_size: uint32 = uint32(60000)):
+    async def create(
+        cls,
+        db_wrapper: DBWrapper2,
+        cache_size: uint32 = uint32(60000),
+        unspent_index_bytes: int = 0,
+        undo_journal_heights: int = 0,
+    ):
         self = cls()
 
         self.cache_size = cache_size
         self.db_wrapper = db_wrapper
+        self.unspent_index = None
+        self.undo_journal_heights = undo_journal_heights
+        self._undo_journal = {}
+        self._journal_start = None
+        self._undo_journal_enabled = True
 
         async with self.db_wrapper.write_db() as conn:
 
@@ -82,8 +104,31 @@ class CoinStore:
             await conn.execute("CREATE INDEX IF NOT EXISTS coin_parent_index on coin_record(coin_parent)")
 
         self.coin_record_cache = LRUCache(cache_size)
+
+        if unspent_index_bytes > 0:
+            self.unspent_index = UnspentCoinIndex(unspent_index_bytes)
+            await self._load_unspent_index()
         return self
 
+    async def _load_unspent_index(self) -> None:
+        assert self.unspent_index is not None
+        start = time.monotonic()
+        async with self.db_wrapper.read_db() as conn:
+            async with conn.execute(
+                "SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
+                "coin_parent, amount, timestamp FROM coin_record WHERE spent_index=0"
+            ) as cursor:
+                async for row in cursor:
+                    if self.unspent_index.full():
+                        break
+                    coin = self.row_to_coin(row)
+                    self.unspent_index.add(CoinRecord(coin, row[0], uint32(0), row[2], row[6]))
+        end = time.monotonic()
+        log.info(
+            f"loaded {len(self.unspent_index)} unspent coins into the coin index "
+            f"({self.unspent_index.memory_usage() / 1000000:0.1f} MB) in {end - start:0.2f}s"
+        )
+
     async def num_unspent(self) -> int:
         async with self.db_wrapper.read_db() as conn:
             async with conn.execute("SELECT COUNT(*) FROM coin_record WHERE spent_index=0") as cursor:
@@ -165,18 +210,25 @@ class CoinStore:
         if cached is not None:
             return cached
 
+        if self.unspent_index is not None:
+            cached = self.unspent_index.get(coin_name)
+            if cached is not None:
+                return cached
+
         async with self.db_wrapper.read_db() as conn:
-            async with conn.execute(
-                "SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
-                "coin_parent, amount, timestamp FROM coin_record WHERE coin_name=?",
-                (self.maybe_to_hex(coin_name),),
-            ) as cursor:
-                row = await cursor.fetchone()
-                if row is not None:
-                    coin = self.row_to_coin(row)
-                    record = CoinRecord(coin, row[0], row[1], row[2], row[6])
-                    self.coin_record_cache.put(record.coin.name(), record)
-                    return record
+            rows = list(
+                await conn.execute_fetchall(
+                    "SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
+                    "coin_parent, amount, timestamp FROM coin_record WHERE coin_name=?",
+                    (self.maybe_to_hex(coin_name),),
+                )
+            )
+        if len(rows) > 0:
+            row = rows[0]
+            coin = self.row_to_coin(row)
+            record = CoinRecord(coin, row[0], row[1], row[2], row[6])
+            self.coin_record_cache.put(record.coin.name(), record)
+            return record
         return None
 
     async def get_coins_added_at_height(self, height: uint32) -> List[CoinRecord]:
@@ -247,26 +299,20 @@ class CoinStore:
             return []
 
         coins = set()
-        puzzle_hashes_db: Tuple[Any, ...]
-        if self.db_wrapper.db_version == 2:
-            puzzle_hashes_db = tuple(puzzle_hashes)
-        else:
-            puzzle_hashes_db = tuple([ph.hex() for ph in puzzle_hashes])
-
         async with self.db_wrapper.read_db() as conn:
-            async with conn.execute(
-                f"SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
-                f"coin_parent, amount, timestamp FROM coin_record INDEXED BY coin_puzzle_hash "
-                f'WHERE puzzle_hash in ({"?," * (len(puzzle_hashes) - 1)}?) '
-                f"AND confirmed_index>=? AND confirmed_index<? "
+            rows = await fetch_many(
+                conn,
+                "SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
+                "coin_parent, amount, timestamp FROM coin_record INDEXED BY coin_puzzle_hash "
+                "WHERE puzzle_hash in ({}) AND confirmed_index>=? AND confirmed_index<? "
                 f"{'' if include_spent_coins else 'AND spent_index=0'}",
-                puzzle_hashes_db + (start_height, end_height),
-            ) as cursor:
-
-                for row in await cursor.fetchall():
-                    coin = self.row_to_coin(row)
-                    coins.add(CoinRecord(coin, row[0], row[1], row[2], row[6]))
-                return list(coins)
+                [self.maybe_to_hex(ph) for ph in puzzle_hashes],
+                (start_height, end_height),
+            )
+        for row in rows:
+            coin = self.row_to_coin(row)
+            coins.add(CoinRecord(coin, row[0], row[1], row[2], row[6]))
+        return list(coins)
 
     async def get_coin_records_by_names(
         self,
@@ -279,25 +325,34 @@ class CoinStore:
             return []
 
         coins = set()
-        names_db: Tuple[Any, ...]
-        if self.db_wrapper.db_version == 2:
-            names_db = tuple(names)
-        else:
-            names_db = tuple([name.hex() for name in names])
+
+        # the records in the unspent index are authoritative, only the coins we
+        # couldn't find there need to be looked up in the DB
+        if self.unspent_index is not None:
+            missing: List[bytes32] = []
+            for name in names:
+                record = self.unspent_index.get(name)
+                if record is None:
+                    missing.append(name)
+                elif start_height <= record.confirmed_block_index < end_height:
+                    coins.add(record)
+            if len(missing) == 0:
+                return list(coins)
+            names = missing
 
         async with self.db_wrapper.read_db() as conn:
-            async with conn.execute(
-                f"SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
-                f"coin_parent, amount, timestamp FROM coin_record INDEXED BY sqlite_autoindex_coin_record_1 "
-                f'WHERE coin_name in ({"?," * (len(names) - 1)}?) '
-                f"AND confirmed_index>=? AND confirmed_index<? "
+            rows = await fetch_many(
+                conn,
+                "SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
+                "coin_parent, amount, timestamp FROM coin_record INDEXED BY sqlite_autoindex_coin_record_1 "
+                "WHERE coin_name in ({}) AND confirmed_index>=? AND confirmed_index<? "
                 f"{'' if include_spent_coins else 'AND spent_index=0'}",
-                names_db + (start_height, end_height),
-            ) as cursor:
-
-                for row in await cursor.fetchall():
-                    coin = self.row_to_coin(row)
-                    coins.add(CoinRecord(coin, row[0], row[1], row[2], row[6]))
+                [self.maybe_to_hex(name) for name in names],
+                (start_height, end_height),
+            )
+        for row in rows:
+            coin = self.row_to_coin(row)
+            coins.add(CoinRecord(coin, row[0], row[1], row[2], row[6]))
 
         return list(coins)
 
@@ -324,23 +379,17 @@ class CoinStore:
 
         coins = set()
         async with self.db_wrapper.read_db() as conn:
-            for puzzles in chunks(puzzle_hashes, MAX_SQLITE_PARAMETERS):
-                puzzle_hashes_db: Tuple[Any, ...]
-                if self.db_wrapper.db_version == 2:
-                    puzzle_hashes_db = tuple(puzzles)
-                else:
-                    puzzle_hashes_db = tuple([ph.hex() for ph in puzzles])
-                async with conn.execute(
-                    f"SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
-                    f"coin_parent, amount, timestamp FROM coin_record INDEXED BY coin_puzzle_hash "
-                    f'WHERE puzzle_hash in ({"?," * (len(puzzles) - 1)}?) '
-                    f"AND (confirmed_index>=? OR spent_index>=?)"
-                    f"{'' if include_spent_coins else 'AND spent_index=0'}",
-                    puzzle_hashes_db + (min_height, min_height),
-                ) as cursor:
-
-                    async for row in cursor:
-                        coins.add(self.row_to_coin_state(row))
+            rows = await fetch_many(
+                conn,
+                "SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
+                "coin_parent, amount, timestamp FROM coin_record INDEXED BY coin_puzzle_hash "
+                "WHERE puzzle_hash in ({}) AND (confirmed_index>=? OR spent_index>=?)"
+                f"{'' if include_spent_coins else 'AND spent_index=0'}",
+                [self.maybe_to_hex(ph) for ph in puzzle_hashes],
+                (min_height, min_height),
+            )
+        for row in rows:
+            coins.add(self.row_to_coin_state(row))
 
         return list(coins)
 
@@ -356,23 +405,18 @@ class CoinStore:
 
         coins = set()
         async with self.db_wrapper.read_db() as conn:
-            for ids in chunks(parent_ids, MAX_SQLITE_PARAMETERS):
-                parent_ids_db: Tuple[Any, ...]
-                if self.db_wrapper.db_version == 2:
-                    parent_ids_db = tuple(ids)
-                else:
-                    parent_ids_db = tuple([pid.hex() for pid in ids])
-                async with conn.execute(
-                    f"SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
-                    f'coin_parent, amount, timestamp FROM coin_record WHERE coin_parent in ({"?," * (len(ids) - 1)}?) '
-                    f"AND confirmed_index>=? AND confirmed_index<? "
-                    f"{'' if include_spent_coins else 'AND spent_index=0'}",
-                    parent_ids_db + (start_height, end_height),
-                ) as cursor:
-
-                    async for row in cursor:
-                        coin = self.row_to_coin(row)
-                        coins.add(CoinRecord(coin, row[0], row[1], row[2], row[6]))
+            rows = await fetch_many(
+                conn,
+                "SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
+                "coin_parent, amount, timestamp FROM coin_record WHERE coin_parent in ({}) "
+                "AND confirmed_index>=? AND confirmed_index<? "
+                f"{'' if include_spent_coins else 'AND spent_index=0'}",
+                [self.maybe_to_hex(pid) for pid in parent_ids],
+                (start_height, end_height),
+            )
+        for row in rows:
+            coin = self.row_to_coin(row)
+            coins.add(CoinRecord(coin, row[0], row[1], row[2], row[6]))
 
         return list(coins)
 
@@ -387,28 +431,111 @@ class CoinStore:
 
         coins = set()
         async with self.db_wrapper.read_db() as conn:
-            for ids in chunks(coin_ids, MAX_SQLITE_PARAMETERS):
-                coin_ids_db: Tuple[Any, ...]
-                if self.db_wrapper.db_version == 2:
-                    coin_ids_db = tuple(ids)
-                else:
-                    coin_ids_db = tuple([pid.hex() for pid in ids])
-                async with conn.execute(
-                    f"SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
-                    f'coin_parent, amount, timestamp FROM coin_record WHERE coin_name in ({"?," * (len(ids) - 1)}?) '
-                    f"AND (confirmed_index>=? OR spent_index>=?)"
-                    f"{'' if include_spent_coins else 'AND spent_index=0'}",
-                    coin_ids_db + (min_height, min_height),
-                ) as cursor:
-                    async for row in cursor:
-                        coins.add(self.row_to_coin_state(row))
+            rows = await fetch_many(
+                conn,
+                "SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
+                "coin_parent, amount, timestamp FROM coin_record WHERE coin_name in ({}) "
+                "AND (confirmed_index>=? OR spent_index>=?)"
+                f"{'' if include_spent_coins else 'AND spent_index=0'}",
+                [self.maybe_to_hex(cid) for cid in coin_ids],
+                (min_height, min_height),
+            )
+        for row in rows:
+            coins.add(self.row_to_coin_state(row))
         return list(coins)
 
+    def set_undo_journal_enabled(self, enabled: bool) -> None:
+        """
+        Keeping the undo journal costs an extra lookup of the coins spent by
+        every block. It's turned off during long sync, where rollbacks are
+        rare. Turning it off drops everything it has recorded
+        """
+        self._undo_journal_enabled = enabled
+        if not enabled:
+            self._undo_journal = {}
+            self._journal_start = None
+
+    def _journal_active(self) -> bool:
+        return self.undo_journal_heights > 0 and self._undo_journal_enabled
+
+    def _journal_append(self, height: int, added: List[CoinRecord], spent: List[CoinRecord]) -> None:
+        """
+        Records coins added and spent at height in the undo journal. Must be
+        called from within the write transaction. If it's rolled back, only
+        the journal entries changed here are reverted
+        """
+        start = self._journal_start
+        if start is None:
+            self._journal_start = height
+        entry = self._undo_journal.get(height)
+        created = entry is None
+        evicted: List[Tuple[int, Tuple[List[CoinRecord], List[CoinRecord]]]] = []
+        if entry is None:
+            entry = ([], [])
+            self._undo_journal[height] = entry
+            # heights are added in ascending order, so the first one is the oldest
+            while len(self._undo_journal) > self.undo_journal_heights:
+                oldest = next(iter(self._undo_journal))
+                evicted.append((oldest, self._undo_journal.pop(oldest)))
+                self._journal_start = oldest + 1
+        num_added = len(entry[0])
+        num_spent = len(entry[1])
+        entry[0].extend(added)
+        entry[1].extend(spent)
+
+        def revert() -> None:
+            del entry[0][num_added:]
+            del entry[1][num_spent:]
+            if created:
+                self._undo_journal.pop(height, None)
+            if len(evicted) > 0:
+                # the evicted heights are the oldest ones
+                self._undo_journal = dict(evicted + list(self._undo_journal.items()))
+            self._journal_start = start
+
+        self.db_wrapper.on_rollback(revert)
+
+    def _journal_drop_above(self, block_index: int) -> None:
+        """
+        Removes the heights above block_index from the undo journal. Must be
+        called from within the write transaction. If it's rolled back, they're
+        put back
+        """
+        start = self._journal_start
+        removed = [(h, entry) for h, entry in self._undo_journal.items() if h > block_index]
+        for height, _ in removed:
+            del self._undo_journal[height]
+
+        def revert() -> None:
+            # the removed heights are the most recent ones
+            self._undo_journal.update(removed)
+            self._journal_start = start
+
+        self.db_wrapper.on_rollback(revert)
+
+    def _forget_on_rollback(self, coin_names: Iterable[bytes32]) -> None:
+        """
+        The in-memory caches are updated along with the DB. If the current
+        write transaction is rolled back, the coins it touched are dropped from
+        them, so their next lookups go to the DB
+        """
+
+        def forget() -> None:
+            for name in coin_names:
+                self.coin_record_cache.cache.pop(name, None)
+                if self.unspent_index is not None:
+                    self.unspent_index.remove(name)
+
+        self.db_wrapper.on_rollback(forget)
+
     async def rollback_to_block(self, block_index: int) -> List[CoinRecord]:
         """
         Note that block_index can be negative, in which case everything is rolled back
         Returns the list of coin records that have been modified
         """
+        if self._journal_start is not None and block_index + 1 >= self._journal_start:
+            return await self._rollback_from_journal(block_index)
+
         # Update memory cache
         delete_queue: List[bytes32] = []
         for coin_name, coin_record in list(self.coin_record_cache.cache.items()):
@@ -430,6 +557,14 @@ class CoinStore:
         coin_changes: Dict[bytes32, CoinRecord] = {}
         # Add coins that are confirmed in the reverted blocks to the list of updated coins.
         async with self.db_wrapper.write_db() as conn:
+            # coin_changes is filled in below
+            self._forget_on_rollback(coin_changes)
+            if self._journal_active():
+                # everything above block_index is deleted from the DB below, so
+                # the journal (trivially) covers those heights
+                self._journal_drop_above(block_index)
+                if self._journal_start is None or self._journal_start > block_index + 1:
+                    self._journal_start = block_index + 1
             async with conn.execute(
                 "SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
                 "coin_parent, amount, timestamp FROM coin_record WHERE confirmed_index>?",
@@ -439,6 +574,8 @@ class CoinStore:
                     coin = self.row_to_coin(row)
                     record = CoinRecord(coin, uint32(0), row[1], row[2], uint64(0))
                     coin_changes[record.name] = record
+                    if self.unspent_index is not None:
+                        self.unspent_index.remove(record.name)
 
             # Delete reverted blocks from storage
             await conn.execute("DELETE FROM coin_record WHERE confirmed_index>?", (block_index,))
@@ -454,6 +591,8 @@ class CoinStore:
                     record = CoinRecord(coin, row[0], uint32(0), row[2], row[6])
                     if record.name not in coin_changes:
                         coin_changes[record.name] = record
+                        if self.unspent_index is not None:
+                            self.unspent_index.add(record)
 
             if self.db_wrapper.db_version == 2:
                 await conn.execute("UPDATE coin_record SET spent_index=0 WHERE spent_index>?", (block_index,))
@@ -463,6 +602,82 @@ class CoinStore:
                 )
         return list(coin_changes.values())
 
+    async def _rollback_from_journal(self, block_index: int) -> List[CoinRecord]:
+        heights = [h for h in self._undo_journal if h > block_index]
+        entries = [self._undo_journal[h] for h in heights]
+
+        spent_at: Dict[bytes32, uint32] = {}
+        for height, (_, spends) in zip(heights, entries):
+            for record in spends:
+                spent_at[record.name] = uint32(height)
+
+        coin_changes: Dict[bytes32, CoinRecord] = {}
+        deleted: List[bytes32] = []
+        unspent: List[CoinRecord] = []
+        for additions, _ in entries:
+            for record in additions:
+                coin_changes[record.name] = CoinRecord(
+                    record.coin, uint32(0), spent_at.get(record.name, uint32(0)), record.coinbase, uint64(0)
+                )
+                deleted.append(record.name)
+        for _, spends in entries:
+            for record in spends:
+                if record.name not in coin_changes:
+                    coin_changes[record.name] = record
+                    unspent.append(record)
+
+        async with self.db_wrapper.write_db() as conn:
+            self._forget_on_rollback(coin_changes)
+            self._journal_drop_above(block_index)
+            await conn.executemany(
+                "DELETE FROM coin_record WHERE coin_name=?", [(self.maybe_to_hex(name),) for name in deleted]
+            )
+            if self.db_wrapper.db_version == 2:
+                await conn.executemany(
+                    "UPDATE coin_record SET spent_index=0 WHERE coin_name=?", [(r.name,) for r in unspent]
+                )
+            else:
+                await conn.executemany(
+                    "UPDATE coin_record SET spent_index=0, spent=0 WHERE coin_name=?",
+                    [(r.name.hex(),) for r in unspent],
+                )
+
+        # Update memory caches
+        for name in deleted:
+            if name in self.coin_record_cache.cache:
+                self.coin_record_cache.remove(name)
+            if self.unspent_index is not None:
+                self.unspent_index.remove(name)
+        for record in unspent:
+            if record.name in self.coin_record_cache.cache:
+                self.coin_record_cache.put(record.name, record)
+            if self.unspent_index is not None:
+                self.unspent_index.add(record)
+
+        return list(coin_changes.values())
+
+    async def _get_unspent_records(self, conn: Any, coin_names: List[bytes32]) -> Dict[bytes32, CoinRecord]:
+        records: Dict[bytes32, CoinRecord] = {}
+        rows = await fetch_many(
+            conn,
+            "SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
+            "coin_parent, amount, timestamp FROM coin_record WHERE coin_name in ({}) AND spent_index=0",
+            [self.maybe_to_hex(name) for name in coin_names],
+        )
+        for row in rows:
+            coin = self.row_to_coin(row)
+            record = CoinRecord(coin, row[0], row[1], row[2], row[6])
+            records[record.name] = record
+        return records
+
+    def _journal_additions(self, records: List[CoinRecord]) -> None:
+        if self._journal_active():
+            by_height: Dict[int, List[CoinRecord]] = {}
+            for record in records:
+                by_height.setdefault(record.confirmed_block_index, []).append(record)
+            for height in sorted(by_height):
+                self._journal_append(height, by_height[height], [])
+
     # Store CoinRecord in DB and ram cache
     async def _add_coin_records(self, records: List[CoinRecord]) -> None:
 
@@ -470,6 +685,8 @@ class CoinStore:
             values2 = []
             for record in records:
                 self.coin_record_cache.put(record.coin.name(), record)
+                if self.unspent_index is not None and record.spent_block_index == 0:
+                    self.unspent_index.add(record)
                 values2.append(
                     (
                         record.coin.name(),
@@ -484,14 +701,18 @@ class CoinStore:
                 )
             if len(values2) > 0:
                 async with self.db_wrapper.write_db() as conn:
+                    self._forget_on_rollback([record.name for record in records])
                     await conn.executemany(
                         "INSERT INTO coin_record VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
                         values2,
                     )
+                    self._journal_additions(records)
         else:
             values = []
             for record in records:
                 self.coin_record_cache.put(record.coin.name(), record)
+                if self.unspent_index is not None and record.spent_block_index == 0:
+                    self.unspent_index.add(record)
                 values.append(
                     (
                         record.coin.name().hex(),
@@ -507,19 +728,27 @@ class CoinStore:
                 )
             if len(values) > 0:
                 async with self.db_wrapper.write_db() as conn:
+                    self._forget_on_rollback([record.name for record in records])
                     await conn.executemany(
                         "INSERT INTO coin_record VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)",
                         values,
                     )
+                    self._journal_additions(records)
 
     # Update coin_record to be spent in DB
     async def _set_spent(self, coin_names: List[bytes32], index: uint32):
 
         assert len(coin_names) == 0 or index > 0
+        journal = self._journal_active()
+        # the records as they were before being spent, for the undo journal
+        spent_records: List[CoinRecord] = []
+        missing: List[bytes32] = []
         # if this coin is in the cache, mark it as spent in there
         updates = []
         for coin_name in coin_names:
             r = self.coin_record_cache.get(coin_name)
+            if r is None and journal and self.unspent_index is not None:
+                r = self.unspent_index.get(coin_name)
             if r is not None:
                 if r.spent_block_index != uint32(0):
                     raise ValueError(f"Coin already spent in cache: {coin_name}")
@@ -527,10 +756,24 @@ class CoinStore:
                 self.coin_record_cache.put(
                     r.name, CoinRecord(r.coin, r.confirmed_block_index, index, r.coinbase, r.timestamp)
                 )
+                spent_records.append(r)
+            else:
+                missing.append(coin_name)
+            if self.unspent_index is not None:
+                self.unspent_index.remove(coin_name)
             updates.append((index, self.maybe_to_hex(coin_name)))
 
         assert len(updates) == len(coin_names)
         async with self.db_wrapper.write_db() as conn:
+            self._forget_on_rollback(coin_names)
+            if journal and len(missing) > 0:
+                fetched = await self._get_unspent_records(conn, missing)
+                for r in fetched.values():
+                    self.coin_record_cache.put(
+                        r.name, CoinRecord(r.coin, r.confirmed_block_index, index, r.coinbase, r.timestamp)
+                    )
+                spent_records.extend(fetched.values())
+
             if self.db_wrapper.db_version == 2:
                 ret: Cursor = await conn.executemany(
                     "UPDATE OR FAIL coin_record SET spent_index=? WHERE coin_name=? AND spent_index=0", updates
@@ -545,3 +788,6 @@ class CoinStore:
                 raise ValueError(
                     f"Invalid operation to set spent, total updates {ret.rowcount} expected {len(coin_names)}"
                 )
+
+            if journal and len(spent_records) > 0:
+                self._journal_append(index, [], spent_records)
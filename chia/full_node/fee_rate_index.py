@@ -0,0 +1,141 @@
+import random
+from typing import Iterator, Optional, Tuple
+
+
+class _Node:
+    __slots__ = ("fee_per_cost", "cost", "count", "total_cost", "priority", "left", "right")
+
+    def __init__(self, fee_per_cost: float, cost: int, priority: float) -> None:
+        self.fee_per_cost = fee_per_cost
+        # the cost and number of the items with this fee per cost
+        self.cost = cost
+        self.count = 1
+        # the cost of the items in this subtree
+        self.total_cost = cost
+        self.priority = priority
+        self.left: Optional[_Node] = None
+        self.right: Optional[_Node] = None
+
+    def update(self) -> None:
+        self.total_cost = self.cost
+        if self.left is not None:
+            self.total_cost += self.left.total_cost
+        if self.right is not None:
+            self.total_cost += self.right.total_cost
+
+
+def _split(node: Optional[_Node], fee_per_cost: float) -> Tuple[Optional[_Node], Optional[_Node]]:
+    """
+    Splits a subtree into the nodes with a fee per cost below fee_per_cost,
+    and the rest
+    """
+    if node is None:
+        return None, None
+    if node.fee_per_cost < fee_per_cost:
+        node.right, right = _split(node.right, fee_per_cost)
+        node.update()
+        return node, right
+    left, node.left = _split(node.left, fee_per_cost)
+    node.update()
+    return left, node
+
+
+def _merge(left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+    """
+    Merges two subtrees, where every fee per cost in left is below every one
+    in right
+    """
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        left.update()
+        return left
+    right.left = _merge(left, right.left)
+    right.update()
+    return right
+
+
+def _remove(node: Optional[_Node], fee_per_cost: float) -> Optional[_Node]:
+    assert node is not None
+    if node.fee_per_cost == fee_per_cost:
+        return _merge(node.left, node.right)
+    if fee_per_cost < node.fee_per_cost:
+        node.left = _remove(node.left, fee_per_cost)
+    else:
+        node.right = _remove(node.right, fee_per_cost)
+    node.update()
+    return node
+
+
+class FeeRateIndex:
+    """
+    The total cost of the mempool items at each fee per cost, in a treap (a
+    randomized balanced binary search tree) ordered by fee per cost. Each node
+    also holds the total cost of its subtree, so finding the lowest fee per
+    cost at which the cheaper items add up to a given cost is logarithmic in
+    the number of distinct fee rates, instead of a walk over the items.
+    """
+
+    _root: Optional[_Node]
+    _rng: random.Random
+
+    def __init__(self) -> None:
+        self._root = None
+        self._rng = random.Random()
+
+    def _path_to(self, fee_per_cost: float) -> Iterator[_Node]:
+        node = self._root
+        while node is not None:
+            yield node
+            if fee_per_cost == node.fee_per_cost:
+                return
+            node = node.left if fee_per_cost < node.fee_per_cost else node.right
+
+    def add(self, fee_per_cost: float, cost: int) -> None:
+        path = list(self._path_to(fee_per_cost))
+        if len(path) > 0 and path[-1].fee_per_cost == fee_per_cost:
+            for node in path:
+                node.total_cost += cost
+            path[-1].cost += cost
+            path[-1].count += 1
+            return
+        left, right = _split(self._root, fee_per_cost)
+        self._root = _merge(_merge(left, _Node(fee_per_cost, cost, self._rng.random())), right)
+
+    def remove(self, fee_per_cost: float, cost: int) -> None:
+        path = list(self._path_to(fee_per_cost))
+        assert len(path) > 0 and path[-1].fee_per_cost == fee_per_cost
+        if path[-1].count > 1:
+            for node in path:
+                node.total_cost -= cost
+            path[-1].cost -= cost
+            path[-1].count -= 1
+            return
+        # this was the last item with this fee per cost, remove its node
+        self._root = _remove(self._root, fee_per_cost)
+
+    @property
+    def total_cost(self) -> int:
+        return 0 if self._root is None else self._root.total_cost
+
+    def min_fee_rate_for(self, cost: int) -> Optional[float]:
+        """
+        Returns the lowest fee per cost such that the items with at most that
+        fee per cost add up to at least cost, or None if all of them don't
+        """
+        node = self._root
+        # the cost of the items with a fee per cost below node's subtree
+        below = 0
+        while node is not None:
+            left_cost = 0 if node.left is None else node.left.total_cost
+            if below + left_cost >= cost:
+                node = node.left
+            elif below + left_cost + node.cost >= cost:
+                return node.fee_per_cost
+            else:
+                below += left_cost + node.cost
+                node = node.right
+        return None
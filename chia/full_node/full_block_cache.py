@@ -0,0 +1,69 @@
+from typing import Any, Dict, Optional
+
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.full_block import FullBlock
+from chia.util.lru_cache import SizedLRUCache
+
+# rough estimate of how much more memory a parsed FullBlock uses than its
+# serialized form. Every field of a parsed block is a separate python object
+PARSED_BLOCK_SIZE_FACTOR = 3
+
+
+class FullBlockCache:
+    """
+    A two-tier cache of full blocks, bounded by a byte budget that's split
+    evenly between the tiers. The serialized tier holds the uncompressed block
+    bytes, which is what we send to peers requesting blocks. The parsed tier
+    holds FullBlock objects, for callers that need to inspect the block. A
+    block is promoted from the serialized tier to the parsed tier the first
+    time it's requested parsed, and vice versa.
+    """
+
+    max_bytes: int
+    serialized: SizedLRUCache
+    parsed: SizedLRUCache
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.serialized = SizedLRUCache(max_bytes // 2)
+        self.parsed = SizedLRUCache(max_bytes - max_bytes // 2)
+
+    def get(self, header_hash: bytes32) -> Optional[FullBlock]:
+        block: Optional[FullBlock] = self.parsed.get(header_hash)
+        if block is not None:
+            return block
+        block_bytes: Optional[bytes] = self.serialized.get(header_hash)
+        if block_bytes is None:
+            return None
+        block = FullBlock.from_bytes(block_bytes)
+        self.parsed.put(header_hash, block, len(block_bytes) * PARSED_BLOCK_SIZE_FACTOR)
+        return block
+
+    def get_bytes(self, header_hash: bytes32) -> Optional[bytes]:
+        block_bytes: Optional[bytes] = self.serialized.get(header_hash)
+        if block_bytes is not None:
+            return block_bytes
+        block: Optional[FullBlock] = self.parsed.get(header_hash)
+        if block is None:
+            return None
+        block_bytes = bytes(block)
+        self.serialized.put(header_hash, block_bytes, len(block_bytes))
+        return block_bytes
+
+    def put(self, header_hash: bytes32, block: FullBlock, block_bytes: bytes) -> None:
+        self.serialized.put(header_hash, block_bytes, len(block_bytes))
+        self.parsed.put(header_hash, block, len(block_bytes) * PARSED_BLOCK_SIZE_FACTOR)
+
+    def put_bytes(self, header_hash: bytes32, block_bytes: bytes) -> None:
+        self.serialized.put(header_hash, block_bytes, len(block_bytes))
+
+    def remove(self, header_hash: bytes32) -> None:
+        self.serialized.remove(header_hash)
+        self.parsed.remove(header_hash)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_bytes": self.max_bytes,
+            "serialized": self.serialized.get_stats(),
+            "parsed": self.parsed.get_stats(),
+        }
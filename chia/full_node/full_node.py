@@ -1,4 +1,5 @@
 import asyncio
+import collections
 import contextlib
 import dataclasses
 import logging
@@ -8,13 +9,14 @@ import random
 import time
 import traceback
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Set, Tuple, Union
 
 import aiosqlite
 import sqlite3
 from blspy import AugSchemeMPL
 
 import chia.server.ws_connection as ws  # lgtm [py/import-and-import-from]
+from chia.consensus.augmented_chain import AugmentedBlockchain
 from chia.consensus.block_creation import unfinished_block_to_full_block
 from chia.consensus.block_record import BlockRecord
 from chia.consensus.blockchain import Blockchain, ReceiveBlockResult
@@ -25,9 +27,23 @@ from chia.consensus.difficulty_adjustment import get_next_sub_slot_iters_and_dif
 from chia.consensus.make_sub_epoch_summary import next_sub_epoch_summary
 from chia.consensus.multiprocess_validation import PreValidationResult
 from chia.consensus.pot_iterations import calculate_sp_iters
+from chia.full_node.block_archive import BlockArchive
+from chia.full_node.block_download import (
+    BlockBatch,
+    BlockDownloader,
+    HeaderBatch,
+    HeaderBlockDownloader,
+    ValidatedHeaders,
+)
 from chia.full_node.block_store import BlockStore
 from chia.full_node.lock_queue import LockQueue, LockClient
-from chia.full_node.bundle_tools import detect_potential_template_generator
+from chia.full_node.mempool import Mempool
+from chia.full_node.mempool_check_conditions import get_name_puzzle_conditions
+from chia.full_node.bundle_tools import (
+    best_solution_generator_from_template,
+    detect_potential_template_generator,
+    simple_solution_generator,
+)
 from chia.full_node.coin_store import CoinStore
 from chia.full_node.full_node_store import FullNodeStore, FullNodeStorePeakResult
 from chia.full_node.hint_store import HintStore
@@ -39,7 +55,6 @@ from chia.protocols import farmer_protocol, full_node_protocol, timelord_protoco
 from chia.protocols.full_node_protocol import (
     RequestBlocks,
     RespondBlock,
-    RespondBlocks,
     RespondSignagePoint,
 )
 from chia.protocols.protocol_message_types import ProtocolMessageTypes
@@ -49,6 +64,7 @@ from chia.server.outbound_message import Message, NodeType, make_msg
 from chia.server.peer_store_resolver import PeerStoreResolver
 from chia.server.server import ChiaServer
 from chia.types.blockchain_format.classgroup import ClassgroupElement
+from chia.types.blockchain_format.coin import Coin
 from chia.types.blockchain_format.pool_target import PoolTarget
 from chia.types.blockchain_format.sized_bytes import bytes32
 from chia.types.blockchain_format.sub_epoch_summary import SubEpochSummary
@@ -56,7 +72,7 @@ from chia.types.blockchain_format.vdf import CompressibleVDFField, VDFInfo, VDFP
 from chia.types.coin_record import CoinRecord
 from chia.types.end_of_slot_bundle import EndOfSubSlotBundle
 from chia.types.full_block import FullBlock
-from chia.types.generator_types import BlockGenerator
+from chia.types.generator_types import BlockGenerator, CompressorArg
 from chia.types.header_block import HeaderBlock
 from chia.types.mempool_inclusion_status import MempoolInclusionStatus
 from chia.types.spend_bundle import SpendBundle
@@ -67,8 +83,9 @@ from chia.util.bech32m import encode_puzzle_hash
 from chia.util.check_fork_next_block import check_fork_next_block
 from chia.util.condition_tools import pkm_pairs
 from chia.util.config import PEER_DB_PATH_KEY_DEPRECATED, process_config_start_method
-from chia.util.db_wrapper import DBWrapper2
+from chia.util.db_wrapper import DBStats, DBWrapper2, timed_connect
 from chia.util.errors import ConsensusError, Err, ValidationError
+from chia.util.generator_tools import get_header_digest
 from chia.util.ints import uint8, uint32, uint64, uint128
 from chia.util.path import mkdir, path_from_root
 from chia.util.safe_cancel_task import cancel_task_safe
@@ -77,6 +94,29 @@ from datetime import datetime
 from chia.util.db_synchronous import db_synchronous_on
 from chia.util.db_version import lookup_db_version, set_db_version_async
 
+# the blocks of a batch being pre-validated, their block records, and the
+# pending pre-validation results
+BatchPreValidation = Tuple[List[FullBlock], List[BlockRecord], "asyncio.Future[List[PreValidationResult]]"]
+
+
+@dataclasses.dataclass(frozen=True)
+class PrecomputedGenerator:
+    """
+    A block generator built ahead of time from the mempool, on top of the last transaction block
+    last_tb_header_hash. It's only valid as long as the mempool and the previous generator it was built
+    from haven't changed.
+    """
+
+    last_tb_header_hash: bytes32
+    mempool: Mempool
+    mempool_version: int
+    previous_generator: Optional[CompressorArg]
+    spend_bundle: SpendBundle
+    additions: List[Coin]
+    removals: List[Coin]
+    block_generator: BlockGenerator
+    npc_result: NPCResult
+
 
 class FullNode:
     block_store: BlockStore
@@ -148,6 +188,10 @@ class FullNode:
         self.peer_sub_counter: Dict[bytes32, int] = {}  # Peer ID: int (subscription count)
         mkdir(self.db_path.parent)
         self._transaction_queue_task = None
+        self._precomputed_generator: Optional[PrecomputedGenerator] = None
+        self._precompute_generator_task: Optional[asyncio.Task] = None
+        # Triggers that come in while waiting are coalesced into one rebuild
+        self.generator_precompute_delay: float = config.get("generator_precompute_delay", 0.2)
 
     def _set_state_changed_callback(self, callback: Callable):
         self.state_changed_callback = callback
@@ -163,7 +207,8 @@ class FullNode:
         # These many respond_transaction tasks can be active at any point in time
         self.respond_transaction_semaphore = asyncio.Semaphore(200)
         # create the store (db) and full node instance
-        db_connection = await aiosqlite.connect(self.db_path)
+        db_stats = DBStats(slow_query_seconds=self.config.get("db_slow_query_seconds", 1.0))
+        db_connection = await timed_connect(self.db_path, db_stats)
         db_version: int = await lookup_db_version(db_connection)
 
         if self.config.get("log_sqlite_cmds", False):
@@ -178,14 +223,23 @@ class FullNode:
 
             await db_connection.set_trace_callback(sql_trace_callback)
 
-        self.db_wrapper = DBWrapper2(db_connection, db_version=db_version)
+        async def connect_reader() -> aiosqlite.Connection:
+            c = await timed_connect(self.db_path, db_stats)
+            if self.config.get("log_sqlite_cmds", False):
+                await c.set_trace_callback(sql_trace_callback)
+            return c
+
+        self.db_wrapper = DBWrapper2(
+            db_connection,
+            db_version=db_version,
+            stats=db_stats,
+            reader_factory=connect_reader,
+            max_read_connections=self.config.get("db_readers_max", 16),
+        )
 
         # add reader threads for the DB
         for i in range(self.config.get("db_readers", 4)):
-            c = await aiosqlite.connect(self.db_path)
-            if self.config.get("log_sqlite_cmds", False):
-                await c.set_trace_callback(sql_trace_callback)
-            await self.db_wrapper.add_connection(c)
+            await self.db_wrapper.add_connection(await connect_reader())
 
         await (await db_connection.execute("pragma journal_mode=wal")).close()
         db_sync = db_synchronous_on(self.config.get("db_sync", "auto"), self.db_path)
@@ -208,10 +262,28 @@ class FullNode:
                             # empty except it has the database_version table
                             pass
 
-        self.block_store = await BlockStore.create(self.db_wrapper)
+        block_archive: Optional[BlockArchive] = None
+        block_archive_path: str = self.config.get("block_archive_path", "")
+        if block_archive_path != "":
+            block_archive_path = block_archive_path.replace("CHALLENGE", self.config["selected_network"])
+            block_archive = BlockArchive(path_from_root(self.root_path, block_archive_path))
+            self.log.info(f"storing blocks in block archive: {block_archive.directory}")
+
+        self.block_store = await BlockStore.create(
+            self.db_wrapper,
+            block_cache_bytes=self.config.get("block_cache_bytes", 100000000),
+            archive=block_archive,
+        )
+        cached_bls.LOCAL_CACHE.resize(self.config.get("bls_pairing_cache_bytes", 40000000))
         self.sync_store = await SyncStore.create()
-        self.hint_store = await HintStore.create(self.db_wrapper)
-        self.coin_store = await CoinStore.create(self.db_wrapper)
+        self.hint_store = await HintStore.create(
+            self.db_wrapper, use_hint_filter=self.config.get("hint_lookup_filter", False)
+        )
+        self.coin_store = await CoinStore.create(
+            self.db_wrapper,
+            unspent_index_bytes=self.config.get("unspent_coin_index_bytes", 0),
+            undo_journal_heights=self.config.get("coin_undo_journal_heights", 100),
+        )
         self.log.info("Initializing blockchain from disk")
         start_time = time.time()
         reserved_cores = self.config.get("reserved_cores", 0)
@@ -228,12 +300,17 @@ class FullNode:
             multiprocessing_context=self.multiprocessing_context,
             single_threaded=single_threaded,
         )
+        mempool_workers: int = self.config.get("mempool_validation_workers", 2)
         self.mempool_manager = MempoolManager(
             coin_store=self.coin_store,
             consensus_constants=self.constants,
             multiprocessing_context=self.multiprocessing_context,
             single_threaded=single_threaded,
+            num_workers=mempool_workers,
+            block_fill_time_budget=self.config.get("block_fill_time_budget", 0.5),
         )
+        if not single_threaded:
+            self.log.info(f"Started {mempool_workers} processes for transaction validation")
 
         # Blocks are validated under high priority, and transactions under low priority. This guarantees blocks will
         # be validated first.
@@ -272,14 +349,14 @@ class FullNode:
                 f"time taken: {int(time_taken)}s"
             )
             async with self._blockchain_lock_high_priority:
-                pending_tx = await self.mempool_manager.new_peak(self.blockchain.get_peak(), [])
+                pending_tx = await self.mempool_manager.new_peak(self.blockchain.get_peak(), None)
             assert len(pending_tx) == 0  # no pending transactions when starting up
 
         peak: Optional[BlockRecord] = self.blockchain.get_peak()
         if peak is not None:
             full_peak = await self.blockchain.get_full_peak()
             mempool_new_peak_result, fns_peak_result = await self.peak_post_processing(
-                full_peak, peak, max(peak.height - 1, 0), None, []
+                full_peak, peak, max(peak.height - 1, 0), None, None
             )
             await self.peak_post_processing_2(
                 full_peak, peak, max(peak.height - 1, 0), None, ([], {}), mempool_new_peak_result, fns_peak_result
@@ -770,6 +847,8 @@ class FullNode:
         # same for mempool_manager
         if hasattr(self, "mempool_manager"):
             self.mempool_manager.shut_down()
+        if hasattr(self, "weight_proof_handler") and self.weight_proof_handler is not None:
+            self.weight_proof_handler.shut_down()
 
         if self.full_node_peers is not None:
             asyncio.create_task(self.full_node_peers.close())
@@ -777,6 +856,8 @@ class FullNode:
             self.uncompact_task.cancel()
         if self._transaction_queue_task is not None:
             self._transaction_queue_task.cancel()
+        if self._precompute_generator_task is not None:
+            self._precompute_generator_task.cancel()
         if hasattr(self, "_blockchain_lock_queue"):
             self._blockchain_lock_queue.close()
         cancel_task_safe(task=self._sync_task, log=self.log)
@@ -784,7 +865,9 @@ class FullNode:
     async def _await_closed(self):
         for task_id, task in list(self.full_node_store.tx_fetch_tasks.items()):
             cancel_task_safe(task, self.log)
+        self.hint_store.close()
         await self.db_wrapper.close()
+        self.block_store.close()
         if self._init_weight_proof is not None:
             await asyncio.wait([self._init_weight_proof])
         if hasattr(self, "_blockchain_lock_queue"):
@@ -814,9 +897,12 @@ class FullNode:
             return None
 
         self.sync_store.set_long_sync(True)
+        self.coin_store.set_undo_journal_enabled(False)
         self.log.debug("long sync started")
         try:
             self.log.info("Starting to perform sync.")
+            # start the weight proof validation workers while we wait
+            self.weight_proof_handler.get_validation_pool()
             self.log.info("Waiting to receive peaks from peers.")
 
             # Wait until we have 3 peaks or up to a max of 30 seconds
@@ -942,64 +1028,109 @@ class FullNode:
         )
         batch_size = self.constants.MAX_BLOCK_COUNT_PER_REQUESTS
 
-        async def fetch_block_batches(batch_queue, peers_with_peak: List[ws.WSChiaConnection]):
+        def get_peers() -> List[ws.WSChiaConnection]:
+            nonlocal peers_with_peak
+            if self.sync_store.peers_changed.is_set():
+                peers_with_peak = self.get_peers_with_peak(peak_hash)
+                self.sync_store.peers_changed.clear()
+            return peers_with_peak
+
+        validated_headers: Optional[ValidatedHeaders] = None
+        if self.config.get("sync_headers_first", False):
+            validated_headers = await self.sync_headers(fork_point_height, target_peak_sb_height, summaries, get_peers)
+        assume_valid = self.get_assume_valid_block(validated_headers)
+
+        async def fetch_block_batches(batch_queue):
+            # several batches are downloaded concurrently, from different peers
+            downloader = BlockDownloader(
+                fork_point_height,
+                target_peak_sb_height,
+                batch_size,
+                get_peers,
+                self.config.get("sync_blocks_in_flight", 8),
+                self.sync_store.peer_sync_stats,
+                validated_headers=validated_headers,
+            )
             try:
-                for start_height in range(fork_point_height, target_peak_sb_height, batch_size):
-                    end_height = min(target_peak_sb_height, start_height + batch_size)
-                    request = RequestBlocks(uint32(start_height), uint32(end_height), True)
-                    fetched = False
-                    for peer in random.sample(peers_with_peak, len(peers_with_peak)):
-                        if peer.closed:
-                            peers_with_peak.remove(peer)
-                            continue
-                        response = await peer.request_blocks(request, timeout=30)
-                        if response is None:
-                            await peer.close()
-                            peers_with_peak.remove(peer)
-                        elif isinstance(response, RespondBlocks):
-                            await batch_queue.put((peer, response.blocks))
-                            fetched = True
-                            break
-                    if fetched is False:
-                        self.log.error(f"failed fetching {start_height} to {end_height} from peers")
-                        await batch_queue.put(None)
-                        return
-                    if self.sync_store.peers_changed.is_set():
-                        peers_with_peak = self.get_peers_with_peak(peak_hash)
-                        self.sync_store.peers_changed.clear()
+                await downloader.run(batch_queue)
             except Exception as e:
-                self.log.error(f"Exception fetching {start_height} to {end_height} from peer {e}")
+                self.log.error(f"Exception fetching blocks from peers: {e}")
             finally:
                 # finished signal with None
                 await batch_queue.put(None)
 
+        advanced_peak = False
+
+        async def add_block_batch(peer, blocks, pre_validation):
+            nonlocal advanced_peak
+            start_height = blocks[0].height
+            end_height = blocks[-1].height
+            success, advanced_peak, fork_height, coin_states = await self.receive_block_batch(
+                blocks,
+                peer,
+                None if advanced_peak else uint32(fork_point_height),
+                summaries,
+                pre_validation,
+                assume_valid,
+            )
+            if success is False:
+                if peer in peers_with_peak:
+                    peers_with_peak.remove(peer)
+                await peer.close(600)
+                raise ValueError(f"Failed to validate block batch {start_height} to {end_height}")
+            self.log.info(f"Added blocks {start_height} to {end_height}")
+            peak = self.blockchain.get_peak()
+            if len(coin_states) > 0 and fork_height is not None:
+                await self.update_wallets(peak.height, fork_height, peak.header_hash, coin_states)
+            await self.send_peak_to_wallets()
+            self.blockchain.clean_block_record(end_height - self.constants.BLOCKS_CACHE_SIZE)
+
         async def validate_block_batches(batch_queue):
-            advanced_peak = False
-            while True:
-                res = await batch_queue.get()
-                if res is None:
-                    self.log.debug("done fetching blocks")
-                    return
-                peer, blocks = res
-                start_height = blocks[0].height
-                end_height = blocks[-1].height
-                success, advanced_peak, fork_height, coin_states = await self.receive_block_batch(
-                    blocks, peer, None if advanced_peak else uint32(fork_point_height), summaries
-                )
-                if success is False:
-                    if peer in peers_with_peak:
-                        peers_with_peak.remove(peer)
-                    await peer.close(600)
-                    raise ValueError(f"Failed to validate block batch {start_height} to {end_height}")
-                self.log.info(f"Added blocks {start_height} to {end_height}")
-                peak = self.blockchain.get_peak()
-                if len(coin_states) > 0 and fork_height is not None:
-                    await self.update_wallets(peak.height, fork_height, peak.header_hash, coin_states)
-                await self.send_peak_to_wallets()
-                self.blockchain.clean_block_record(end_height - self.constants.BLOCKS_CACHE_SIZE)
-
-        batch_queue: asyncio.Queue[Tuple[ws.WSChiaConnection, List[FullBlock]]] = asyncio.Queue(maxsize=buffer_size)
-        fetch_task = asyncio.Task(fetch_block_batches(batch_queue, peers_with_peak))
+            pipeline = self.config.get("sync_pipeline_pre_validation", True)
+            # the next batch, and its pre-validation. It runs in the pool while
+            # the current batch is added to the chain
+            next_batch: Optional[Tuple[Any, Optional[BatchPreValidation]]] = None
+            try:
+                while True:
+                    if next_batch is not None:
+                        res, pre_validation = next_batch
+                        next_batch = None
+                    else:
+                        res = await batch_queue.get()
+                        pre_validation = None
+                    if res is None:
+                        self.log.debug("done fetching blocks")
+                        return
+                    peer, blocks, block_bytes = res
+                    if pre_validation is None:
+                        pre_validation = await self.start_block_batch_pre_validation(
+                            blocks, summaries, (), block_bytes, assume_valid, validated_headers
+                        )
+                    if pipeline and not batch_queue.empty():
+                        # this reads the chain and the database, so it must
+                        # happen before the current batch is added
+                        next_res = batch_queue.get_nowait()
+                        next_pre_validation = None
+                        if next_res is not None:
+                            blocks_to_add, block_records, _ = pre_validation
+                            next_pre_validation = await self.start_block_batch_pre_validation(
+                                next_res[1],
+                                summaries,
+                                list(zip(blocks_to_add, block_records)),
+                                next_res[2],
+                                assume_valid,
+                                validated_headers,
+                            )
+                        next_batch = (next_res, next_pre_validation)
+                    await add_block_batch(peer, blocks, pre_validation)
+            finally:
+                if next_batch is not None and next_batch[1] is not None:
+                    # adding the current batch failed, and the pre-validation
+                    # of the next one was based on it
+                    next_batch[1][2].cancel()
+
+        batch_queue: asyncio.Queue[BlockBatch] = asyncio.Queue(maxsize=buffer_size)
+        fetch_task = asyncio.Task(fetch_block_batches(batch_queue))
         validate_task = asyncio.Task(validate_block_batches(batch_queue))
         try:
             await asyncio.gather(fetch_task, validate_task)
@@ -1008,6 +1139,122 @@ class FullNode:
             fetch_task.cancel()  # no need to cancel validate_task, if we end up here validate_task is already done
             self.log.error(f"sync from fork point failed err: {e}")
 
+    async def sync_headers(
+        self,
+        fork_point_height: uint32,
+        target_peak_sb_height: uint32,
+        summaries: List[SubEpochSummary],
+        get_peers: Callable[[], List[ws.WSChiaConnection]],
+    ) -> ValidatedHeaders:
+        """
+        The first phase of a headers first sync. Downloads the header blocks up
+        to the target peak from all the peers, and validates them (without
+        their transactions) on top of our chain. The blocks are then
+        downloaded and validated against these headers. Raises ValueError if
+        the headers can't be validated up to the target.
+        """
+        self.log.info(f"Syncing headers from fork point at {fork_point_height} up to {target_peak_sb_height}")
+        start_time = time.monotonic()
+        chain = AugmentedBlockchain(self.blockchain)
+        validated_headers = ValidatedHeaders()
+        header_queue: asyncio.Queue[Optional[HeaderBatch]] = asyncio.Queue(maxsize=4)
+        # the batches of headers being validated, oldest first
+        validating: Deque[
+            Tuple[ws.WSChiaConnection, List[HeaderBlock], asyncio.Future[List[PreValidationResult]]]
+        ] = collections.deque()
+
+        async def fetch_headers() -> None:
+            downloader = HeaderBlockDownloader(
+                fork_point_height,
+                target_peak_sb_height,
+                self.constants.MAX_BLOCK_COUNT_PER_REQUESTS,
+                get_peers,
+                self.config.get("sync_blocks_in_flight", 8),
+                self.sync_store.peer_sync_stats,
+            )
+            try:
+                await downloader.run(header_queue)
+            except Exception as e:
+                self.log.error(f"Exception fetching headers from peers: {e}")
+            finally:
+                await header_queue.put(None)
+
+        async def finish_oldest_batch() -> None:
+            peer, header_blocks, pending_results = validating.popleft()
+            results = await pending_results
+            for i, header_block in enumerate(header_blocks):
+                error = results[i].error if i < len(results) else results[0].error
+                if error is not None:
+                    self.log.error(f"Invalid header from peer: {peer.get_peer_logging()} {Err(error)}")
+                    await peer.close(600)
+                    raise ValueError(f"Failed to validate the header at height {header_block.height}")
+                validated_headers.append(header_block.height, header_block.header_hash, get_header_digest(header_block))
+            self.sync_store.set_sync_headers_height(header_blocks[-1].height)
+            elapsed = time.monotonic() - start_time
+            self.log.info(
+                f"Validated headers up to {header_blocks[-1].height} of {target_peak_sb_height} "
+                f"({len(validated_headers) / elapsed:0.1f} headers per second)"
+            )
+
+        fetch_task = asyncio.create_task(fetch_headers())
+        try:
+            while True:
+                res = await header_queue.get()
+                if res is None:
+                    break
+                peer, header_blocks, _ = res
+                header_blocks = [b for b in header_blocks if not self.blockchain.contains_block(b.header_hash)]
+                if len(header_blocks) == 0:
+                    continue
+                # the next batches are validated on top of these records,
+                # before their validation completes. If it fails, so does
+                # the sync
+                block_records, pending_results = await self.blockchain.start_pre_validate_headers(
+                    chain, header_blocks, summaries
+                )
+                for block_record in block_records:
+                    chain.add_extra_block_record(block_record)
+                chain.clean_extra_block_records(header_blocks[-1].height - self.constants.BLOCKS_CACHE_SIZE)
+                validating.append((peer, header_blocks, pending_results))
+                if len(validating) >= 4:
+                    await finish_oldest_batch()
+            while len(validating) > 0:
+                await finish_oldest_batch()
+        finally:
+            fetch_task.cancel()
+            for _, _, pending_results in validating:
+                pending_results.cancel()
+
+        if validated_headers.end_height != target_peak_sb_height:
+            raise ValueError(f"Failed to sync headers up to {target_peak_sb_height}")
+        self.log.info(f"Synced {len(validated_headers)} headers in {time.monotonic() - start_time:0.2f} seconds")
+        return validated_headers
+
+    def get_assume_valid_block(self, validated_headers: Optional[ValidatedHeaders]) -> Optional[Tuple[uint32, bytes32]]:
+        """
+        Returns the height and header hash of the assumed valid block from the
+        config, if it's in the chain we are syncing to. That's only known after
+        syncing the headers first: the validated headers must include it, and
+        every block we add is checked against them, so the blocks below it are
+        its ancestors. Their signatures are not validated during this sync.
+        """
+        height = self.config.get("assume_valid_height")
+        header_hash_str = self.config.get("assume_valid_header_hash")
+        if height is None or header_hash_str is None:
+            return None
+        assume_valid = (uint32(height), bytes32.from_hexstr(header_hash_str))
+        if validated_headers is None:
+            self.log.warning("The assumed valid block requires sync_headers_first, validating all signatures")
+            return None
+        if validated_headers.header_hash(assume_valid[0]) != assume_valid[1]:
+            self.log.info(
+                f"The assumed valid block {assume_valid[1]} at height {assume_valid[0]} is not in the chain we're "
+                "syncing to, validating all signatures"
+            )
+            return None
+        self.log.info(f"Not validating signatures up to the assumed valid block at height {assume_valid[0]}")
+        return assume_valid
+
     async def send_peak_to_wallets(self):
         peak = self.blockchain.get_peak()
         assert peak is not None
@@ -1077,30 +1324,84 @@ class FullNode:
             msg = make_msg(ProtocolMessageTypes.coin_state_update, state)
             await ws_peer.send_message(msg)
 
-    async def receive_block_batch(
+    async def start_block_batch_pre_validation(
         self,
         all_blocks: List[FullBlock],
-        peer: ws.WSChiaConnection,
-        fork_point: Optional[uint32],
         wp_summaries: Optional[List[SubEpochSummary]] = None,
-    ) -> Tuple[bool, bool, Optional[uint32], Tuple[List[CoinRecord], Dict[bytes, Dict[bytes32, CoinRecord]]]]:
-        advanced_peak = False
-        fork_height: Optional[uint32] = uint32(0)
-
+        unapplied_blocks: Sequence[Tuple[FullBlock, BlockRecord]] = (),
+        all_block_bytes: Optional[List[bytes]] = None,
+        assume_valid: Optional[Tuple[uint32, bytes32]] = None,
+        validated_headers: Optional[ValidatedHeaders] = None,
+    ) -> BatchPreValidation:
+        """
+        Starts pre-validating the blocks of a batch that we don't have yet, and
+        returns those blocks, their block records, and a future for the
+        pre-validation results. unapplied_blocks are the blocks of the previous
+        batch (and their records), if it hasn't been added to the chain yet.
+        all_block_bytes may be the serialized blocks, as they were received.
+        Signatures aren't validated for blocks below the assumed valid block,
+        see get_assume_valid_block(). The headers in validated_headers aren't
+        validated again.
+        """
         blocks_to_validate: List[FullBlock] = []
+        block_bytes: Optional[List[bytes]] = None
         for i, block in enumerate(all_blocks):
             if not self.blockchain.contains_block(block.header_hash):
                 blocks_to_validate = all_blocks[i:]
+                if all_block_bytes is not None:
+                    block_bytes = all_block_bytes[i:]
                 break
         if len(blocks_to_validate) == 0:
-            return True, False, fork_height, ([], {})
+            no_results: asyncio.Future[List[PreValidationResult]] = asyncio.get_running_loop().create_future()
+            no_results.set_result([])
+            return [], [], no_results
 
         # Validates signatures in multiprocessing since they take a while, and we don't have cached transactions
         # for these blocks (unlike during normal operation where we validate one at a time)
-        pre_validate_start = time.monotonic()
-        pre_validation_results: List[PreValidationResult] = await self.blockchain.pre_validate_blocks_multiprocessing(
-            blocks_to_validate, {}, wp_summaries=wp_summaries, validate_signatures=True
+        # if the batch reaches the assumed valid block, the signatures of the
+        # blocks from it on are validated in receive_block()
+        validate_signatures = assume_valid is None or blocks_to_validate[0].height >= assume_valid[0]
+        block_records, pending_results = await self.blockchain.start_pre_validate_blocks(
+            blocks_to_validate,
+            {},
+            wp_summaries=wp_summaries,
+            validate_signatures=validate_signatures,
+            unapplied_blocks=unapplied_blocks,
+            block_bytes=block_bytes,
+            header_digests=None
+            if validated_headers is None
+            else [validated_headers.digest(b.height) for b in blocks_to_validate],
         )
+        return blocks_to_validate, block_records, pending_results
+
+    async def receive_block_batch(
+        self,
+        all_blocks: List[FullBlock],
+        peer: ws.WSChiaConnection,
+        fork_point: Optional[uint32],
+        wp_summaries: Optional[List[SubEpochSummary]] = None,
+        pre_validation: Optional[BatchPreValidation] = None,
+        assume_valid: Optional[Tuple[uint32, bytes32]] = None,
+    ) -> Tuple[bool, bool, Optional[uint32], Tuple[List[CoinRecord], Dict[bytes, Dict[bytes32, CoinRecord]]]]:
+        """
+        Pre-validates and adds a batch of blocks. pre_validation may be the
+        result of start_block_batch_pre_validation() for all_blocks, started
+        earlier. The signatures of the blocks below the assume_valid block are
+        not validated.
+        """
+        advanced_peak = False
+        fork_height: Optional[uint32] = uint32(0)
+
+        pre_validate_start = time.monotonic()
+        if pre_validation is None:
+            pre_validation = await self.start_block_batch_pre_validation(
+                all_blocks, wp_summaries, assume_valid=assume_valid
+            )
+        blocks_to_validate, _, pending_results = pre_validation
+        if len(blocks_to_validate) == 0:
+            return True, False, fork_height, ([], {})
+
+        pre_validation_results: List[PreValidationResult] = await pending_results
         pre_validate_end = time.monotonic()
         pre_validate_time = pre_validate_end - pre_validate_start
 
@@ -1115,37 +1416,67 @@ class FullNode:
                     f"Invalid block from peer: {peer.get_peer_logging()} {Err(pre_validation_results[i].error)}"
                 )
                 return False, advanced_peak, fork_height, ([], {})
+            if assume_valid is not None and block.height == assume_valid[0] and block.header_hash != assume_valid[1]:
+                self.log.error(
+                    f"Block {block.header_hash} from peer: {peer.get_peer_logging()} is not the assumed valid block "
+                    f"{assume_valid[1]} at height {block.height}"
+                )
+                return False, advanced_peak, fork_height, ([], {})
 
         # Dicts because deduping
         all_coin_changes: Dict[bytes32, CoinRecord] = {}
         all_hint_changes: Dict[bytes, Dict[bytes32, CoinRecord]] = {}
 
-        for i, block in enumerate(blocks_to_validate):
-            assert pre_validation_results[i].required_iters is not None
-            result, error, fork_height, coin_changes = await self.blockchain.receive_block(
-                block, pre_validation_results[i], None if advanced_peak else fork_point
-            )
-            coin_record_list, hint_records = coin_changes
-
-            # Update all changes
-            for record in coin_record_list:
-                all_coin_changes[record.name] = record
-            for hint, list_of_records in hint_records.items():
-                if hint not in all_hint_changes:
-                    all_hint_changes[hint] = {}
-                for record in list_of_records.values():
-                    all_hint_changes[hint][record.name] = record
-
-            if result == ReceiveBlockResult.NEW_PEAK:
-                advanced_peak = True
-            elif result == ReceiveBlockResult.INVALID_BLOCK or result == ReceiveBlockResult.DISCONNECTED_BLOCK:
-                if error is not None:
-                    self.log.error(f"Error: {error}, Invalid block from peer: {peer.get_peer_logging()} ")
-                return False, advanced_peak, fork_height, ([], {})
-            block_record = self.blockchain.block_record(block.header_hash)
-            if block_record.sub_epoch_summary_included is not None:
-                if self.weight_proof_handler is not None:
-                    await self.weight_proof_handler.create_prev_sub_epoch_segments()
+        # During long sync, all blocks of the batch are added in a single
+        # transaction, to avoid committing once per block. Each block is still
+        # added under its own savepoint, so a failing block only rolls back
+        # itself and the blocks before it are committed.
+        group_commit = self.sync_store.get_long_sync() and self.config.get("sync_group_commit", True)
+        exception: Optional[Exception] = None
+        async with contextlib.AsyncExitStack() as group:
+            if group_commit:
+                await group.enter_async_context(self.db_wrapper.write_db())
+            try:
+                for i, block in enumerate(blocks_to_validate):
+                    assert pre_validation_results[i].required_iters is not None
+                    result, error, fork_height, coin_changes = await self.blockchain.receive_block(
+                        block,
+                        pre_validation_results[i],
+                        None if advanced_peak else fork_point,
+                        validate_signature=assume_valid is None or block.height >= assume_valid[0],
+                    )
+                    coin_record_list, hint_records = coin_changes
+
+                    # Update all changes
+                    for record in coin_record_list:
+                        all_coin_changes[record.name] = record
+                    for hint, list_of_records in hint_records.items():
+                        if hint not in all_hint_changes:
+                            all_hint_changes[hint] = {}
+                        for record in list_of_records.values():
+                            all_hint_changes[hint][record.name] = record
+
+                    if result == ReceiveBlockResult.NEW_PEAK:
+                        advanced_peak = True
+                    elif result == ReceiveBlockResult.INVALID_BLOCK or result == ReceiveBlockResult.DISCONNECTED_BLOCK:
+                        if error is not None:
+                            self.log.error(f"Error: {error}, Invalid block from peer: {peer.get_peer_logging()} ")
+                        return False, advanced_peak, fork_height, ([], {})
+                    block_record = self.blockchain.block_record(block.header_hash)
+                    if block_record.sub_epoch_summary_included is not None:
+                        if self.weight_proof_handler is not None:
+                            await self.weight_proof_handler.create_prev_sub_epoch_segments()
+            except Exception as e:
+                if not group_commit:
+                    raise
+                # the blocks added so far are part of the in-memory state
+                # already, make sure they're committed. When cancelled, the
+                # node is shutting down and the transaction is rolled back
+                # instead of waiting for the commit
+                exception = e
+        if exception is not None:
+            raise exception
+
         if advanced_peak:
             self._state_changed("new_peak")
             self.log.debug(
@@ -1161,6 +1492,7 @@ class FullNode:
         """
         self.log.info("long sync done")
         self.sync_store.set_long_sync(False)
+        self.coin_store.set_undo_journal_enabled(True)
         self.sync_store.set_sync_mode(False)
         self._state_changed("sync_mode")
         if self.server is None:
@@ -1173,7 +1505,7 @@ class FullNode:
             peak_fb: FullBlock = await self.blockchain.get_full_peak()
             if peak is not None:
                 mempool_new_peak_result, fns_peak_result = await self.peak_post_processing(
-                    peak_fb, peak, max(peak.height - 1, 0), None, []
+                    peak_fb, peak, max(peak.height - 1, 0), None, None
                 )
 
                 await self.peak_post_processing_2(
@@ -1264,11 +1596,12 @@ class FullNode:
         record: BlockRecord,
         fork_height: uint32,
         peer: Optional[ws.WSChiaConnection],
-        coin_changes: List[CoinRecord],
+        coin_changes: Optional[List[CoinRecord]],
     ):
         """
         Must be called under self.blockchain.lock. This updates the internal state of the full node with the
-        latest peak information. It also notifies peers about the new peak.
+        latest peak information. It also notifies peers about the new peak. coin_changes is None if the coins
+        that changed since the previous peak aren't known.
         """
         difficulty = self.blockchain.get_next_difficulty(record.header_hash, False)
         sub_slot_iters = self.blockchain.get_next_slot_iters(record.header_hash, False)
@@ -1431,6 +1764,105 @@ class FullNode:
         await self.update_wallets(record.height, fork_height, record.header_hash, coin_changes)
         await self.server.send_to_all([msg], NodeType.WALLET)
         self._state_changed("new_peak")
+        self.schedule_generator_precomputation()
+
+    def get_precomputed_generator(self, last_tb_header_hash: bytes32) -> Optional[PrecomputedGenerator]:
+        """
+        Returns the block generator built in the background for a block on top of last_tb_header_hash, if it's
+        still up to date with the mempool
+        """
+        precomputed = self._precomputed_generator
+        if (
+            precomputed is None
+            or precomputed.last_tb_header_hash != last_tb_header_hash
+            or precomputed.mempool is not self.mempool_manager.mempool
+            or precomputed.mempool_version != self.mempool_manager.mempool.version
+            or precomputed.previous_generator != self.full_node_store.previous_generator
+        ):
+            return None
+        return precomputed
+
+    async def get_block_generator(self, last_tb_header_hash: bytes32) -> Optional[PrecomputedGenerator]:
+        """
+        Returns the block generator for a block on top of last_tb_header_hash. It's the one built in the background
+        when it's still up to date, otherwise it's built now. Returns None if there is nothing to include.
+        """
+        precomputed = self.get_precomputed_generator(last_tb_header_hash)
+        if precomputed is not None:
+            return precomputed
+        try:
+            return await self._build_generator(last_tb_header_hash)
+        except Exception as e:
+            self.log.error(f"Traceback: {traceback.format_exc()}")
+            self.log.error(f"Error making the block generator {e}")
+            return None
+
+    async def _build_generator(self, last_tb_header_hash: bytes32) -> Optional[PrecomputedGenerator]:
+        mempool = self.mempool_manager.mempool
+        mempool_version = mempool.version
+        previous_generator = self.full_node_store.previous_generator
+        mempool_bundle = await self.mempool_manager.create_bundle_from_mempool(last_tb_header_hash)
+        if mempool_bundle is None:
+            return None
+        spend_bundle, additions, removals = mempool_bundle
+        if previous_generator is not None:
+            self.log.info(f"Using previous generator for height {previous_generator}")
+
+        def build() -> Tuple[BlockGenerator, NPCResult]:
+            if previous_generator is not None:
+                block_generator = best_solution_generator_from_template(previous_generator, spend_bundle)
+            else:
+                block_generator = simple_solution_generator(spend_bundle)
+            npc_result = get_name_puzzle_conditions(
+                block_generator,
+                self.constants.MAX_BLOCK_COST_CLVM,
+                cost_per_byte=self.constants.COST_PER_BYTE,
+                mempool_mode=True,
+            )
+            return block_generator, npc_result
+
+        block_generator, npc_result = await asyncio.get_running_loop().run_in_executor(None, build)
+        generator = PrecomputedGenerator(
+            last_tb_header_hash,
+            mempool,
+            mempool_version,
+            previous_generator,
+            spend_bundle,
+            additions,
+            removals,
+            block_generator,
+            npc_result,
+        )
+        self._precomputed_generator = generator
+        return generator
+
+    def schedule_generator_precomputation(self) -> None:
+        """
+        Rebuilds the precomputed block generator in the background, after the peak or the mempool changed. The
+        rebuild starts generator_precompute_delay seconds later, so a burst of changes only causes one, and a
+        rebuild that is already running picks up the changes when it finishes.
+        """
+        if self._shut_down or self.sync_store.get_sync_mode():
+            return
+        if self._precompute_generator_task is None or self._precompute_generator_task.done():
+            self._precompute_generator_task = asyncio.create_task(self._precompute_generator())
+
+    async def _precompute_generator(self) -> None:
+        try:
+            while not self._shut_down:
+                await asyncio.sleep(self.generator_precompute_delay)
+                peak: Optional[BlockRecord] = self.mempool_manager.peak
+                if peak is None:
+                    return
+                if self.get_precomputed_generator(peak.header_hash) is not None:
+                    return
+                if await self._build_generator(peak.header_hash) is None:
+                    self._precomputed_generator = None
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.log.error(f"Error precomputing the block generator: {traceback.format_exc()}")
 
     async def respond_block(
         self,
@@ -2105,6 +2537,7 @@ class FullNode:
                 else:
                     await self.server.send_to_all_except([msg], NodeType.FULL_NODE, peer.peer_node_id)
                 self.not_dropped_tx += 1
+                self.schedule_generator_precomputation()
             else:
                 self.mempool_manager.remove_seen(spend_name)
                 self.log.debug(
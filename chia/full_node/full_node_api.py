@@ -1,7 +1,6 @@
 import asyncio
 import dataclasses
 import time
-import traceback
 from secrets import token_bytes
 from typing import Dict, List, Optional, Tuple, Set
 
@@ -11,8 +10,8 @@ from chiabip158 import PyBIP158
 import chia.server.ws_connection as ws
 from chia.consensus.block_creation import create_unfinished_block
 from chia.consensus.block_record import BlockRecord
+from chia.consensus.cost_calculator import NPCResult
 from chia.consensus.pot_iterations import calculate_ip_iters, calculate_iterations_quality, calculate_sp_iters
-from chia.full_node.bundle_tools import best_solution_generator_from_template, simple_solution_generator
 from chia.full_node.full_node import FullNode
 from chia.full_node.mempool_check_conditions import get_puzzle_and_solution_for_coin
 from chia.full_node.signage_point import SignagePoint
@@ -737,6 +736,7 @@ class FullNodeAPI:
             # Grab best transactions from Mempool for given tip target
             aggregate_signature: G2Element = G2Element()
             block_generator: Optional[BlockGenerator] = None
+            npc_result: Optional[NPCResult] = None
             additions: Optional[List[Coin]] = []
             removals: Optional[List[Coin]] = []
             async with self.full_node._blockchain_lock_high_priority:
@@ -746,30 +746,14 @@ class FullNodeAPI:
                     curr_l_tb: BlockRecord = peak
                     while not curr_l_tb.is_transaction_block:
                         curr_l_tb = self.full_node.blockchain.block_record(curr_l_tb.prev_hash)
-                    try:
-                        mempool_bundle = await self.full_node.mempool_manager.create_bundle_from_mempool(
-                            curr_l_tb.header_hash
-                        )
-                    except Exception as e:
-                        self.log.error(f"Traceback: {traceback.format_exc()}")
-                        self.full_node.log.error(f"Error making spend bundle {e} peak: {peak}")
-                        mempool_bundle = None
-                    if mempool_bundle is not None:
-                        spend_bundle = mempool_bundle[0]
-                        additions = mempool_bundle[1]
-                        removals = mempool_bundle[2]
+                    generator = await self.full_node.get_block_generator(curr_l_tb.header_hash)
+                    if generator is not None:
+                        additions = generator.additions
+                        removals = generator.removals
                         self.full_node.log.info(f"Add rem: {len(additions)} {len(removals)}")
-                        aggregate_signature = spend_bundle.aggregated_signature
-                        if self.full_node.full_node_store.previous_generator is not None:
-                            self.log.info(
-                                f"Using previous generator for height "
-                                f"{self.full_node.full_node_store.previous_generator}"
-                            )
-                            block_generator = best_solution_generator_from_template(
-                                self.full_node.full_node_store.previous_generator, spend_bundle
-                            )
-                        else:
-                            block_generator = simple_solution_generator(spend_bundle)
+                        aggregate_signature = generator.spend_bundle.aggregated_signature
+                        block_generator = generator.block_generator
+                        npc_result = generator.npc_result
 
             def get_plot_sig(to_sign, _) -> G2Element:
                 if to_sign == request.challenge_chain_sp:
@@ -912,6 +896,7 @@ class FullNodeAPI:
                 removals,
                 prev_b,
                 finished_sub_slots,
+                npc_result,
             )
             self.log.info("Made the unfinished block")
             if prev_b is not None:
@@ -1400,12 +1385,10 @@ class FullNodeAPI:
         if peer.peer_node_id not in self.full_node.peer_sub_counter:
             self.full_node.peer_sub_counter[peer.peer_node_id] = 0
 
-        hint_coin_ids = []
+        hint_coin_ids = await self.full_node.hint_store.get_coin_ids_multi(request.puzzle_hashes)
         # Add peer to the "Subscribed" dictionary
         max_items = self.full_node.config.get("max_subscribe_items", 200000)
         for puzzle_hash in request.puzzle_hashes:
-            ph_hint_coins = await self.full_node.hint_store.get_coin_ids(puzzle_hash)
-            hint_coin_ids.extend(ph_hint_coins)
             if puzzle_hash not in self.full_node.ph_subscriptions:
                 self.full_node.ph_subscriptions[puzzle_hash] = set()
             if (
@@ -1,18 +1,47 @@
-from typing import List, Tuple
+import asyncio
+from typing import List, Optional, Tuple
 from chia.types.blockchain_format.sized_bytes import bytes32
-from chia.util.db_wrapper import DBWrapper2
+from chia.util.bloom_filter import BloomFilter
+from chia.util.db_wrapper import DBWrapper2, fetch_many
+from chia.util.safe_cancel_task import cancel_task_safe
 import logging
 
 log = logging.getLogger(__name__)
 
+# the hint filter is sized for this many bits per hint it can hold. When more
+# hints than that are added, it's rebuilt in the background with room for
+# twice as many
+FILTER_BITS_PER_HINT = 20
+FILTER_MIN_HINTS = 1000000
+
 
 class HintStore:
     db_wrapper: DBWrapper2
+    # every hint in the store is added to this filter. Most hints wallets ask
+    # about don't have any coins, the filter lets us skip looking those up in
+    # the DB. None if the filter is disabled
+    hint_filter: Optional[BloomFilter]
+    # the number of hints the filter is sized for, and the (upper bound of
+    # the) number of hints in it
+    _filter_capacity: int
+    _filter_count: int
+    # while the filter is rebuilt, the filter that will replace it, and the
+    # number of hints added to it other than by reading the DB. New hints are
+    # added to both filters
+    _next_filter: Optional[BloomFilter]
+    _next_count: int
+    _rebuild_task: Optional[asyncio.Task]
 
     @classmethod
-    async def create(cls, db_wrapper: DBWrapper2):
+    async def create(cls, db_wrapper: DBWrapper2, use_hint_filter: bool = False):
         self = cls()
         self.db_wrapper = db_wrapper
+        self.hint_filter = None
+        self._filter_capacity = 0
+        self._filter_count = 0
+        self._next_filter = None
+        self._next_count = 0
+        self._rebuild_task = None
 
         async with self.db_wrapper.write_db() as conn:
             if self.db_wrapper.db_version == 2:
@@ -22,19 +51,89 @@ class HintStore:
                     "CREATE TABLE IF NOT EXISTS hints(id INTEGER PRIMARY KEY AUTOINCREMENT, coin_id blob, hint blob)"
                 )
             await conn.execute("CREATE INDEX IF NOT EXISTS hint_index on hints(hint)")
+
+        if use_hint_filter:
+            capacity = max(await self.count_hints() * 2, FILTER_MIN_HINTS)
+            hint_filter = BloomFilter(capacity * FILTER_BITS_PER_HINT)
+            self._filter_count = await self._load_hints(hint_filter)
+            self._filter_capacity = capacity
+            self.hint_filter = hint_filter
         return self
 
+    def close(self) -> None:
+        cancel_task_safe(self._rebuild_task, log)
+
+    async def _load_hints(self, hint_filter: BloomFilter) -> int:
+        """
+        Adds every hint in the DB to hint_filter, and returns how many there are
+        """
+        count = 0
+        async with self.db_wrapper.read_db() as conn:
+            async with conn.execute("SELECT hint FROM hints") as cursor:
+                while True:
+                    rows = list(await cursor.fetchmany(10000))
+                    if len(rows) == 0:
+                        break
+                    for row in rows:
+                        hint_filter.add(row[0])
+                    count += len(rows)
+        return count
+
+    async def _rebuild_hint_filter(self, capacity: int) -> None:
+        assert self._next_filter is not None
+        try:
+            # hints added by a write transaction that's still open were only
+            # added to the old filter. Wait for it to end, the hints are then
+            # either committed, and read below, or rolled back
+            async with self.db_wrapper.write_db():
+                pass
+            count = await self._load_hints(self._next_filter)
+            self.hint_filter = self._next_filter
+            self._filter_capacity = capacity
+            self._filter_count = count + self._next_count
+            log.info(f"rebuilt hint filter with room for {capacity} hints")
+        except Exception:
+            log.exception("failed to rebuild the hint filter")
+        finally:
+            self._next_filter = None
+            self._rebuild_task = None
+
     async def get_coin_ids(self, hint: bytes) -> List[bytes32]:
+        return await self.get_coin_ids_multi([hint])
+
+    async def get_coin_ids_multi(self, hints: List[bytes]) -> List[bytes32]:
+        """
+        Returns the IDs of the coins with any of the specified hints
+        """
+        if self.hint_filter is not None:
+            hint_filter = self.hint_filter
+            hints = [h for h in hints if hint_filter.might_contain(h)]
+
         async with self.db_wrapper.read_db() as conn:
-            cursor = await conn.execute("SELECT coin_id from hints WHERE hint=?", (hint,))
-            rows = await cursor.fetchall()
-            await cursor.close()
-        coin_ids = []
-        for row in rows:
-            coin_ids.append(row[0])
-        return coin_ids
+            rows = await fetch_many(conn, "SELECT coin_id from hints WHERE hint in ({})", hints)
+        return [bytes32(row[0]) for row in rows]
 
     async def add_hints(self, coin_hint_list: List[Tuple[bytes32, bytes]]) -> None:
+        # the hints are added to the filter before they're written to the DB,
+        # so there's no window where a lookup could miss them. If the
+        # transaction is rolled back, they're just false positives
+        if self.hint_filter is not None:
+            self._filter_count += len(coin_hint_list)
+            if self._next_filter is None and self._filter_count > self._filter_capacity:
+                # the filter is full, its false positive rate goes up with
+                # every hint added. The caller may hold the write transaction,
+                # so the new filter is read from the DB in the background
+                log.info(f"rebuilding hint filter, it's sized for {self._filter_capacity} hints")
+                capacity = max(self._filter_count * 2, FILTER_MIN_HINTS)
+                self._next_filter = BloomFilter(capacity * FILTER_BITS_PER_HINT)
+                self._next_count = 0
+                self._rebuild_task = asyncio.create_task(self._rebuild_hint_filter(capacity))
+            for _, hint in coin_hint_list:
+                self.hint_filter.add(hint)
+            if self._next_filter is not None:
+                for _, hint in coin_hint_list:
+                    self._next_filter.add(hint)
+                self._next_count += len(coin_hint_list)
         async with self.db_wrapper.write_db() as conn:
             if self.db_wrapper.db_version == 2:
                 cursor = await conn.executemany(
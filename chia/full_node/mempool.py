@@ -2,6 +2,7 @@ from typing import Dict, List
 
 from sortedcontainers import SortedDict
 
+from chia.full_node.fee_rate_index import FeeRateIndex
 from chia.types.blockchain_format.coin import Coin
 from chia.types.blockchain_format.sized_bytes import bytes32
 from chia.types.mempool_item import MempoolItem
@@ -11,10 +12,14 @@ class Mempool:
     def __init__(self, max_size_in_cost: int):
         self.spends: Dict[bytes32, MempoolItem] = {}
         self.sorted_spends: SortedDict = SortedDict()
+        # the cost of the spends by fee per cost, see get_min_fee_rate()
+        self.fee_rate_index: FeeRateIndex = FeeRateIndex()
         self.additions: Dict[bytes32, MempoolItem] = {}
         self.removals: Dict[bytes32, MempoolItem] = {}
         self.max_size_in_cost: int = max_size_in_cost
         self.total_mempool_cost: int = 0
+        # incremented on every change to the spends, so that the block templates built from them can be cached
+        self.version: int = 0
 
     def get_min_fee_rate(self, cost: int) -> float:
         """
@@ -22,15 +27,11 @@ class Mempool:
         """
 
         if self.at_full_capacity(cost):
-            current_cost = self.total_mempool_cost
-
-            # Iterates through all spends in increasing fee per cost
-            for fee_per_cost, spends_with_fpc in self.sorted_spends.items():
-                for spend_name, item in spends_with_fpc.items():
-                    current_cost -= item.cost
-                    # Removing one at a time, until our transaction of size cost fits
-                    if current_cost + cost <= self.max_size_in_cost:
-                        return fee_per_cost
+            # The fee per cost up to which spends need to be removed (in increasing fee per cost), until our
+            # transaction of size cost fits
+            fee_per_cost = self.fee_rate_index.min_fee_rate_for(self.total_mempool_cost + cost - self.max_size_in_cost)
+            if fee_per_cost is not None:
+                return fee_per_cost
             raise ValueError(
                 f"Transaction with cost {cost} does not fit in mempool of max cost {self.max_size_in_cost}"
             )
@@ -52,8 +53,10 @@ class Mempool:
         dic = self.sorted_spends[item.fee_per_cost]
         if len(dic.values()) == 0:
             del self.sorted_spends[item.fee_per_cost]
+        self.fee_rate_index.remove(item.fee_per_cost, item.cost)
         self.total_mempool_cost -= item.cost
         assert self.total_mempool_cost >= 0
+        self.version += 1
 
     def add_to_pool(
         self,
@@ -66,7 +69,7 @@ class Mempool:
         while self.at_full_capacity(item.cost):
             # Val is Dict[hash, MempoolItem]
             fee_per_cost, val = self.sorted_spends.peekitem(index=0)
-            to_remove = list(val.values())[0]
+            to_remove = next(iter(val.values()))
             self.remove_from_pool(to_remove)
 
         self.spends[item.name] = item
@@ -76,12 +79,21 @@ class Mempool:
             self.sorted_spends[item.fee_per_cost] = {}
 
         self.sorted_spends[item.fee_per_cost][item.name] = item
+        self.fee_rate_index.add(item.fee_per_cost, item.cost)
 
         for add in item.additions:
             self.additions[add.name()] = item
         for coin in item.removals:
             self.removals[coin.name()] = item
         self.total_mempool_cost += item.cost
+        self.version += 1
+
+    def items_by_fee_per_cost(self) -> List[MempoolItem]:
+        """
+        Returns the items in the mempool, by decreasing fee per cost.
+        """
+
+        return [item for dic in reversed(self.sorted_spends.values()) for item in dic.values()]
 
     def at_full_capacity(self, cost: int) -> bool:
         """
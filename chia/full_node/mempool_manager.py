@@ -6,7 +6,7 @@ from multiprocessing.context import BaseContext
 import time
 from concurrent.futures.process import ProcessPoolExecutor
 from chia.util.inline_executor import InlineExecutor
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Callable, Dict, List, Optional, Set, Tuple
 from blspy import GTElement
 from chiabip158 import PyBIP158
 
@@ -38,6 +38,16 @@ from chia.full_node.mempool_check_conditions import mempool_check_time_locks
 log = logging.getLogger(__name__)
 
 
+def has_time_locks(npc_result: NPCResult) -> bool:
+    """
+    Whether the conditions of a spend bundle include any height or time lock
+    """
+    assert npc_result.conds is not None
+    if npc_result.conds.height_absolute > 0 or npc_result.conds.seconds_absolute > 0:
+        return True
+    return any(spend.height_relative is not None or spend.seconds_relative > 0 for spend in npc_result.conds.spends)
+
+
 def validate_clvm_and_signature(
     spend_bundle_bytes: bytes, max_cost: int, cost_per_byte: int, additional_data: bytes
 ) -> Tuple[Optional[Err], bytes, Dict[bytes, bytes]]:
@@ -77,6 +87,19 @@ def validate_clvm_and_signature(
     return None, bytes(result), new_cache_entries
 
 
+def validate_clvm_and_signature_batch(
+    spend_bundles_bytes: List[bytes], max_cost: int, cost_per_byte: int, additional_data: bytes
+) -> List[Tuple[Optional[Err], bytes, Dict[bytes, bytes]]]:
+    """
+    Runs validate_clvm_and_signature() on several spendbundles, so that they're sent to a worker process as a
+    single job
+    """
+    return [
+        validate_clvm_and_signature(spend_bundle_bytes, max_cost, cost_per_byte, additional_data)
+        for spend_bundle_bytes in spend_bundles_bytes
+    ]
+
+
 class MempoolManager:
     pool: Executor
 
@@ -87,6 +110,8 @@ class MempoolManager:
         multiprocessing_context: Optional[BaseContext] = None,
         *,
         single_threaded: bool = False,
+        num_workers: int = 2,
+        block_fill_time_budget: float = 0.5,
     ):
         self.constants: ConsensusConstants = consensus_constants
 
@@ -102,6 +127,9 @@ class MempoolManager:
         self.nonzero_fee_minimum_fpc = 5
 
         self.limit_factor = 0.5
+        # The number of seconds that creating a block is allowed to spend looking for smaller items that still fit,
+        # after the first item that doesn't
+        self.block_fill_time_budget = block_fill_time_budget
         self.mempool_max_total_cost = int(self.constants.MAX_BLOCK_COST_CLVM * self.constants.MEMPOOL_BLOCK_BUFFER)
 
         # Transactions that were unable to enter mempool, used for retry. (they were invalid)
@@ -111,17 +139,38 @@ class MempoolManager:
             self.pool = InlineExecutor()
         else:
             self.pool = ProcessPoolExecutor(
-                max_workers=2,
+                max_workers=num_workers,
                 mp_context=multiprocessing_context,
                 initializer=setproctitle,
                 initargs=(f"{getproctitle()}_worker",),
             )
+        self.num_workers = num_workers
+
+        # Spendbundles are pre-validated in batches: the ones received within this many seconds of each other are
+        # split evenly between the workers, with one job per worker
+        self.pre_validation_batch_delay = 0.005
+        self._pre_validation_batch: List[Tuple[bytes, asyncio.Future]] = []
+        self._pre_validation_task: Optional[asyncio.Task] = None
+        self._pre_validation_jobs: Set[asyncio.Task] = set()
 
         # The mempool will correspond to a certain peak
         self.peak: Optional[BlockRecord] = None
         self.mempool: Mempool = Mempool(self.mempool_max_total_cost)
 
+        # The last result of create_bundle_from_mempool(), with the peak hash, mempool and mempool version it was
+        # created from
+        self._block_template: Optional[
+            Tuple[bytes32, Mempool, int, Optional[Tuple[SpendBundle, List[Coin], List[Coin]]]]
+        ] = None
+
     def shut_down(self):
+        if self._pre_validation_task is not None:
+            self._pre_validation_task.cancel()
+        for job in self._pre_validation_jobs:
+            job.cancel()
+        for _, future in self._pre_validation_batch:
+            future.cancel()
+        self._pre_validation_batch = []
         self.pool.shutdown(wait=True)
 
     async def create_bundle_from_mempool(
@@ -134,34 +183,53 @@ class MempoolManager:
         if self.peak is None or self.peak.header_hash != last_tb_header_hash:
             return None
 
+        # The template only changes with the peak and the mempool, so it's reused between signage points
+        if self._block_template is not None:
+            header_hash, mempool, version, result = self._block_template
+            if header_hash == last_tb_header_hash and mempool is self.mempool and version == self.mempool.version:
+                return result
+        # The items are picked and aggregated in a thread, from a snapshot of the mempool
+        mempool, version = self.mempool, self.mempool.version
+        items = mempool.items_by_fee_per_cost()
+        result = await asyncio.get_running_loop().run_in_executor(None, self.create_block_template, items)
+        self._block_template = (last_tb_header_hash, mempool, version, result)
+        return result
+
+    def create_block_template(
+        self, items: List[MempoolItem], clock: Callable[[], float] = time.monotonic
+    ) -> Optional[Tuple[SpendBundle, List[Coin], List[Coin]]]:
+        """
+        Picks the items to include in a block, from items by decreasing fee per cost. Items that don't fit are
+        skipped, and the following (smaller) ones are tried, for up to block_fill_time_budget seconds (as measured
+        by clock) after the first skip
+        """
+        max_cost = self.limit_factor * self.constants.MAX_BLOCK_COST_CLVM
         cost_sum = 0  # Checks that total cost does not exceed block maximum
         fee_sum = 0  # Checks that total fees don't exceed 64 bits
         spend_bundles: List[SpendBundle] = []
         removals = []
         additions = []
-        broke_from_inner_loop = False
+        skipped = 0
+        deadline: Optional[float] = None
         log.info(f"Starting to make block, max cost: {self.constants.MAX_BLOCK_COST_CLVM}")
-        for dic in reversed(self.mempool.sorted_spends.values()):
-            if broke_from_inner_loop:
+        for item in items:
+            if cost_sum >= max_cost or (deadline is not None and clock() > deadline):
                 break
-            for item in dic.values():
+            if item.cost + cost_sum <= max_cost and item.fee + fee_sum <= self.constants.MAX_COIN_AMOUNT:
                 log.info(f"Cumulative cost: {cost_sum}, fee per cost: {item.fee / item.cost}")
-                if (
-                    item.cost + cost_sum <= self.limit_factor * self.constants.MAX_BLOCK_COST_CLVM
-                    and item.fee + fee_sum <= self.constants.MAX_COIN_AMOUNT
-                ):
-                    spend_bundles.append(item.spend_bundle)
-                    cost_sum += item.cost
-                    fee_sum += item.fee
-                    removals.extend(item.removals)
-                    additions.extend(item.additions)
-                else:
-                    broke_from_inner_loop = True
-                    break
+                spend_bundles.append(item.spend_bundle)
+                cost_sum += item.cost
+                fee_sum += item.fee
+                removals.extend(item.removals)
+                additions.extend(item.additions)
+            else:
+                skipped += 1
+                if deadline is None:
+                    deadline = clock() + self.block_fill_time_budget
         if len(spend_bundles) > 0:
             log.info(
                 f"Cumulative cost of block (real cost should be less) {cost_sum}. Proportion "
-                f"full: {cost_sum / self.constants.MAX_BLOCK_COST_CLVM}"
+                f"full: {cost_sum / self.constants.MAX_BLOCK_COST_CLVM}, skipped {skipped} items that didn't fit"
             )
             agg = SpendBundle.aggregate(spend_bundles)
             return agg, additions, removals
@@ -258,20 +326,18 @@ class MempoolManager:
     ) -> NPCResult:
         """
         Errors are included within the cached_result.
-        This runs in another process so we don't block the main thread
+        This runs in another process so we don't block the main thread, batched with the other spendbundles
+        received at the same time
         """
         start_time = time.time()
         if new_spend_bytes is None:
             new_spend_bytes = bytes(new_spend)
 
-        err, cached_result_bytes, new_cache_entries = await asyncio.get_running_loop().run_in_executor(
-            self.pool,
-            validate_clvm_and_signature,
-            new_spend_bytes,
-            int(self.limit_factor * self.constants.MAX_BLOCK_COST_CLVM),
-            self.constants.COST_PER_BYTE,
-            self.constants.AGG_SIG_ME_ADDITIONAL_DATA,
-        )
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._pre_validation_batch.append((new_spend_bytes, future))
+        if self._pre_validation_task is None or self._pre_validation_task.done():
+            self._pre_validation_task = asyncio.create_task(self._pre_validate_batches())
+        err, cached_result_bytes, new_cache_entries = await future
 
         if err is not None:
             raise ValidationError(err)
@@ -282,6 +348,43 @@ class MempoolManager:
         log.debug(f"pre_validate_spendbundle took {end_time - start_time:0.4f} seconds for {spend_name}")
         return ret
 
+    async def _pre_validate_batches(self) -> None:
+        """
+        Sends the spendbundles waiting for pre-validation to the workers, until there are none left
+        """
+        while len(self._pre_validation_batch) > 0:
+            await asyncio.sleep(self.pre_validation_batch_delay)
+            batch = self._pre_validation_batch
+            self._pre_validation_batch = []
+            chunk_size = -(-len(batch) // self.num_workers)
+            for i in range(0, len(batch), chunk_size):
+                job = asyncio.create_task(self._pre_validate_chunk(batch[i : i + chunk_size]))
+                self._pre_validation_jobs.add(job)
+                job.add_done_callback(self._pre_validation_jobs.discard)
+
+    async def _pre_validate_chunk(self, chunk: List[Tuple[bytes, asyncio.Future]]) -> None:
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.pool,
+                validate_clvm_and_signature_batch,
+                [spend_bytes for spend_bytes, _ in chunk],
+                int(self.limit_factor * self.constants.MAX_BLOCK_COST_CLVM),
+                self.constants.COST_PER_BYTE,
+                self.constants.AGG_SIG_ME_ADDITIONAL_DATA,
+            )
+        except asyncio.CancelledError:
+            for _, future in chunk:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future in chunk:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(chunk, results):
+            if not future.done():
+                future.set_result(result)
+
     async def add_spendbundle(
         self,
         new_spend: SpendBundle,
@@ -514,10 +617,12 @@ class MempoolManager:
         return None
 
     async def new_peak(
-        self, new_peak: Optional[BlockRecord], coin_changes: List[CoinRecord]
+        self, new_peak: Optional[BlockRecord], coin_changes: Optional[List[CoinRecord]]
     ) -> List[Tuple[SpendBundle, NPCResult, bytes32]]:
         """
-        Called when a new peak is available, we try to recreate a mempool for the new tip.
+        Called when a new peak is available, we try to recreate a mempool for the new tip. coin_changes are the
+        coins whose state changed since the previous peak, or None if they're not known (e.g. after a long sync),
+        in which case every item is validated again.
         """
         if new_peak is None:
             return []
@@ -527,10 +632,11 @@ class MempoolManager:
             return []
         assert new_peak.timestamp is not None
 
+        old_peak = self.peak
         use_optimization: bool = self.peak is not None and new_peak.prev_transaction_block_hash == self.peak.header_hash
         self.peak = new_peak
 
-        if use_optimization:
+        if use_optimization and coin_changes is not None:
             # We don't reinitialize a mempool, just kick removed items
             for coin_record in coin_changes:
                 if coin_record.name in self.mempool.removals:
@@ -538,9 +644,16 @@ class MempoolManager:
                     self.mempool.remove_from_pool(item)
                     self.remove_seen(item.spend_bundle_name)
         else:
-            old_pool = self.mempool
-            self.mempool = Mempool(self.mempool_max_total_cost)
-            for item in old_pool.spends.values():
+            if coin_changes is None or old_peak is None:
+                items_to_revalidate = list(self.mempool.spends.values())
+                self.mempool = Mempool(self.mempool_max_total_cost)
+            else:
+                # On a reorg, only the items spending coins that changed, and the items with time locks (if the
+                # new peak is lower or earlier), can have become invalid. The rest are kept as they are
+                items_to_revalidate = self.get_items_affected_by_reorg(old_peak, new_peak, coin_changes)
+                for item in items_to_revalidate:
+                    self.mempool.remove_from_pool(item)
+            for item in items_to_revalidate:
                 _, result, _ = await self.add_spendbundle(
                     item.spend_bundle, item.npc_result, item.spend_bundle_name, item.program
                 )
@@ -564,6 +677,28 @@ class MempoolManager:
         )
         return txs_added
 
+    def get_items_affected_by_reorg(
+        self, old_peak: BlockRecord, new_peak: BlockRecord, coin_changes: List[CoinRecord]
+    ) -> List[MempoolItem]:
+        """
+        Returns the items that need to be validated again when the peak moves from old_peak to new_peak, where
+        coin_changes are the coins whose state changed between them
+        """
+        items: Dict[bytes32, MempoolItem] = {}
+        for coin_record in coin_changes:
+            item = self.mempool.removals.get(coin_record.name)
+            if item is not None:
+                items[item.name] = item
+
+        assert old_peak.timestamp is not None and new_peak.timestamp is not None
+        # time locks only pass at a later height or time, so they can only fail if the peak moved back (both
+        # peaks are transaction blocks)
+        if new_peak.height < old_peak.height or new_peak.timestamp < old_peak.timestamp:
+            for item in self.mempool.spends.values():
+                if item.name not in items and has_time_locks(item.npc_result):
+                    items[item.name] = item
+        return list(items.values())
+
     async def get_items_not_in_filter(self, mempool_filter: PyBIP158, limit: int = 100) -> List[MempoolItem]:
         items: List[MempoolItem] = []
         counter = 0
@@ -3,6 +3,7 @@ import logging
 from collections import OrderedDict as orderedDict
 from typing import Dict, List, Optional, OrderedDict, Set, Tuple
 
+from chia.full_node.block_download import PeerSyncStats
 from chia.types.blockchain_format.sized_bytes import bytes32
 from chia.util.ints import uint32, uint128
 
@@ -17,9 +18,11 @@ class SyncStore:
     peer_to_peak: Dict[bytes32, Tuple[bytes32, uint32, uint128]]  # peer node id : [header_hash, height, weight]
     sync_target_header_hash: Optional[bytes32]  # Peak hash we are syncing towards
     sync_target_height: Optional[uint32]  # Peak height we are syncing towards
+    sync_headers_height: Optional[uint32]  # Height up to which headers are validated, in a headers first sync
     peers_changed: asyncio.Event
     batch_syncing: Set[bytes32]  # Set of nodes which we are batch syncing from
     backtrack_syncing: Dict[bytes32, int]  # Set of nodes which we are backtrack syncing from, and how many threads
+    peer_sync_stats: Dict[bytes32, PeerSyncStats]  # peer node id : how fast it serves blocks during sync
 
     @classmethod
     async def create(cls):
@@ -29,6 +32,7 @@ class SyncStore:
         self.long_sync = False
         self.sync_target_header_hash = None
         self.sync_target_height = None
+        self.sync_headers_height = None
         self.peak_fork_point = {}
         self.peak_to_peer = orderedDict()
         self.peer_to_peak = {}
@@ -36,6 +40,7 @@ class SyncStore:
 
         self.batch_syncing = set()
         self.backtrack_syncing = {}
+        self.peer_sync_stats = {}
         return self
 
     def set_peak_target(self, peak_hash: bytes32, target_height: uint32):
@@ -48,6 +53,12 @@ class SyncStore:
     def get_sync_target_height(self) -> Optional[uint32]:
         return self.sync_target_height
 
+    def set_sync_headers_height(self, height: Optional[uint32]):
+        self.sync_headers_height = height
+
+    def get_sync_headers_height(self) -> Optional[uint32]:
+        return self.sync_headers_height
+
     def set_sync_mode(self, sync_mode: bool):
         self.sync_mode = sync_mode
 
@@ -133,10 +144,12 @@ class SyncStore:
         Clears the peak_to_peer info which can get quite large.
         """
         self.peak_to_peer = orderedDict()
+        self.sync_headers_height = None
 
     def peer_disconnected(self, node_id: bytes32):
         if node_id in self.peer_to_peak:
             del self.peer_to_peak[node_id]
+        self.peer_sync_stats.pop(node_id, None)
 
         for peak, peers in self.peak_to_peer.items():
             if node_id in peers:
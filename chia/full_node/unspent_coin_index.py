@@ -0,0 +1,125 @@
+import struct
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.coin_record import CoinRecord
+from chia.util.ints import uint32, uint64
+
+# parent_coin_info, puzzle_hash, amount, confirmed_block_index, timestamp, coinbase
+RECORD_FORMAT = struct.Struct("!32s32sQIQ?")
+
+# rough estimate of the python object overhead per entry, on top of the packed
+# record. This covers the bytes32 key, the OrderedDict entry and the slot int
+ENTRY_OVERHEAD = 200
+
+
+class UnspentCoinIndex:
+    """
+    A resident index of unspent coins, keyed by coin id. The records are packed
+    into a single bytearray, one fixed-size slot per coin, to keep the memory
+    footprint predictable. The number of entries is bounded by a byte budget,
+    when it's exceeded, the least recently used coins are evicted. A miss does not
+    mean the coin doesn't exist, the caller is expected to fall back to the DB.
+    """
+
+    max_bytes: int
+    capacity: int
+    hits: int
+    misses: int
+    evictions: int
+    _data: bytearray
+    _slots: "OrderedDict[bytes32, int]"
+    _free_slots: List[int]
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.capacity = max_bytes // (RECORD_FORMAT.size + ENTRY_OVERHEAD)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = bytearray()
+        self._slots = OrderedDict()
+        self._free_slots = []
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, coin_id: bytes32) -> bool:
+        return coin_id in self._slots
+
+    def full(self) -> bool:
+        return len(self._slots) >= self.capacity
+
+    def get(self, coin_id: bytes32) -> Optional[CoinRecord]:
+        slot = self._slots.get(coin_id)
+        if slot is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._slots.move_to_end(coin_id)
+        parent, puzzle_hash, amount, confirmed, timestamp, coinbase = RECORD_FORMAT.unpack_from(
+            self._data, slot * RECORD_FORMAT.size
+        )
+        return CoinRecord(
+            Coin(bytes32(parent), bytes32(puzzle_hash), uint64(amount)),
+            uint32(confirmed),
+            uint32(0),
+            coinbase,
+            uint64(timestamp),
+        )
+
+    def add(self, record: CoinRecord) -> None:
+        # only unspent coins are tracked
+        assert record.spent_block_index == 0
+        if self.capacity == 0:
+            return
+        coin_id = record.name
+        slot = self._slots.get(coin_id)
+        if slot is None:
+            if len(self._slots) >= self.capacity:
+                _, slot = self._slots.popitem(last=False)
+                self.evictions += 1
+            elif len(self._free_slots) > 0:
+                slot = self._free_slots.pop()
+            else:
+                slot = len(self._data) // RECORD_FORMAT.size
+                self._data.extend(bytes(RECORD_FORMAT.size))
+            self._slots[coin_id] = slot
+        else:
+            self._slots.move_to_end(coin_id)
+        RECORD_FORMAT.pack_into(
+            self._data,
+            slot * RECORD_FORMAT.size,
+            record.coin.parent_coin_info,
+            record.coin.puzzle_hash,
+            record.coin.amount,
+            record.confirmed_block_index,
+            record.timestamp,
+            record.coinbase,
+        )
+
+    def remove(self, coin_id: bytes32) -> None:
+        slot = self._slots.pop(coin_id, None)
+        if slot is not None:
+            self._free_slots.append(slot)
+
+    def clear(self) -> None:
+        self._data = bytearray()
+        self._slots = OrderedDict()
+        self._free_slots = []
+
+    def memory_usage(self) -> int:
+        return len(self._data) + len(self._slots) * ENTRY_OVERHEAD
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._slots),
+            "capacity": self.capacity,
+            "bytes": self.memory_usage(),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
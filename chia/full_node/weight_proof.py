@@ -1,4 +1,5 @@
 import asyncio
+import contextlib
 import dataclasses
 import logging
 import math
@@ -7,7 +8,7 @@ import pathlib
 import random
 from concurrent.futures.process import ProcessPoolExecutor
 import tempfile
-from typing import Dict, IO, List, Optional, Tuple
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional, Set, Tuple, TypeVar
 
 from chia.consensus.block_header_validation import validate_finished_header_block
 from chia.consensus.block_record import BlockRecord
@@ -46,11 +47,90 @@ from chia.util.streamable import dataclass_from_dict, recurse_jsonify
 
 log = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 
 def _create_shutdown_file() -> IO:
     return tempfile.NamedTemporaryFile(prefix="chia_full_node_weight_proof_handler_executor_shutdown_trigger")
 
 
+# the consensus constants of a weight proof validation worker, set when the
+# worker process starts, see WeightProofValidationPool
+_worker_constants: Optional[ConsensusConstants] = None
+
+
+def _initialize_worker(constants_dict: Dict, process_title: str) -> None:
+    global _worker_constants
+    setproctitle(process_title)
+    _worker_constants = dataclass_from_dict(ConsensusConstants, constants_dict)
+
+
+def _get_worker_constants() -> ConsensusConstants:
+    assert _worker_constants is not None
+    return _worker_constants
+
+
+class WeightProofValidationPool:
+    """
+    A long-lived process pool for validating weight proofs, shared by all the
+    weight proofs a node validates. The workers get the consensus constants
+    once, when they start, instead of with every task, and they can be started
+    ahead of time with warm_up(), so validating a weight proof doesn't pay for
+    spawning processes.
+    """
+
+    num_processes: int
+    _executor: ProcessPoolExecutor
+    # the shutdown files of the validations in progress, see shutdown_file()
+    _shutdown_files: Set[IO]
+
+    def __init__(
+        self,
+        constants: ConsensusConstants,
+        num_processes: int = 4,
+        multiprocessing_context: Optional[BaseContext] = None,
+    ):
+        self.num_processes = num_processes
+        self._executor = ProcessPoolExecutor(
+            max_workers=num_processes,
+            mp_context=multiprocessing_context,
+            initializer=_initialize_worker,
+            initargs=(recurse_jsonify(dataclasses.asdict(constants)), f"{getproctitle()}_worker"),
+        )
+        self._shutdown_files = set()
+
+    def warm_up(self) -> None:
+        """
+        Starts the worker processes, which otherwise only start once there
+        are tasks for them
+        """
+        for _ in range(self.num_processes):
+            self._executor.submit(_get_worker_constants)
+
+    def run(self, function: Callable[..., T], *args: Any) -> "asyncio.Future[T]":
+        return asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    @contextlib.contextmanager
+    def shutdown_file(self) -> Iterator[pathlib.Path]:
+        """
+        A file that exists while a validation is in progress. The workers
+        stop the validation's tasks once it's removed, when the validation
+        ends (e.g. because a part of the weight proof was invalid) or the
+        pool shuts down
+        """
+        with _create_shutdown_file() as shutdown_file:
+            self._shutdown_files.add(shutdown_file)
+            try:
+                yield pathlib.Path(shutdown_file.name)
+            finally:
+                self._shutdown_files.discard(shutdown_file)
+
+    def shut_down(self) -> None:
+        for shutdown_file in list(self._shutdown_files):
+            shutdown_file.close()
+        self._executor.shutdown(wait=True)
+
+
 class WeightProofHandler:
 
     LAMBDA_L = 100
@@ -70,6 +150,24 @@ class WeightProofHandler:
         self.lock = asyncio.Lock()
         self._num_processes = 4
         self.multiprocessing_context = multiprocessing_context
+        self._validation_pool: Optional[WeightProofValidationPool] = None
+
+    def get_validation_pool(self) -> WeightProofValidationPool:
+        """
+        The pool is created the first time it's needed, and then kept until
+        shut_down()
+        """
+        if self._validation_pool is None:
+            self._validation_pool = WeightProofValidationPool(
+                self.constants, self._num_processes, self.multiprocessing_context
+            )
+            self._validation_pool.warm_up()
+        return self._validation_pool
+
+    def shut_down(self) -> None:
+        if self._validation_pool is not None:
+            self._validation_pool.shut_down()
+            self._validation_pool = None
 
     async def get_proof_of_weight(self, tip: bytes32) -> Optional[WeightProof]:
 
@@ -579,7 +677,10 @@ class WeightProofHandler:
         if not _validate_sub_epoch_segments(constants, rng, wp_segment_bytes, summary_bytes):
             return False, uint32(0)
         log.info("validate weight proof recent blocks")
-        if not _validate_recent_blocks(constants, wp_recent_chain_bytes, summary_bytes):
+        valid_recent_blocks, _ = validate_recent_blocks(
+            self.constants, RecentChainData(weight_proof.recent_chain_data), summaries
+        )
+        if not valid_recent_blocks:
             return False, uint32(0)
         return True, self.get_fork_point(summaries)
 
@@ -624,71 +725,10 @@ class WeightProofHandler:
             return False, uint32(0), []
 
         # timing reference: 1 second
-        # TODO: Consider implementing an async polling closer for the executor.
-        with ProcessPoolExecutor(
-            max_workers=self._num_processes,
-            mp_context=self.multiprocessing_context,
-            initializer=setproctitle,
-            initargs=(f"{getproctitle()}_worker",),
-        ) as executor:
-            # The shutdown file manager must be inside of the executor manager so that
-            # we request the workers close prior to waiting for them to close.
-            with _create_shutdown_file() as shutdown_file:
-                await asyncio.sleep(0)  # break up otherwise multi-second sync code
-                # timing reference: 1.1 second
-                constants, summary_bytes, wp_segment_bytes, wp_recent_chain_bytes = vars_to_bytes(
-                    self.constants, summaries, weight_proof
-                )
-                await asyncio.sleep(0)  # break up otherwise multi-second sync code
-
-                # timing reference: 2 second
-                recent_blocks_validation_task = asyncio.get_running_loop().run_in_executor(
-                    executor,
-                    _validate_recent_blocks,
-                    constants,
-                    wp_recent_chain_bytes,
-                    summary_bytes,
-                    pathlib.Path(shutdown_file.name),
-                )
-
-                # timing reference: 2 second
-                segments_validated, vdfs_to_validate = _validate_sub_epoch_segments(
-                    constants, rng, wp_segment_bytes, summary_bytes
-                )
-                await asyncio.sleep(0)  # break up otherwise multi-second sync code
-                if not segments_validated:
-                    return False, uint32(0), []
-
-                # timing reference: 4 second
-                vdf_chunks = chunks(vdfs_to_validate, self._num_processes)
-                vdf_tasks = []
-                # timing reference: 4 second
-                for chunk in vdf_chunks:
-                    byte_chunks = []
-                    for vdf_proof, classgroup, vdf_info in chunk:
-                        byte_chunks.append((bytes(vdf_proof), bytes(classgroup), bytes(vdf_info)))
-
-                    vdf_task = asyncio.get_running_loop().run_in_executor(
-                        executor,
-                        _validate_vdf_batch,
-                        constants,
-                        byte_chunks,
-                        pathlib.Path(shutdown_file.name),
-                    )
-                    vdf_tasks.append(vdf_task)
-                    # give other stuff a turn
-                    await asyncio.sleep(0)
-
-                # timing reference: 4 second
-                for vdf_task in asyncio.as_completed(fs=vdf_tasks):
-                    validated = await vdf_task
-                    if not validated:
-                        return False, uint32(0), []
-
-                valid_recent_blocks_task = recent_blocks_validation_task
-                valid_recent_blocks = await valid_recent_blocks_task
-        if not valid_recent_blocks:
-            log.error("failed validating weight proof recent blocks")
+        records = await validate_weight_proof_in_pool(
+            self.get_validation_pool(), self.constants, weight_proof, summaries, rng
+        )
+        if records is None:
             return False, uint32(0), []
 
         return True, self.get_fork_point(summaries), summaries
@@ -994,6 +1034,92 @@ def _validate_summaries_weight(constants: ConsensusConstants, sub_epoch_data_wei
     return curr.reward_chain_block.weight == sub_epoch_data_weight
 
 
+async def validate_weight_proof_in_pool(
+    pool: WeightProofValidationPool,
+    constants: ConsensusConstants,
+    weight_proof: WeightProof,
+    summaries: List[SubEpochSummary],
+    rng: random.Random,
+    skip_segment_validation: bool = False,
+) -> Optional[List[bytes]]:
+    """
+    Validates the sub epoch segments, their VDFs and the recent chain of a
+    weight proof whose sub epoch summaries and sampling have been validated.
+    The segments are validated one sub epoch per task, and the VDFs of each
+    sub epoch are sent off as soon as its segments are validated. Returns the
+    serialized block records of the recent chain, or None if the weight proof
+    is invalid
+    """
+    summaries_bytes = [bytes(summary) for summary in summaries]
+    with pool.shutdown_file() as shutdown_file_path:
+        recent_blocks_task = pool.run(
+            _validate_recent_blocks_in_worker,
+            bytes(RecentChainData(weight_proof.recent_chain_data)),
+            summaries_bytes,
+            shutdown_file_path,
+        )
+        segment_tasks: List["asyncio.Future[Tuple[bool, List[Tuple[bytes, bytes, bytes]]]]"] = []
+        vdf_tasks: List["asyncio.Future[bool]"] = []
+        try:
+            if not skip_segment_validation:
+                for sub_epoch_n, segments, sampled_seg_index, prev_ssi in _get_sub_epochs_to_validate(
+                    constants, rng, summaries, weight_proof.sub_epoch_segments
+                ):
+                    segment_task = pool.run(
+                        _validate_sub_epoch_in_worker,
+                        summaries_bytes,
+                        sub_epoch_n,
+                        bytes(SubEpochSegments(segments)),
+                        sampled_seg_index,
+                        prev_ssi,
+                        shutdown_file_path,
+                    )
+                    segment_tasks.append(segment_task)
+
+                for segment_task in asyncio.as_completed(segment_tasks):
+                    segments_validated, vdfs_to_validate = await segment_task
+                    if not segments_validated:
+                        return None
+                    for vdf_chunk in chunks(vdfs_to_validate, pool.num_processes):
+                        vdf_tasks.append(pool.run(_validate_vdf_batch_in_worker, vdf_chunk, shutdown_file_path))
+
+                for vdf_task in asyncio.as_completed(vdf_tasks):
+                    if not await vdf_task:
+                        return None
+
+            valid_recent_blocks, records_bytes = await recent_blocks_task
+        finally:
+            tasks: List["asyncio.Future[Any]"] = [recent_blocks_task, *segment_tasks, *vdf_tasks]
+            for task in tasks:
+                task.cancel()
+
+    if not valid_recent_blocks:
+        log.error("failed validating weight proof recent blocks")
+        return None
+    return records_bytes
+
+
+def _get_sub_epochs_to_validate(
+    constants: ConsensusConstants,
+    rng: random.Random,
+    summaries: List[SubEpochSummary],
+    sub_epoch_segments: List[SubEpochChallengeSegment],
+) -> List[Tuple[int, List[SubEpochChallengeSegment], int, uint64]]:
+    """
+    The number and segments of each sub epoch in a weight proof, the index of
+    the segment sampled for full validation, and the sub slot iters of the
+    sub epoch before it
+    """
+    sub_epochs: List[Tuple[int, List[SubEpochChallengeSegment], int, uint64]] = []
+    curr_ssi = constants.SUB_SLOT_ITERS_STARTING
+    for sub_epoch_n, segments in map_segments_by_sub_epoch(sub_epoch_segments).items():
+        prev_ssi = curr_ssi
+        _, curr_ssi = _get_curr_diff_ssi(constants, sub_epoch_n, summaries)
+        sampled_seg_index = rng.choice(range(len(segments)))
+        sub_epochs.append((sub_epoch_n, segments, sampled_seg_index, prev_ssi))
+    return sub_epochs
+
+
 def _validate_sub_epoch_segments(
     constants_dict: Dict,
     rng: random.Random,
@@ -1002,43 +1128,71 @@ def _validate_sub_epoch_segments(
 ):
     constants, summaries = bytes_to_vars(constants_dict, summaries_bytes)
     sub_epoch_segments: SubEpochSegments = SubEpochSegments.from_bytes(weight_proof_bytes)
+    vdfs_to_validate = []
+    for sub_epoch_n, segments, sampled_seg_index, prev_ssi in _get_sub_epochs_to_validate(
+        constants, rng, summaries, sub_epoch_segments.challenge_segments
+    ):
+        valid, vdf_list = _validate_sub_epoch(constants, summaries, sub_epoch_n, segments, sampled_seg_index, prev_ssi)
+        if not valid:
+            return False
+        vdfs_to_validate.extend(vdf_list)
+    return True, vdfs_to_validate
+
+
+def _validate_sub_epoch(
+    constants: ConsensusConstants,
+    summaries: List[SubEpochSummary],
+    sub_epoch_n: int,
+    segments: List[SubEpochChallengeSegment],
+    sampled_seg_index: int,
+    prev_ssi: uint64,
+) -> Tuple[bool, List[Tuple[VDFProof, ClassgroupElement, VDFInfo]]]:
+    curr_difficulty, curr_ssi = _get_curr_diff_ssi(constants, sub_epoch_n, summaries)
+    log.debug(f"validate sub epoch {sub_epoch_n}")
+    # recreate RewardChainSubSlot for next ses rc_hash
     rc_sub_slot_hash = constants.GENESIS_CHALLENGE
-    total_blocks, total_ip_iters = 0, 0
-    total_slot_iters, total_slots = 0, 0
-    total_ip_iters = 0
     prev_ses: Optional[SubEpochSummary] = None
-    segments_by_sub_epoch = map_segments_by_sub_epoch(sub_epoch_segments.challenge_segments)
-    curr_ssi = constants.SUB_SLOT_ITERS_STARTING
+    if sub_epoch_n > 0:
+        rc_sub_slot = __get_rc_sub_slot(constants, segments[0], summaries, curr_ssi)
+        prev_ses = summaries[sub_epoch_n - 1]
+        rc_sub_slot_hash = rc_sub_slot.get_hash()
+    if not summaries[sub_epoch_n].reward_chain_hash == rc_sub_slot_hash:
+        log.error(f"failed reward_chain_hash validation sub_epoch {sub_epoch_n}")
+        return False, []
     vdfs_to_validate = []
-    for sub_epoch_n, segments in segments_by_sub_epoch.items():
-        prev_ssi = curr_ssi
-        curr_difficulty, curr_ssi = _get_curr_diff_ssi(constants, sub_epoch_n, summaries)
-        log.debug(f"validate sub epoch {sub_epoch_n}")
-        # recreate RewardChainSubSlot for next ses rc_hash
-        sampled_seg_index = rng.choice(range(len(segments)))
-        if sub_epoch_n > 0:
-            rc_sub_slot = __get_rc_sub_slot(constants, segments[0], summaries, curr_ssi)
-            prev_ses = summaries[sub_epoch_n - 1]
-            rc_sub_slot_hash = rc_sub_slot.get_hash()
-        if not summaries[sub_epoch_n].reward_chain_hash == rc_sub_slot_hash:
-            log.error(f"failed reward_chain_hash validation sub_epoch {sub_epoch_n}")
-            return False
-        for idx, segment in enumerate(segments):
-            valid_segment, ip_iters, slot_iters, slots, vdf_list = _validate_segment(
-                constants, segment, curr_ssi, prev_ssi, curr_difficulty, prev_ses, idx == 0, sampled_seg_index == idx
-            )
-            vdfs_to_validate.extend(vdf_list)
-            if not valid_segment:
-                log.error(f"failed to validate sub_epoch {segment.sub_epoch_n} segment {idx} slots")
-                return False
-            prev_ses = None
-            total_blocks += 1
-            total_slot_iters += slot_iters
-            total_slots += slots
-            total_ip_iters += ip_iters
+    for idx, segment in enumerate(segments):
+        valid_segment, ip_iters, slot_iters, slots, vdf_list = _validate_segment(
+            constants, segment, curr_ssi, prev_ssi, curr_difficulty, prev_ses, idx == 0, sampled_seg_index == idx
+        )
+        vdfs_to_validate.extend(vdf_list)
+        if not valid_segment:
+            log.error(f"failed to validate sub_epoch {segment.sub_epoch_n} segment {idx} slots")
+            return False, []
+        prev_ses = None
     return True, vdfs_to_validate
 
 
+def _validate_sub_epoch_in_worker(
+    summaries_bytes: List[bytes],
+    sub_epoch_n: int,
+    segments_bytes: bytes,
+    sampled_seg_index: int,
+    prev_ssi: uint64,
+    shutdown_file_path: Optional[pathlib.Path] = None,
+) -> Tuple[bool, List[Tuple[bytes, bytes, bytes]]]:
+    if shutdown_file_path is not None and not shutdown_file_path.is_file():
+        log.info(f"cancelling sub epoch {sub_epoch_n} validation, shutdown requested")
+        return False, []
+    summaries = [SubEpochSummary.from_bytes(summary) for summary in summaries_bytes]
+    segments = SubEpochSegments.from_bytes(segments_bytes).challenge_segments
+    valid, vdf_list = _validate_sub_epoch(
+        _get_worker_constants(), summaries, sub_epoch_n, segments, sampled_seg_index, prev_ssi
+    )
+    return valid, [
+        (bytes(vdf_proof), bytes(classgroup), bytes(vdf_info)) for vdf_proof, classgroup, vdf_info in vdf_list
+    ]
+
+
 def _validate_segment(
     constants: ConsensusConstants,
     segment: SubEpochChallengeSegment,
@@ -1339,33 +1493,15 @@ def validate_recent_blocks(
     return True, [bytes(sub) for sub in sub_blocks._block_records.values()]
 
 
-def _validate_recent_blocks(
-    constants_dict: Dict,
-    recent_chain_bytes: bytes,
-    summaries_bytes: List[bytes],
-    shutdown_file_path: Optional[pathlib.Path] = None,
-) -> bool:
-    constants, summaries = bytes_to_vars(constants_dict, summaries_bytes)
-    recent_chain: RecentChainData = RecentChainData.from_bytes(recent_chain_bytes)
-    success, records = validate_recent_blocks(
-        constants=constants,
-        recent_chain=recent_chain,
-        summaries=summaries,
-        shutdown_file_path=shutdown_file_path,
-    )
-    return success
-
-
-def _validate_recent_blocks_and_get_records(
-    constants_dict: Dict,
+def _validate_recent_blocks_in_worker(
     recent_chain_bytes: bytes,
     summaries_bytes: List[bytes],
     shutdown_file_path: Optional[pathlib.Path] = None,
 ) -> Tuple[bool, List[bytes]]:
-    constants, summaries = bytes_to_vars(constants_dict, summaries_bytes)
+    summaries = [SubEpochSummary.from_bytes(summary) for summary in summaries_bytes]
     recent_chain: RecentChainData = RecentChainData.from_bytes(recent_chain_bytes)
     return validate_recent_blocks(
-        constants=constants,
+        constants=_get_worker_constants(),
         recent_chain=recent_chain,
         summaries=summaries,
         shutdown_file_path=shutdown_file_path,
@@ -1718,10 +1854,10 @@ def validate_total_iters(
     return total_iters == sub_slot_data.total_iters
 
 
-def _validate_vdf_batch(
-    constants_dict, vdf_list: List[Tuple[bytes, bytes, bytes]], shutdown_file_path: Optional[pathlib.Path] = None
-):
-    constants: ConsensusConstants = dataclass_from_dict(ConsensusConstants, constants_dict)
+def _validate_vdf_batch_in_worker(
+    vdf_list: List[Tuple[bytes, bytes, bytes]], shutdown_file_path: Optional[pathlib.Path] = None
+) -> bool:
+    constants = _get_worker_constants()
 
     for vdf_proof_bytes, class_group_bytes, info in vdf_list:
         vdf = VDFProof.from_bytes(vdf_proof_bytes)
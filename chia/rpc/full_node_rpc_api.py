@@ -13,6 +13,7 @@ from chia.types.generator_types import BlockGenerator
 from chia.types.mempool_inclusion_status import MempoolInclusionStatus
 from chia.types.spend_bundle import SpendBundle
 from chia.types.unfinished_header_block import UnfinishedHeaderBlock
+from chia.util import cached_bls
 from chia.util.byte_types import hexstr_to_bytes
 from chia.util.ints import uint32, uint64, uint128
 from chia.util.log_exceptions import log_exceptions
@@ -37,6 +38,8 @@ class FullNodeRpcApi:
             "/get_block": self.get_block,
             "/get_blocks": self.get_blocks,
             "/get_block_count_metrics": self.get_block_count_metrics,
+            "/get_cache_stats": self.get_cache_stats,
+            "/get_db_stats": self.get_db_stats,
             "/get_block_record_by_height": self.get_block_record_by_height,
             "/get_block_record": self.get_block_record,
             "/get_block_records": self.get_block_records,
@@ -114,6 +117,7 @@ class FullNodeRpcApi:
                         "synced": False,
                         "sync_tip_height": 0,
                         "sync_progress_height": 0,
+                        "sync_headers_height": None,
                     },
                     "difficulty": 0,
                     "sub_slot_iters": 0,
@@ -194,6 +198,8 @@ class FullNodeRpcApi:
                     "synced": synced,
                     "sync_tip_height": sync_tip_height,
                     "sync_progress_height": sync_progress_height,
+                    # in a headers first sync, the height the headers are validated up to
+                    "sync_headers_height": self.service.sync_store.get_sync_headers_height() if sync_mode else None,
                 },
                 "difficulty": difficulty,
                 "sub_slot_iters": sub_slot_iters,
@@ -368,6 +374,26 @@ class FullNodeRpcApi:
             }
         }
 
+    async def get_cache_stats(self, request: Dict) -> Optional[Dict]:
+        unspent_index = self.service.coin_store.unspent_index
+        return {
+            "block_cache": self.service.block_store.block_cache.get_stats(),
+            "unspent_coin_index": None if unspent_index is None else unspent_index.get_stats(),
+            "bls_pairing_cache": cached_bls.LOCAL_CACHE.get_stats(),
+        }
+
+    async def get_db_stats(self, request: Dict) -> Optional[Dict]:
+        """
+        Returns the utilization of the DB read pool, the time the writer lock
+        has been held, and the statements with the highest total execution
+        time (up to "count" of them)
+        """
+        db_wrapper = self.service.db_wrapper
+        return {
+            "pool": db_wrapper.get_pool_stats(),
+            "statements": db_wrapper.stats.most_expensive(int(request.get("count", 10))),
+        }
+
     async def get_block_records(self, request: Dict) -> Optional[Dict]:
         if "start" not in request:
             raise ValueError("No start in request")
@@ -47,6 +47,12 @@ class FullNodeRpcClient(RpcClient):
         )
         return [FullBlock.from_json_dict(block) for block in response["blocks"]]
 
+    async def get_cache_stats(self) -> Dict:
+        return await self.fetch("get_cache_stats", {})
+
+    async def get_db_stats(self, count: int = 10) -> Dict:
+        return await self.fetch("get_db_stats", {"count": count})
+
     async def get_block_record_by_height(self, height) -> Optional[BlockRecord]:
         try:
             response = await self.fetch("get_block_record_by_height", {"height": height})
@@ -115,8 +115,10 @@ class RpcServer:
             con_info = []
             if self.rpc_api.service.sync_store is not None:
                 peak_store = self.rpc_api.service.sync_store.peer_to_peak
+                sync_stats = self.rpc_api.service.sync_store.peer_sync_stats
             else:
                 peak_store = None
+                sync_stats = {}
             for con in connections:
                 if peak_store is not None and con.peer_node_id in peak_store:
                     peak_hash, peak_height, peak_weight = peak_store[con.peer_node_id]
@@ -124,6 +126,7 @@ class RpcServer:
                     peak_height = None
                     peak_hash = None
                     peak_weight = None
+                peer_sync_stats = sync_stats.get(con.peer_node_id)
                 con_dict = {
                     "type": con.connection_type,
                     "local_port": con.local_port,
@@ -138,6 +141,7 @@ class RpcServer:
                     "peak_height": peak_height,
                     "peak_weight": peak_weight,
                     "peak_hash": peak_hash,
+                    "sync_stats": None if peer_sync_stats is None else peer_sync_stats.get_stats(),
                 }
                 con_info.append(con_dict)
         else:
@@ -291,6 +291,11 @@ class WSChiaConnection:
             timeout = 60
             if "timeout" in kwargs:
                 timeout = kwargs["timeout"]
+            # with parse_response=False, the response Message is returned
+            # as is, for callers that parse it themselves
+            parse_response = True
+            if "parse_response" in kwargs:
+                parse_response = kwargs["parse_response"]
             attribute = getattr(class_for_type(self.connection_type), attr_name, None)
             if attribute is None:
                 raise AttributeError(f"Node type {self.connection_type} does not have method {attr_name}")
@@ -311,6 +316,8 @@ class WSChiaConnection:
                     f"but received {recv_message_type.name}"
                     await self.ban_peer_bad_protocol(self.error_message)
                     raise ProtocolError(Err.INVALID_PROTOCOL_MESSAGE, [error_message])
+                if not parse_response:
+                    return result
                 ret_attr = getattr(class_for_type(self.local_type), ProtocolMessageTypes(result.type).name, None)
 
                 req_annotations = ret_attr.__annotations__
@@ -0,0 +1,99 @@
+import sqlite3
+from contextlib import closing
+from typing import Dict, List, Optional, Union
+
+import zstandard
+
+# the zstd compression level used for blocks. This matches the default level
+# of zstd.compress(), which is what blocks used to be compressed with
+COMPRESSION_LEVEL = 3
+
+# the default size of trained dictionaries (this is the zstd default too)
+DEFAULT_DICT_SIZE = 110 * 1024
+
+
+class UnknownDictionaryError(ValueError):
+    pass
+
+
+class BlockCompressor:
+    """
+    Compresses and decompresses the serialized blocks stored in the v2
+    full_blocks table.
+
+    Blocks can be compressed with a trained zstd dictionary. Dictionaries are
+    versioned by their zstd dictionary ID, which is also recorded in the header
+    of every frame compressed with it. That's how we know which dictionary to
+    use when decompressing. Frames without a dictionary ID are plain zstd
+    frames, as written by zstd.compress(). New blocks are always compressed
+    with the dictionary with the highest ID (if any). Blobs to decompress may
+    be any buffer, such as a memoryview into a memory map.
+
+    The compression and decompression contexts are created once and reused.
+    """
+
+    _compressor: zstandard.ZstdCompressor
+    _decompressors: Dict[int, zstandard.ZstdDecompressor]
+    current_dict_id: Optional[int]
+
+    def __init__(self, dictionaries: Optional[Dict[int, bytes]] = None) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL)
+        self._decompressors = {0: zstandard.ZstdDecompressor()}
+        self.current_dict_id = None
+        if dictionaries is not None:
+            for dict_id, dict_data in sorted(dictionaries.items()):
+                self.add_dictionary(dict_id, dict_data)
+
+    def add_dictionary(self, dict_id: int, dict_data: bytes) -> None:
+        d = zstandard.ZstdCompressionDict(dict_data, dict_type=zstandard.DICT_TYPE_FULLDICT)
+        if d.dict_id() != dict_id:
+            raise ValueError(f"compression dictionary {dict_id} has mismatching ID: {d.dict_id()}")
+        self._decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=d)
+        if self.current_dict_id is None or dict_id > self.current_dict_id:
+            self.current_dict_id = dict_id
+            self._compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL, dict_data=d)
+
+    def has_dictionary(self, dict_id: int) -> bool:
+        return dict_id in self._decompressors
+
+    def compress(self, block_bytes: bytes) -> bytes:
+        return self._compressor.compress(block_bytes)
+
+    def decompress(self, blob: Union[bytes, memoryview]) -> bytes:
+        dict_id = frame_dict_id(blob)
+        decompressor = self._decompressors.get(dict_id)
+        if decompressor is None:
+            raise UnknownDictionaryError(f"block compressed with unknown dictionary: {dict_id}")
+        return decompressor.decompress(blob)
+
+
+def frame_dict_id(blob: Union[bytes, memoryview]) -> int:
+    """
+    Returns the ID of the dictionary a block was compressed with, or 0 if it
+    was compressed without one
+    """
+    return zstandard.get_frame_parameters(blob).dict_id
+
+
+def train_dictionary(samples: List[bytes], dict_id: int, dict_size: int = DEFAULT_DICT_SIZE) -> bytes:
+    """
+    Trains a compression dictionary from a sample of (uncompressed)
+    serialized blocks. The dict_id is the version of the dictionary, and must
+    be higher than any dictionary already in use.
+    """
+    assert dict_id > 0
+    d = zstandard.train_dictionary(dict_size, list(samples), dict_id=dict_id, level=COMPRESSION_LEVEL)
+    return d.as_bytes()
+
+
+def load_dictionaries(db: sqlite3.Connection) -> Dict[int, bytes]:
+    """
+    Loads the compression dictionaries from a blockchain database opened with
+    the (synchronous) sqlite3 module. Databases that were never recompressed
+    don't have the table, and have no dictionaries.
+    """
+    try:
+        with closing(db.execute("SELECT dict_id, dictionary FROM compression_dictionaries")) as cursor:
+            return {row[0]: row[1] for row in cursor.fetchall()}
+    except sqlite3.OperationalError:
+        return {}
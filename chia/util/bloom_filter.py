@@ -0,0 +1,36 @@
+from typing import Iterator
+
+from chia.util.hash import std_hash
+
+# the number of bits set per key. Each one uses 8 bytes of the key's hash
+NUM_HASHES = 4
+
+
+class BloomFilter:
+    """
+    A set membership filter with false positives, but no false negatives. If
+    might_contain() returns False, the key was never added. Keys can't be
+    removed.
+    """
+
+    num_bits: int
+    _bits: bytearray
+
+    def __init__(self, num_bits: int):
+        self.num_bits = max(num_bits, 8)
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _bit_indices(self, key: bytes) -> Iterator[int]:
+        h = std_hash(key)
+        for i in range(NUM_HASHES):
+            yield int.from_bytes(h[i * 8 : i * 8 + 8], "big") % self.num_bits
+
+    def add(self, key: bytes) -> None:
+        for idx in self._bit_indices(key):
+            self._bits[idx >> 3] |= 1 << (idx & 7)
+
+    def might_contain(self, key: bytes) -> bool:
+        for idx in self._bit_indices(key):
+            if (self._bits[idx >> 3] & (1 << (idx & 7))) == 0:
+                return False
+        return True
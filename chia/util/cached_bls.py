@@ -1,14 +1,39 @@
 import functools
-from typing import List, Optional, Sequence
+from typing import List, Optional, Sequence, Union
 
 from blspy import AugSchemeMPL, G1Element, G2Element, GTElement
 
 from chia.types.blockchain_format.sized_bytes import bytes48
 from chia.util.hash import std_hash
-from chia.util.lru_cache import LRUCache
+from chia.util.lru_cache import LRUCache, SizedLRUCache
 
+# rough estimate of the memory used by a cached pairing. A GTElement is an Fp12
+# element (576 bytes), plus its 32 byte key and the python objects around them
+PAIRING_CACHE_ENTRY_SIZE = 800
 
-def get_pairings(cache: LRUCache, pks: List[bytes48], msgs: Sequence[bytes], force_cache: bool) -> List[GTElement]:
+
+class PairingCache(SizedLRUCache):
+    """
+    A cache of pairings, by the hash of the public key and message they're
+    for, bounded by (an estimate of) the memory they use. Pairings computed
+    while validating transactions for the mempool, in worker processes, are
+    added to the cache of the main process, where blocks are validated.
+    """
+
+    def put(self, key: bytes, value: GTElement, size: int = PAIRING_CACHE_ENTRY_SIZE) -> None:
+        super().put(key, value, size)
+
+    def resize(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        while self.size > self.max_bytes:
+            _, (_, evicted_size) = self.cache.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+
+def get_pairings(
+    cache: Union[LRUCache, PairingCache], pks: List[bytes48], msgs: Sequence[bytes], force_cache: bool
+) -> List[GTElement]:
     pairings: List[Optional[GTElement]] = []
     missing_count: int = 0
     for pk, msg in zip(pks, msgs):
@@ -36,12 +61,17 @@ def get_pairings(cache: LRUCache, pks: List[bytes48], msgs: Sequence[bytes], for
     return pairings
 
 
-# Increasing this number will increase RAM usage, but decrease BLS validation time for blocks and unfinished blocks.
-LOCAL_CACHE: LRUCache = LRUCache(50000)
+# Increasing this will increase RAM usage, but decrease BLS validation time for blocks and unfinished blocks. The full
+# node sets it from bls_pairing_cache_bytes in its config.
+LOCAL_CACHE: PairingCache = PairingCache(50000 * PAIRING_CACHE_ENTRY_SIZE)
 
 
 def aggregate_verify(
-    pks: List[bytes48], msgs: Sequence[bytes], sig: G2Element, force_cache: bool = False, cache: LRUCache = LOCAL_CACHE
+    pks: List[bytes48],
+    msgs: Sequence[bytes],
+    sig: G2Element,
+    force_cache: bool = False,
+    cache: Union[LRUCache, PairingCache] = LOCAL_CACHE,
 ):
     pairings: List[GTElement] = get_pairings(cache, pks, msgs, force_cache)
     if len(pairings) == 0:
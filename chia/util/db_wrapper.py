@@ -2,10 +2,222 @@ from __future__ import annotations
 
 import asyncio
 import contextlib
-from typing import AsyncIterator, Dict, Optional
+import logging
+import re
+import sqlite3
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Generator,
+    Generic,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    TypeVar,
+    Union,
+)
 
 import aiosqlite
 
+from chia.util.chunks import chunks
+
+log = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+# the max number of parameters of a single SQL statement. SQLite's default
+# limit is 999
+MAX_SQLITE_PARAMETERS = 900
+
+# if a reader waits this long for a connection from the pool, and the pool
+# isn't at its limit, a new connection is opened
+POOL_GROW_WAIT = 0.01
+
+# connections opened to grow the pool are closed again once no reader has had
+# to wait for a connection for this long
+POOL_SHRINK_IDLE = 60.0
+
+# the number of distinct statements we keep timing stats for, before counting
+# the ones that only differ in the number of parameters together
+MAX_STATEMENT_STATS = 1000
+
+# lists of parameters, like "?, ?, ?", are collapsed when reporting statement
+# stats and logging slow queries, so queries that only differ in the number of
+# parameters are counted together
+PARAMETER_LIST_RE = re.compile(r"\?(\s*,\s*\?)+")
+
+
+def normalize_statement(sql: str) -> str:
+    return PARAMETER_LIST_RE.sub("?, ...", " ".join(sql.split()))
+
+
+@dataclass
+class StatementStats:
+    count: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+
+
+class DBStats:
+    """
+    Timing of the SQL statements executed on TimedConnections, and of the
+    writer lock. Statements taking longer than slow_query_seconds are logged.
+    """
+
+    slow_query_seconds: float
+    statements: Dict[str, StatementStats]
+    writer_lock_count: int
+    writer_lock_total_time: float
+    writer_lock_max_time: float
+
+    def __init__(self, slow_query_seconds: float = 1.0) -> None:
+        self.slow_query_seconds = slow_query_seconds
+        self.statements = {}
+        self.writer_lock_count = 0
+        self.writer_lock_total_time = 0.0
+        self.writer_lock_max_time = 0.0
+
+    def record_statement(self, sql: str, duration: float) -> None:
+        # this is called for every statement, the statements are only
+        # normalized when they're slow, or reported
+        if duration >= self.slow_query_seconds:
+            log.warning(f"slow query ({duration:0.3f}s): {normalize_statement(sql)}")
+        key = sql
+        stats = self.statements.get(key)
+        if stats is None and len(self.statements) >= MAX_STATEMENT_STATS:
+            # most of the statements are likely to only differ in the number
+            # of parameters, count those together from now on
+            key = normalize_statement(sql)
+            stats = self.statements.get(key)
+            if stats is None and len(self.statements) >= 2 * MAX_STATEMENT_STATS:
+                return
+        if stats is None:
+            stats = StatementStats()
+            self.statements[key] = stats
+        stats.count += 1
+        stats.total_time += duration
+        stats.max_time = max(stats.max_time, duration)
+
+    def record_writer_lock(self, duration: float) -> None:
+        self.writer_lock_count += 1
+        self.writer_lock_total_time += duration
+        self.writer_lock_max_time = max(self.writer_lock_max_time, duration)
+
+    def most_expensive(self, count: int) -> List[Dict[str, Any]]:
+        """
+        Returns the statements with the highest total execution time
+        """
+        merged: Dict[str, StatementStats] = {}
+        for sql, s in self.statements.items():
+            m = merged.setdefault(normalize_statement(sql), StatementStats())
+            m.count += s.count
+            m.total_time += s.total_time
+            m.max_time = max(m.max_time, s.max_time)
+        ranked = sorted(merged.items(), key=lambda item: item[1].total_time, reverse=True)
+        return [
+            {"sql": sql, "count": s.count, "total_time": s.total_time, "max_time": s.max_time}
+            for sql, s in ranked[:count]
+        ]
+
+
+class _TimedResult(Generic[_T]):
+    """
+    The result of a statement executed on a TimedConnection. Like the results
+    of aiosqlite.Connection.execute(), it can be awaited, or used with
+    "async with", which closes the cursor at the end of the block
+    """
+
+    def __init__(self, stats: DBStats, sql: str, result: Awaitable[_T]) -> None:
+        self._stats = stats
+        self._sql = sql
+        self._result = result
+        self._value: Optional[_T] = None
+
+    async def _run(self) -> _T:
+        start = time.monotonic()
+        try:
+            return await self._result
+        finally:
+            self._stats.record_statement(self._sql, time.monotonic() - start)
+
+    def __await__(self) -> Generator[Any, None, _T]:
+        return self._run().__await__()
+
+    async def __aenter__(self) -> _T:
+        self._value = await self._run()
+        return self._value
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        if isinstance(self._value, aiosqlite.Cursor):
+            await self._value.close()
+
+
+class TimedConnection(aiosqlite.Connection):
+    """
+    An aiosqlite connection that records the time of every statement it
+    executes in a DBStats object. The time includes waiting for the
+    connection's thread, but not fetching rows from the returned cursor.
+    """
+
+    stats: DBStats
+
+    def __init__(self, connector: Callable[[], sqlite3.Connection], stats: DBStats) -> None:
+        super().__init__(connector, 64)
+        self.stats = stats
+
+    def execute(  # type: ignore[override]
+        self, sql: str, parameters: Optional[Iterable[Any]] = None
+    ) -> _TimedResult[aiosqlite.Cursor]:
+        return _TimedResult(self.stats, sql, super().execute(sql, parameters))
+
+    def execute_fetchall(  # type: ignore[override]
+        self, sql: str, parameters: Optional[Iterable[Any]] = None
+    ) -> _TimedResult[Iterable[sqlite3.Row]]:
+        return _TimedResult(self.stats, sql, super().execute_fetchall(sql, parameters))
+
+    def executemany(  # type: ignore[override]
+        self, sql: str, parameters: Iterable[Iterable[Any]]
+    ) -> _TimedResult[aiosqlite.Cursor]:
+        return _TimedResult(self.stats, sql, super().executemany(sql, parameters))
+
+
+def timed_connect(database: Union[str, Path], stats: DBStats) -> TimedConnection:
+    """
+    Like aiosqlite.connect(), but the returned connection records its statement
+    timing in stats
+    """
+
+    def connector() -> sqlite3.Connection:
+        return sqlite3.connect(str(database))
+
+    return TimedConnection(connector, stats)
+
+
+async def fetch_many(
+    conn: aiosqlite.Connection, query: str, keys: List[Any], parameters: Sequence[Any] = ()
+) -> List[Any]:
+    """
+    Returns the rows matching any of the keys, looked up in chunks of at most
+    MAX_SQLITE_PARAMETERS, one hop to the connection's thread per chunk.
+    The "{}" in query is replaced by the placeholders for a chunk of keys,
+    e.g. "SELECT ... WHERE coin_name IN ({})". The keys are followed by the
+    (fixed) parameters.
+    """
+    rows: List[Any] = []
+    for batch in chunks(keys, MAX_SQLITE_PARAMETERS - len(parameters)):
+        placeholders = "?," * (len(batch) - 1) + "?"
+        rows.extend(await conn.execute_fetchall(query.format(placeholders), tuple(batch) + tuple(parameters)))
+    return rows
+
 
 class DBWrapper:
     """
@@ -34,43 +246,204 @@ class DBWrapper:
 
 
 class DBWrapper2:
+    """
+    The read connections added with add_connection() are the minimum size of
+    the pool. If a reader_factory is passed in, the pool grows, up to
+    max_read_connections, when readers have to wait for a connection. The
+    extra connections are closed again once they're no longer needed.
+    """
+
     db_version: int
+    stats: DBStats
     _lock: asyncio.Lock
-    _read_connections: asyncio.Queue[aiosqlite.Connection]
+    _idle_connections: Deque[aiosqlite.Connection]
+    # the readers waiting for a connection, oldest first. A released
+    # connection is handed directly to the first of them
+    _waiters: Deque[asyncio.Future[aiosqlite.Connection]]
     _write_connection: aiosqlite.Connection
     _num_read_connections: int
+    _min_read_connections: int
+    _max_read_connections: int
+    _reader_factory: Optional[Callable[[], Awaitable[aiosqlite.Connection]]]
     _in_use: Dict[asyncio.Task, aiosqlite.Connection]
     _current_writer: Optional[asyncio.Task]
     _savepoint_name: int
+    # for each open savepoint of the writer, the functions to call if it's rolled back
+    _rollback_callbacks: List[List[Callable[[], None]]]
+    _commit_callbacks: List[Callable[[], Awaitable[None]]]
+    _last_wait: float
+    _read_wait_count: int
+    _read_wait_total_time: float
+    _pool_grown: int
+    _pool_shrunk: int
 
     async def add_connection(self, c: aiosqlite.Connection) -> None:
+        await self._add_read_connection(c)
+        self._min_read_connections += 1
+
+    async def _add_read_connection(self, c: aiosqlite.Connection) -> None:
         # this guarantees that reader connections can only be used for reading
         assert c != self._write_connection
         await c.execute("pragma query_only")
-        self._read_connections.put_nowait(c)
         self._num_read_connections += 1
+        self._put_read_connection(c)
 
-    def __init__(self, connection: aiosqlite.Connection, db_version: int = 1) -> None:
-        self._read_connections = asyncio.Queue()
+    def __init__(
+        self,
+        connection: aiosqlite.Connection,
+        db_version: int = 1,
+        *,
+        stats: Optional[DBStats] = None,
+        reader_factory: Optional[Callable[[], Awaitable[aiosqlite.Connection]]] = None,
+        max_read_connections: int = 0,
+    ) -> None:
+        self._idle_connections = deque()
+        self._waiters = deque()
         self._write_connection = connection
         self._lock = asyncio.Lock()
         self.db_version = db_version
+        self.stats = stats if stats is not None else DBStats()
         self._num_read_connections = 0
+        self._min_read_connections = 0
+        self._max_read_connections = max_read_connections
+        self._reader_factory = reader_factory
         self._in_use = {}
         self._current_writer = None
         self._savepoint_name = 0
+        self._rollback_callbacks = []
+        self._commit_callbacks = []
+        self._last_wait = 0.0
+        self._read_wait_count = 0
+        self._read_wait_total_time = 0.0
+        self._pool_grown = 0
+        self._pool_shrunk = 0
 
     async def close(self) -> None:
+        # don't grow the pool while we're closing it
+        self._reader_factory = None
         while self._num_read_connections > 0:
-            await (await self._read_connections.get()).close()
+            c = await self._get_read_connection()
+            await c.close()
             self._num_read_connections -= 1
         await self._write_connection.close()
 
+    def get_pool_stats(self) -> Dict[str, Any]:
+        return {
+            "read_connections": self._num_read_connections,
+            "min_read_connections": self._min_read_connections,
+            "max_read_connections": max(self._max_read_connections, self._min_read_connections),
+            "read_connections_in_use": self._num_read_connections - len(self._idle_connections),
+            "readers_waiting": len(self._waiters),
+            "read_wait_count": self._read_wait_count,
+            "read_wait_total_time": self._read_wait_total_time,
+            "pool_grown": self._pool_grown,
+            "pool_shrunk": self._pool_shrunk,
+            "writer_lock_count": self.stats.writer_lock_count,
+            "writer_lock_total_time": self.stats.writer_lock_total_time,
+            "writer_lock_max_time": self.stats.writer_lock_max_time,
+        }
+
+    async def _get_read_connection(self) -> aiosqlite.Connection:
+        # released connections are handed straight to the waiting readers, so
+        # there are only idle connections when no one is waiting for one
+        if self._idle_connections:
+            return self._idle_connections.popleft()
+
+        start = time.monotonic()
+        waiter: asyncio.Future[aiosqlite.Connection] = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            if self._reader_factory is not None and self._num_read_connections < self._max_read_connections:
+                # unlike wait_for(), wait() doesn't cancel the waiter when it
+                # times out, so a connection handed over right at the deadline
+                # is still ours
+                await asyncio.wait([waiter], timeout=POOL_GROW_WAIT)
+                # check again, another reader may have grown the pool while
+                # we were waiting
+                if (
+                    not waiter.done()
+                    and self._reader_factory is not None
+                    and self._num_read_connections < self._max_read_connections
+                ):
+                    self._waiters.remove(waiter)
+                    waiter.cancel()
+                    self._num_read_connections += 1
+                    try:
+                        c = await self._reader_factory()
+                        await c.execute("pragma query_only")
+                    except BaseException:
+                        self._num_read_connections -= 1
+                        raise
+                    self._pool_grown += 1
+                    log.debug(f"growing DB read pool to {self._num_read_connections} connections")
+                    return c
+            return await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # we were handed a connection, but were cancelled before we
+                # could use it. Pass it on
+                self._put_read_connection(waiter.result())
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+                waiter.cancel()
+            raise
+        finally:
+            self._last_wait = time.monotonic()
+            self._read_wait_count += 1
+            self._read_wait_total_time += self._last_wait - start
+
+    def _put_read_connection(self, c: aiosqlite.Connection) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(c)
+                return
+        self._idle_connections.append(c)
+
+    async def _release_read_connection(self, c: aiosqlite.Connection) -> None:
+        if (
+            self._num_read_connections > self._min_read_connections
+            and not self._waiters
+            and time.monotonic() - self._last_wait > POOL_SHRINK_IDLE
+        ):
+            self._num_read_connections -= 1
+            self._pool_shrunk += 1
+            log.debug(f"shrinking DB read pool to {self._num_read_connections} connections")
+            await c.close()
+            return
+        self._put_read_connection(c)
+
     def _next_savepoint(self) -> str:
         name = f"s{self._savepoint_name}"
         self._savepoint_name += 1
         return name
 
+    def on_rollback(self, callback: Callable[[], None]) -> None:
+        """
+        Registers a function to call if the current write transaction (or
+        savepoint) is rolled back, to revert in-memory state that mirrors the
+        changes made to the DB. Must be called from within write_db()
+        """
+        assert self._current_writer == asyncio.current_task()
+        self._rollback_callbacks[-1].append(callback)
+
+    def before_commit(self, callback: Callable[[], Awaitable[None]]) -> None:
+        """
+        Registers a function to await before the current write transaction is
+        committed, e.g. to make data stored outside the DB durable before the
+        DB refers to it. If it fails, the transaction is rolled back. A
+        callback is only called once per transaction, however many times it's
+        registered. Must be called from within write_db()
+        """
+        assert self._current_writer == asyncio.current_task()
+        if callback not in self._commit_callbacks:
+            self._commit_callbacks.append(callback)
+
+    async def _rollback(self, name: str) -> None:
+        await self._write_connection.execute(f"ROLLBACK TO {name}")
+        for callback in reversed(self._rollback_callbacks[-1]):
+            callback()
+
     @contextlib.asynccontextmanager
     async def write_db(self) -> AsyncIterator[aiosqlite.Connection]:
         task = asyncio.current_task()
@@ -80,12 +453,17 @@ class DBWrapper2:
 
             name = self._next_savepoint()
             await self._write_connection.execute(f"SAVEPOINT {name}")
+            self._rollback_callbacks.append([])
             try:
                 yield self._write_connection
             except:  # noqa E722
-                await self._write_connection.execute(f"ROLLBACK TO {name}")
+                await self._rollback(name)
                 raise
+            else:
+                # if the enclosing savepoint is rolled back, so are the changes of this one
+                self._rollback_callbacks[-2].extend(self._rollback_callbacks[-1])
             finally:
+                self._rollback_callbacks.pop()
                 # rollback to a savepoint doesn't cancel the transaction, it
                 # just rolls back the state. We need to cancel it regardless
                 await self._write_connection.execute(f"RELEASE {name}")
@@ -93,17 +471,24 @@ class DBWrapper2:
 
         async with self._lock:
 
+            start = time.monotonic()
             name = self._next_savepoint()
             await self._write_connection.execute(f"SAVEPOINT {name}")
+            self._rollback_callbacks.append([])
             try:
                 self._current_writer = task
                 yield self._write_connection
+                for callback in self._commit_callbacks:
+                    await callback()
             except:  # noqa E722
-                await self._write_connection.execute(f"ROLLBACK TO {name}")
+                await self._rollback(name)
                 raise
             finally:
+                self._commit_callbacks = []
+                self._rollback_callbacks.pop()
                 self._current_writer = None
                 await self._write_connection.execute(f"RELEASE {name}")
+                self.stats.record_writer_lock(time.monotonic() - start)
 
     @contextlib.asynccontextmanager
     async def read_db(self) -> AsyncIterator[aiosqlite.Connection]:
@@ -128,7 +513,7 @@ class DBWrapper2:
         if task in self._in_use:
             yield self._in_use[task]
         else:
-            c = await self._read_connections.get()
+            c = await self._get_read_connection()
             try:
                 # record our connection in this dict to allow nested calls in
                 # the same task to use the same connection
@@ -136,4 +521,4 @@ class DBWrapper2:
                 yield c
             finally:
                 del self._in_use[task]
-                self._read_connections.put_nowait(c)
+                await self._release_read_connection(c)
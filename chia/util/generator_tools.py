@@ -1,4 +1,4 @@
-from typing import Any, Iterator, List, Tuple, Optional
+from typing import Any, Iterator, List, Tuple, Optional, Union
 from chiabip158 import PyBIP158
 
 from chia.types.blockchain_format.coin import Coin
@@ -38,6 +38,28 @@ def get_block_header(block: FullBlock, tx_addition_coins: List[Coin], removals_n
     )
 
 
+def get_header_digest(block: Union[FullBlock, HeaderBlock]) -> bytes32:
+    """
+    A hash of the header of a block, without the transactions filter (which a
+    FullBlock doesn't have). Unlike the header hash, it covers the finished
+    sub slots and the VDF proofs, so blocks with the same digest have the
+    same header.
+    """
+    return HeaderBlock(
+        block.finished_sub_slots,
+        block.reward_chain_block,
+        block.challenge_chain_sp_proof,
+        block.challenge_chain_ip_proof,
+        block.reward_chain_sp_proof,
+        block.reward_chain_ip_proof,
+        block.infused_challenge_chain_ip_proof,
+        block.foliage,
+        block.foliage_transaction_block,
+        b"",
+        block.transactions_info,
+    ).get_hash()
+
+
 def additions_for_npc(npc_result: NPCResult) -> List[Coin]:
     additions: List[Coin] = []
 
@@ -1,5 +1,5 @@
 from collections import OrderedDict
-from typing import Any, Optional
+from typing import Any, Dict, Optional
 
 
 class LRUCache:
@@ -22,3 +22,60 @@ class LRUCache:
 
     def remove(self, key: Any) -> None:
         self.cache.pop(key)
+
+
+class SizedLRUCache:
+    """
+    An LRU cache bounded by the total size of its values, rather than by the
+    number of entries. The size of each value is passed in by the caller when
+    it's inserted. A value larger than the whole budget is not cached.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.cache: OrderedDict = OrderedDict()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self.cache
+
+    def get(self, key: Any) -> Optional[Any]:
+        entry = self.cache.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.cache.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Any, value: Any, size: int) -> None:
+        self.remove(key)
+        if size > self.max_bytes:
+            return
+        self.cache[key] = (value, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted_size) = self.cache.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def remove(self, key: Any) -> None:
+        entry = self.cache.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self.cache),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -1,22 +1,16 @@
 import asyncio
 import logging
-import pathlib
 import random
-import tempfile
-from concurrent.futures.process import ProcessPoolExecutor
 from multiprocessing.context import BaseContext
-from typing import IO, List, Tuple, Optional
+from typing import List, Tuple, Optional
 
 from chia.consensus.block_record import BlockRecord
 from chia.consensus.constants import ConsensusConstants
 from chia.full_node.weight_proof import (
+    WeightProofValidationPool,
     _validate_sub_epoch_summaries,
-    vars_to_bytes,
     validate_sub_epoch_sampling,
-    _validate_sub_epoch_segments,
-    _validate_recent_blocks_and_get_records,
-    chunks,
-    _validate_vdf_batch,
+    validate_weight_proof_in_pool,
 )
 from chia.types.blockchain_format.sub_epoch_summary import SubEpochSummary
 
@@ -25,15 +19,10 @@ from chia.types.weight_proof import (
 )
 
 from chia.util.ints import uint32
-from chia.util.setproctitle import getproctitle, setproctitle
 
 log = logging.getLogger(__name__)
 
 
-def _create_shutdown_file() -> IO:
-    return tempfile.NamedTemporaryFile(prefix="chia_wallet_weight_proof_handler_executor_shutdown_trigger")
-
-
 class WalletWeightProofHandler:
 
     LAMBDA_L = 100
@@ -47,13 +36,8 @@ class WalletWeightProofHandler:
     ):
         self._constants = constants
         self._num_processes = 4
-        self._executor_shutdown_tempfile: IO = _create_shutdown_file()
-        self._executor: ProcessPoolExecutor = ProcessPoolExecutor(
-            self._num_processes,
-            mp_context=multiprocessing_context,
-            initializer=setproctitle,
-            initargs=(f"{getproctitle()}_worker",),
-        )
+        self._validation_pool = WeightProofValidationPool(constants, self._num_processes, multiprocessing_context)
+        self._validation_pool.warm_up()
         self._weight_proof_tasks: List[asyncio.Task] = []
 
     def cancel_weight_proof_tasks(self):
@@ -61,8 +45,7 @@ class WalletWeightProofHandler:
             if not task.done():
                 task.cancel()
         self._weight_proof_tasks = []
-        self._executor_shutdown_tempfile.close()
-        self._executor.shutdown(wait=True)
+        self._validation_pool.shut_down()
 
     async def validate_weight_proof(
         self, weight_proof: WeightProof, skip_segment_validation=False
@@ -102,61 +85,10 @@ class WalletWeightProofHandler:
             log.error("failed weight proof sub epoch sample validation")
             return False, uint32(0), [], []
 
-        constants, summary_bytes, wp_segment_bytes, wp_recent_chain_bytes = vars_to_bytes(
-            self._constants, summaries, weight_proof
-        )
-        await asyncio.sleep(0)  # break up otherwise multi-second sync code
-
-        vdf_tasks: List[asyncio.Future] = []
-        recent_blocks_validation_task: asyncio.Future = asyncio.get_running_loop().run_in_executor(
-            self._executor,
-            _validate_recent_blocks_and_get_records,
-            constants,
-            wp_recent_chain_bytes,
-            summary_bytes,
-            pathlib.Path(self._executor_shutdown_tempfile.name),
+        records_bytes = await validate_weight_proof_in_pool(
+            self._validation_pool, self._constants, weight_proof, summaries, rng, skip_segment_validation
         )
-        try:
-            if not skip_segment_validation:
-                segments_validated, vdfs_to_validate = _validate_sub_epoch_segments(
-                    constants, rng, wp_segment_bytes, summary_bytes
-                )
-                await asyncio.sleep(0)  # break up otherwise multi-second sync code
-
-                if not segments_validated:
-                    return False, uint32(0), [], []
-
-                vdf_chunks = chunks(vdfs_to_validate, self._num_processes)
-                for chunk in vdf_chunks:
-                    byte_chunks = []
-                    for vdf_proof, classgroup, vdf_info in chunk:
-                        byte_chunks.append((bytes(vdf_proof), bytes(classgroup), bytes(vdf_info)))
-
-                    vdf_task: asyncio.Future = asyncio.get_running_loop().run_in_executor(
-                        self._executor,
-                        _validate_vdf_batch,
-                        constants,
-                        byte_chunks,
-                        pathlib.Path(self._executor_shutdown_tempfile.name),
-                    )
-                    vdf_tasks.append(vdf_task)
-                    # give other stuff a turn
-                    await asyncio.sleep(0)
-
-                for vdf_task in vdf_tasks:
-                    validated = await vdf_task
-                    if not validated:
-                        return False, uint32(0), [], []
-
-            valid_recent_blocks, records_bytes = await recent_blocks_validation_task
-        finally:
-            recent_blocks_validation_task.cancel()
-            for vdf_task in vdf_tasks:
-                vdf_task.cancel()
-
-        if not valid_recent_blocks:
-            log.error("failed validating weight proof recent blocks")
-            # Verify the data
+        if records_bytes is None:
             return False, uint32(0), [], []
 
         records = [BlockRecord.from_bytes(b) for b in records_bytes]
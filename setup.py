@@ -33,6 +33,7 @@ dependencies = [
     "dnslib==0.9.17",  # dns lib
     "typing-extensions==4.0.1",  # typing backports like Protocol and TypedDict
     "zstd==1.5.0.4",
+    "zstandard==0.17.0",  # trained dictionaries for block compression
     "packaging==21.0",
 ]
 
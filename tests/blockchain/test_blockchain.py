@@ -13,6 +13,7 @@ import pytest
 from blspy import AugSchemeMPL, G2Element
 from clvm.casts import int_to_bytes
 
+from chia.consensus.augmented_chain import AugmentedBlockchain
 from chia.consensus.block_header_validation import validate_finished_header_block
 from chia.consensus.block_rewards import calculate_base_farmer_reward
 from chia.consensus.blockchain import ReceiveBlockResult, Blockchain
@@ -35,7 +36,7 @@ from chia.types.full_block import FullBlock
 from chia.types.generator_types import BlockGenerator
 from chia.types.spend_bundle import SpendBundle
 from chia.types.unfinished_block import UnfinishedBlock
-from chia.util.generator_tools import get_block_header
+from chia.util.generator_tools import get_block_header, get_header_digest
 from tests.block_tools import create_block_tools_async, get_vdf_info_and_proof
 from chia.util.errors import Err
 from chia.util.hash import std_hash
@@ -1735,6 +1736,125 @@ class TestPreValidation:
         log.info(f"Average pv: {sum(times_pv)/(len(blocks)/n_at_a_time)}")
         log.info(f"Average rb: {sum(times_rb)/(len(blocks))}")
 
+    @pytest.mark.asyncio
+    async def test_pre_validation_pipelined(self, empty_blockchain, default_1000_blocks):
+        b = empty_blockchain
+        blocks = default_1000_blocks[:100]
+        batches = [blocks[i : i + 20] for i in range(0, len(blocks), 20)]
+        block_records, pending = await b.start_pre_validate_blocks(batches[0], {}, validate_signatures=True)
+        for i, batch in enumerate(batches):
+            results = await pending
+            if i + 1 < len(batches):
+                # the next batch builds on this one, which hasn't been added yet
+                next_records, pending = await b.start_pre_validate_blocks(
+                    batches[i + 1],
+                    {},
+                    validate_signatures=True,
+                    unapplied_blocks=list(zip(batch, block_records)),
+                    block_bytes=[bytes(block) for block in batches[i + 1]],
+                )
+            for block, block_record, res in zip(batch, block_records, results):
+                assert res.error is None
+                assert block_record.header_hash == block.header_hash
+                result, err, _, _ = await b.receive_block(block, res)
+                assert err is None
+                assert result == ReceiveBlockResult.NEW_PEAK
+                assert b.block_record(block.header_hash) == block_record
+            if i + 1 < len(batches):
+                block_records = next_records
+        assert b.get_peak().height == 99
+
+    @pytest.mark.asyncio
+    async def test_pre_validation_pipelined_generator_ref(self, empty_blockchain, bt):
+        b = empty_blockchain
+        blocks = bt.get_consecutive_blocks(
+            3,
+            guarantee_transaction_block=True,
+            farmer_reward_puzzle_hash=bt.pool_ph,
+            pool_reward_puzzle_hash=bt.pool_ph,
+        )
+        for block in blocks:
+            await _validate_and_add_block(b, block)
+        wt: WalletTool = bt.get_pool_wallet_tool()
+        reward_coins = list(blocks[-1].get_included_reward_coins())
+        tx: SpendBundle = wt.generate_signed_transaction(10, wt.get_new_puzzlehash(), reward_coins[0])
+        tx_2: SpendBundle = wt.generate_signed_transaction(10, wt.get_new_puzzlehash(), reward_coins[1])
+        blocks = bt.get_consecutive_blocks(
+            1, block_list_input=blocks, guarantee_transaction_block=True, transaction_data=tx
+        )
+        generator_arg = detect_potential_template_generator(blocks[-1].height, blocks[-1].transactions_generator)
+        assert generator_arg is not None
+        blocks = bt.get_consecutive_blocks(
+            1,
+            block_list_input=blocks,
+            guarantee_transaction_block=True,
+            transaction_data=tx_2,
+            previous_generator=generator_arg,
+        )
+        assert len(blocks[-1].transactions_generator_ref_list) > 0
+
+        # the block referencing the generator is pre-validated before the
+        # block with the generator is in the database
+        first_records, first_pending = await b.start_pre_validate_blocks(blocks[-2:-1], {}, validate_signatures=True)
+        _, second_pending = await b.start_pre_validate_blocks(
+            blocks[-1:], {}, validate_signatures=True, unapplied_blocks=[(blocks[-2], first_records[0])]
+        )
+        # the records of the unapplied blocks don't leak into the blockchain
+        assert not b.contains_block(blocks[-2].header_hash)
+        assert not b.contains_block(blocks[-1].header_hash)
+        first_result = (await first_pending)[0]
+        second_result = (await second_pending)[0]
+        assert first_result.error is None
+        assert second_result.error is None
+
+        result, err, _, _ = await b.receive_block(blocks[-2], first_result)
+        assert err is None and result == ReceiveBlockResult.NEW_PEAK
+        result, err, _, _ = await b.receive_block(blocks[-1], second_result)
+        assert err is None and result == ReceiveBlockResult.NEW_PEAK
+
+    @pytest.mark.asyncio
+    async def test_pre_validation_headers_first(self, empty_blockchain, default_1000_blocks):
+        b = empty_blockchain
+        blocks = default_1000_blocks[:100]
+        batches = [blocks[i : i + 20] for i in range(0, len(blocks), 20)]
+
+        # the headers are validated on top of each other, without the blocks
+        # being added
+        chain = AugmentedBlockchain(b)
+        digests: List[bytes32] = []
+        for batch in batches:
+            header_blocks = [get_block_header(block, [], []) for block in batch]
+            block_records, pending = await b.start_pre_validate_headers(chain, header_blocks)
+            for block_record in block_records:
+                chain.add_extra_block_record(block_record)
+            for res in await pending:
+                assert res.error is None
+            digests.extend(get_header_digest(hb) for hb in header_blocks)
+        assert chain.get_peak_height() == 99
+        assert b.get_peak() is None
+
+        for batch in batches:
+            _, pending = await b.start_pre_validate_blocks(
+                batch, {}, validate_signatures=True, header_digests=[digests[block.height] for block in batch]
+            )
+            for block, res in zip(batch, await pending):
+                assert res.error is None
+                result, err, _, _ = await b.receive_block(block, res)
+                assert err is None and result == ReceiveBlockResult.NEW_PEAK
+        assert b.get_peak().height == 99
+
+        # headers that were validated already aren't validated again
+        next_block = default_1000_blocks[100]
+        bad_proof = recursive_replace(
+            next_block, "challenge_chain_ip_proof.witness", bytes(len(next_block.challenge_chain_ip_proof.witness))
+        )
+        res = await b.pre_validate_blocks_multiprocessing([bad_proof], {}, validate_signatures=True)
+        assert res[0].error is not None
+        _, pending = await b.start_pre_validate_blocks(
+            [bad_proof], {}, validate_signatures=True, header_digests=[get_header_digest(bad_proof)]
+        )
+        assert (await pending)[0].error is None
+
 
 class TestBodyValidation:
 
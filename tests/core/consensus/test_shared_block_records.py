@@ -0,0 +1,73 @@
+import dataclasses
+from typing import List
+
+import pytest
+
+from chia.consensus.block_record import BlockRecord
+from chia.consensus.blockchain import ReceiveBlockResult
+from chia.consensus.shared_block_records import SharedBlockRecords, load_block_records
+
+
+async def get_block_records(blockchain, blocks) -> List[BlockRecord]:
+    results = await blockchain.pre_validate_blocks_multiprocessing(blocks, {}, validate_signatures=True)
+    for block, result in zip(blocks, results):
+        assert result.error is None
+        res, err, _, _ = await blockchain.receive_block(block, result)
+        assert err is None and res == ReceiveBlockResult.NEW_PEAK
+    return [blockchain.block_record(block.header_hash) for block in blocks]
+
+
+@pytest.mark.asyncio
+async def test_shared_block_records(empty_blockchain, default_400_blocks):
+    block_records = await get_block_records(empty_blockchain, default_400_blocks[:20])
+    record_size = max(len(bytes(r)) for r in block_records)
+    # room for the first 15 records
+    shared = SharedBlockRecords(sum(len(bytes(r)) for r in block_records[:15]))
+    try:
+        refs = shared.refs(block_records[:10])
+        assert refs is not None
+        assert load_block_records(refs) == {r.header_hash: r for r in block_records[:10]}
+
+        # records are only written once
+        used = shared._used
+        refs_2 = shared.refs(block_records[5:15])
+        assert refs_2 is not None
+        assert refs_2[0] == refs[0]
+        assert refs_2[1][:5] == refs[1][5:]
+        assert shared._used < used * 2
+        assert load_block_records(refs_2) == {r.header_hash: r for r in block_records[5:15]}
+
+        # when the segment is full, the records move to a new one
+        refs_3 = shared.refs(block_records[12:20])
+        assert refs_3 is not None
+        assert refs_3[0] != refs[0]
+        assert load_block_records(refs_3) == {r.header_hash: r for r in block_records[12:20]}
+        # and the previous one stays readable, for batches still using it
+        assert load_block_records(refs_2) == {r.header_hash: r for r in block_records[5:15]}
+
+        assert shared.refs(block_records[12:20] * 2) == (refs_3[0], refs_3[1] * 2)
+
+        # a different record with the same header hash isn't confused with it
+        changed = dataclasses.replace(block_records[19], deficit=block_records[19].deficit + 1)
+        refs_4 = shared.refs([changed])
+        assert refs_4 is not None
+        assert refs_4[1] != refs_3[1][-1:]
+        assert load_block_records(refs_4) == {changed.header_hash: changed}
+    finally:
+        shared.close()
+
+    # records that can't fit in a segment
+    small = SharedBlockRecords(record_size)
+    try:
+        assert small.refs(block_records[:5]) is None
+    finally:
+        small.close()
+
+
+@pytest.mark.asyncio
+async def test_pre_validation_with_shared_records(empty_blockchain, default_400_blocks):
+    # the blockchain fixture validates with a process pool, which gets the
+    # block records through shared memory
+    await get_block_records(empty_blockchain, default_400_blocks[:100])
+    assert empty_blockchain._shared_block_records is not None
+    assert empty_blockchain._shared_block_records._used > 0
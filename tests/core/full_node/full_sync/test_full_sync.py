@@ -182,6 +182,26 @@ class TestFullSync:
         await time_out_assert(180, node_height_exactly, True, full_node_1, 999)
         await time_out_assert(180, node_height_exactly, True, full_node_2, 999)
 
+    @pytest.mark.asyncio
+    async def test_long_sync_headers_first(self, three_nodes, default_400_blocks, self_hostname):
+        full_node_1, full_node_2, full_node_3 = three_nodes
+        server_1 = full_node_1.full_node.server
+        server_2 = full_node_2.full_node.server
+        server_3 = full_node_3.full_node.server
+        for block in default_400_blocks:
+            await full_node_1.full_node.respond_block(full_node_protocol.RespondBlock(block))
+            await full_node_2.full_node.respond_block(full_node_protocol.RespondBlock(block))
+
+        # the headers and then the blocks are downloaded from both peers
+        full_node_3.full_node.config["sync_headers_first"] = True
+        await server_3.start_client(
+            PeerInfo(self_hostname, uint16(server_1._port)), on_connect=full_node_3.full_node.on_connect
+        )
+        await server_3.start_client(
+            PeerInfo(self_hostname, uint16(server_2._port)), on_connect=full_node_3.full_node.on_connect
+        )
+        await time_out_assert(180, node_height_exactly, True, full_node_3, len(default_400_blocks) - 1)
+
     @pytest.mark.asyncio
     async def test_batch_sync(self, two_nodes, bt, self_hostname):
         # Must be below "sync_block_behind_threshold" in the config
@@ -2,6 +2,7 @@ from typing import Tuple
 from pathlib import Path
 
 import random
+import tempfile
 import aiosqlite
 
 from chia.consensus.blockchain import Blockchain
@@ -20,5 +21,7 @@ async def create_ram_blockchain(consensus_constants: ConsensusConstants) -> Tupl
     block_store = await BlockStore.create(db_wrapper)
     coin_store = await CoinStore.create(db_wrapper)
     hint_store = await HintStore.create(db_wrapper)
-    blockchain = await Blockchain.create(coin_store, block_store, consensus_constants, hint_store, Path("."), 2)
+    blockchain = await Blockchain.create(
+        coin_store, block_store, consensus_constants, hint_store, Path(tempfile.mkdtemp()), 2
+    )
     return db_wrapper, blockchain
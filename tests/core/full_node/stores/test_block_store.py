@@ -3,6 +3,7 @@ import logging
 import random
 import sqlite3
 import dataclasses
+from typing import List
 
 import pytest
 from clvm.casts import int_to_bytes
@@ -10,15 +11,18 @@ from clvm.casts import int_to_bytes
 from chia.consensus.blockchain import Blockchain
 from chia.consensus.full_block_to_block_record import header_block_to_sub_block_record
 from chia.consensus.default_constants import DEFAULT_CONSTANTS
+from chia.full_node.block_archive import BlockArchive
 from chia.full_node.block_store import BlockStore
 from chia.full_node.coin_store import CoinStore
 from chia.full_node.hint_store import HintStore
 from chia.util.ints import uint8
 from chia.types.blockchain_format.vdf import VDFProof
 from chia.types.blockchain_format.program import SerializedProgram
+from chia.util.block_compression import BlockCompressor, train_dictionary
 from tests.blockchain.blockchain_test_utils import _validate_and_add_block
 from tests.util.db_connection import DBConnection
 from tests.setup_nodes import test_constants
+from tests.util.test_block_compression import make_samples
 
 
 log = logging.getLogger(__name__)
@@ -264,3 +268,128 @@ class TestBlockStore:
             assert await store.get_generator(blocks[4].header_hash) == new_blocks[4].transactions_generator
             assert await store.get_generator(blocks[6].header_hash) == new_blocks[6].transactions_generator
             assert await store.get_generator(blocks[7].header_hash) == new_blocks[7].transactions_generator
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("block_cache_bytes", [0, 30000, 100000000])
+    async def test_block_cache(self, bt, db_version, block_cache_bytes):
+        blocks = bt.get_consecutive_blocks(10)
+
+        async with DBConnection(db_version) as db_wrapper:
+            store = await BlockStore.create(db_wrapper, block_cache_bytes=block_cache_bytes)
+
+            for block in blocks:
+                block_record = header_block_to_sub_block_record(
+                    DEFAULT_CONSTANTS, 0, block, 0, False, 0, max(0, block.height - 1), None
+                )
+                await store.add_full_block(block.header_hash, block, block_record)
+                stats = store.block_cache.get_stats()
+                assert stats["serialized"]["bytes"] + stats["parsed"]["bytes"] <= block_cache_bytes
+
+            for block in blocks:
+                assert await store.get_full_block_bytes(block.header_hash) == bytes(block)
+                assert await store.get_full_block(block.header_hash) == block
+                assert await store.get_generator(block.header_hash) == block.transactions_generator
+            assert await store.get_blocks_by_hash([b.header_hash for b in blocks]) == blocks
+
+            # a block only in the serialized tier is promoted when requested parsed
+            store.block_cache.parsed.remove(blocks[-1].header_hash)
+            assert await store.get_generator(blocks[-1].header_hash) == blocks[-1].transactions_generator
+            assert await store.get_full_block(blocks[-1].header_hash) == blocks[-1]
+
+            store.rollback_cache_block(blocks[-1].header_hash)
+            store.rollback_cache_block(blocks[-1].header_hash)
+            assert store.block_cache.get(blocks[-1].header_hash) is None
+            assert store.block_cache.get_bytes(blocks[-1].header_hash) is None
+
+            stats = store.block_cache.get_stats()
+            if block_cache_bytes == 0:
+                assert stats["parsed"]["hits"] == 0
+                assert stats["serialized"]["hits"] == 0
+            else:
+                assert stats["parsed"]["hits"] > 0
+                assert stats["serialized"]["hits"] > 0
+
+    @pytest.mark.asyncio
+    async def test_block_archive(self, bt, tmp_path):
+        blocks = bt.get_consecutive_blocks(10)
+
+        async with DBConnection(2) as db_wrapper:
+            archive = BlockArchive(tmp_path / "blocks", segment_size=10000)
+            store = await BlockStore.create(db_wrapper, block_cache_bytes=0, archive=archive)
+
+            # the archive is synced before the transaction adding a block commits
+            real_sync = archive.sync
+            synced: List[bool] = []
+
+            def sync() -> None:
+                assert db_wrapper._current_writer is not None
+                real_sync()
+                synced.append(True)
+
+            archive.sync = sync  # type: ignore[assignment]
+
+            for block in blocks:
+                block_record = header_block_to_sub_block_record(
+                    DEFAULT_CONSTANTS, 0, block, 0, False, 0, max(0, block.height - 1), None
+                )
+                await store.add_full_block(block.header_hash, block, block_record)
+                await store.add_full_block(block.header_hash, block, block_record)
+                await store.set_in_chain([(block_record.header_hash,)])
+            assert len(synced) == len(blocks)
+
+            # the blocks are not stored in the database
+            async with db_wrapper.read_db() as conn:
+                async with conn.execute("SELECT COUNT(*) FROM full_blocks WHERE block IS NOT NULL") as cursor:
+                    assert (await cursor.fetchone())[0] == 0
+                async with conn.execute("SELECT COUNT(*) FROM block_archive") as cursor:
+                    assert (await cursor.fetchone())[0] == len(blocks)
+
+            for block in blocks:
+                assert await store.get_full_block(block.header_hash) == block
+                assert await store.get_full_block_bytes(block.header_hash) == bytes(block)
+                assert await store.get_generator(block.header_hash) == block.transactions_generator
+                assert await store.get_full_blocks_at([block.height]) == [block]
+            assert await store.get_blocks_by_hash([b.header_hash for b in blocks]) == blocks
+
+            new_block = dataclasses.replace(blocks[5], challenge_chain_ip_proof=VDFProof(uint8(1), b"1" * 32, False))
+            await store.replace_proof(blocks[5].header_hash, new_block)
+            assert await store.get_full_block(blocks[5].header_hash) == new_block
+            store.close()
+
+            # the blockchain database can't be opened without the archive
+            with pytest.raises(RuntimeError):
+                await BlockStore.create(db_wrapper)
+
+            archive = BlockArchive(tmp_path / "blocks", segment_size=10000)
+            store = await BlockStore.create(db_wrapper, archive=archive)
+            assert await store.get_full_block(blocks[5].header_hash) == new_block
+            assert await store.get_full_block(blocks[9].header_hash) == blocks[9]
+            store.close()
+
+    @pytest.mark.asyncio
+    async def test_dictionary_added_while_running(self, bt):
+        blocks = bt.get_consecutive_blocks(3)
+
+        async with DBConnection(2) as db_wrapper:
+            store = await BlockStore.create(db_wrapper, block_cache_bytes=0)
+            for block in blocks:
+                block_record = header_block_to_sub_block_record(
+                    DEFAULT_CONSTANTS, 0, block, 0, False, 0, max(0, block.height - 1), None
+                )
+                await store.add_full_block(block.header_hash, block, block_record)
+
+            # this is what "chia db recompress" does to the database while the
+            # node is running
+            dict_data = train_dictionary(make_samples(1000), 1, 4096)
+            compressor = BlockCompressor({1: dict_data})
+            async with db_wrapper.write_db() as conn:
+                await conn.execute("INSERT INTO compression_dictionaries VALUES(?, ?)", (1, dict_data))
+                await conn.execute(
+                    "UPDATE full_blocks SET block=? WHERE header_hash=?",
+                    (compressor.compress(bytes(blocks[1])), blocks[1].header_hash),
+                )
+
+            assert not store.compressor.has_dictionary(1)
+            assert await store.get_full_block(blocks[1].header_hash) == blocks[1]
+            assert store.compressor.current_dict_id == 1
+            assert await store.get_blocks_by_hash([b.header_hash for b in blocks]) == blocks
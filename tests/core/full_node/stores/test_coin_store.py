@@ -229,13 +229,90 @@ class TestCoinStoreWithBlocks:
 
         assert test_excercised
 
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("undo_journal_heights", [0, 100])
+    async def test_rolled_back_transaction(self, undo_journal_heights: int, db_version, bt):
+        blocks = bt.get_consecutive_blocks(9, [])
+        tx_blocks = [b for b in blocks if b.is_transaction_block() and len(b.get_included_reward_coins()) > 0]
+        first, second = tx_blocks[:2]
+
+        async with DBConnection(db_version) as db_wrapper:
+            coin_store = await CoinStore.create(
+                db_wrapper, unspent_index_bytes=1000000, undo_journal_heights=undo_journal_heights
+            )
+            assert first.foliage_transaction_block is not None
+            await coin_store.new_block(
+                first.height, first.foliage_transaction_block.timestamp, first.get_included_reward_coins(), [], []
+            )
+            spent = [coin.name() for coin in first.get_included_reward_coins()]
+            added = [coin.name() for coin in second.get_included_reward_coins()]
+
+            with pytest.raises(RuntimeError):
+                async with db_wrapper.write_db():
+                    assert second.foliage_transaction_block is not None
+                    await coin_store.new_block(
+                        second.height,
+                        second.foliage_transaction_block.timestamp,
+                        second.get_included_reward_coins(),
+                        [],
+                        spent,
+                    )
+                    raise RuntimeError("failure while adding the block")
+
+            # the in-memory state doesn't keep the changes that were rolled back
+            for name in spent:
+                record = await coin_store.get_coin_record(name)
+                assert record is not None and not record.spent
+            for name in added:
+                assert name not in coin_store.unspent_index
+                assert await coin_store.get_coin_record(name) is None
+            assert second.height not in coin_store._undo_journal
+
+            # rolling back past the first block (from the journal, if enabled)
+            # reverts only what was committed
+            await coin_store.rollback_to_block(first.height - 1)
+            for name in spent:
+                assert await coin_store.get_coin_record(name) is None
+
+    @pytest.mark.asyncio
+    async def test_disable_undo_journal(self, db_version, bt):
+        blocks = bt.get_consecutive_blocks(9, [])
+        tx_blocks = [b for b in blocks if b.is_transaction_block() and len(b.get_included_reward_coins()) > 0]
+
+        async with DBConnection(db_version) as db_wrapper:
+            coin_store = await CoinStore.create(db_wrapper, undo_journal_heights=100)
+            coin_store.set_undo_journal_enabled(False)
+            for block in tx_blocks:
+                assert block.foliage_transaction_block is not None
+                await coin_store.new_block(
+                    block.height, block.foliage_transaction_block.timestamp, block.get_included_reward_coins(), [], []
+                )
+            assert coin_store._undo_journal == {}
+            assert coin_store._journal_start is None
+
+            coin_store.set_undo_journal_enabled(True)
+            await coin_store.rollback_to_block(tx_blocks[0].height)
+            for coin in tx_blocks[1].get_included_reward_coins():
+                assert await coin_store.get_coin_record(coin.name()) is None
+            for coin in tx_blocks[0].get_included_reward_coins():
+                assert await coin_store.get_coin_record(coin.name()) is not None
+
     @pytest.mark.asyncio
     @pytest.mark.parametrize("cache_size", [0, 10, 100000])
-    async def test_rollback(self, cache_size: uint32, db_version, bt):
+    @pytest.mark.parametrize("unspent_index_bytes", [0, 1000, 1000000])
+    @pytest.mark.parametrize("undo_journal_heights", [0, 3, 100])
+    async def test_rollback(
+        self, cache_size: uint32, unspent_index_bytes: int, undo_journal_heights: int, db_version, bt
+    ):
         blocks = bt.get_consecutive_blocks(20)
 
         async with DBConnection(db_version) as db_wrapper:
-            coin_store = await CoinStore.create(db_wrapper, cache_size=uint32(cache_size))
+            coin_store = await CoinStore.create(
+                db_wrapper,
+                cache_size=uint32(cache_size),
+                unspent_index_bytes=unspent_index_bytes,
+                undo_journal_heights=undo_journal_heights,
+            )
 
             selected_coin: Optional[CoinRecord] = None
             all_coins: List[Coin] = []
@@ -316,13 +393,16 @@ class TestCoinStoreWithBlocks:
 
     @pytest.mark.asyncio
     @pytest.mark.parametrize("cache_size", [0, 10, 100000])
-    async def test_basic_reorg(self, cache_size: uint32, tmp_dir, db_version, bt):
+    @pytest.mark.parametrize("undo_journal_heights", [0, 100])
+    async def test_basic_reorg(self, cache_size: uint32, undo_journal_heights: int, tmp_dir, db_version, bt):
 
         async with DBConnection(db_version) as db_wrapper:
             initial_block_count = 30
             reorg_length = 15
             blocks = bt.get_consecutive_blocks(initial_block_count)
-            coin_store = await CoinStore.create(db_wrapper, cache_size=uint32(cache_size))
+            coin_store = await CoinStore.create(
+                db_wrapper, cache_size=uint32(cache_size), undo_journal_heights=undo_journal_heights
+            )
             store = await BlockStore.create(db_wrapper)
             hint_store = await HintStore.create(db_wrapper)
             b: Blockchain = await Blockchain.create(coin_store, store, test_constants, hint_store, tmp_dir, 2)
@@ -1,8 +1,10 @@
+import asyncio
 import logging
 import pytest
 from clvm.casts import int_to_bytes
 
 from chia.consensus.blockchain import Blockchain
+import chia.full_node.hint_store as hint_store_module
 from chia.full_node.hint_store import HintStore
 from chia.types.blockchain_format.coin import Coin
 from chia.types.condition_opcodes import ConditionOpcode
@@ -160,3 +162,69 @@ class TestHintStore:
 
             count = await hint_store.count_hints()
             assert count == 2
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("use_hint_filter", [True, False])
+    async def test_get_coin_ids_multi(self, db_version, use_hint_filter):
+        async with DBConnection(db_version) as db_wrapper:
+            hint_store = await HintStore.create(db_wrapper, use_hint_filter=use_hint_filter)
+
+            # more hints than fit in a single query
+            hints = [(i.to_bytes(32, "big"), (i // 2).to_bytes(32, "big")) for i in range(2000)]
+            await hint_store.add_hints(hints)
+
+            all_hints = [(i // 2).to_bytes(32, "big") for i in range(0, 2000, 2)]
+            coin_ids = await hint_store.get_coin_ids_multi(all_hints)
+            assert sorted(coin_ids) == sorted(coin_id for coin_id, _ in hints)
+
+            not_existing_hints = [(i + 5000).to_bytes(32, "big") for i in range(1000)]
+            assert await hint_store.get_coin_ids_multi(not_existing_hints) == []
+            assert await hint_store.get_coin_ids_multi([]) == []
+
+            coin_ids = await hint_store.get_coin_ids_multi([all_hints[3]] + not_existing_hints)
+            assert sorted(coin_ids) == [(6).to_bytes(32, "big"), (7).to_bytes(32, "big")]
+
+    @pytest.mark.asyncio
+    async def test_hint_filter_loaded(self, db_version):
+        async with DBConnection(db_version) as db_wrapper:
+            hint_store = await HintStore.create(db_wrapper, use_hint_filter=True)
+            hint_0 = 32 * b"\0"
+            coin_id_0 = 32 * b"\4"
+            await hint_store.add_hints([(coin_id_0, hint_0)])
+
+            # a new store on the same DB picks up existing hints in its filter
+            hint_store = await HintStore.create(db_wrapper, use_hint_filter=True)
+            assert hint_store.hint_filter is not None
+            assert hint_store.hint_filter.might_contain(hint_0)
+            assert not hint_store.hint_filter.might_contain(32 * b"\1")
+            assert await hint_store.get_coin_ids(hint_0) == [coin_id_0]
+
+    @pytest.mark.asyncio
+    async def test_hint_filter_grows(self, db_version, monkeypatch):
+        monkeypatch.setattr(hint_store_module, "FILTER_MIN_HINTS", 100)
+        async with DBConnection(db_version) as db_wrapper:
+            hint_store = await HintStore.create(db_wrapper, use_hint_filter=True)
+            assert hint_store.hint_filter is not None
+            assert hint_store.hint_filter.num_bits == 100 * hint_store_module.FILTER_BITS_PER_HINT
+
+            hints = [(i.to_bytes(32, "big"), (i + 1000).to_bytes(32, "big")) for i in range(150)]
+            await hint_store.add_hints(hints[:100])
+            assert hint_store.hint_filter.num_bits == 100 * hint_store_module.FILTER_BITS_PER_HINT
+
+            # once the filter is full, it's rebuilt with room to grow. That
+            # happens in the background, once the write transaction is done
+            async with db_wrapper.write_db():
+                await hint_store.add_hints(hints[100:120])
+                rebuild = hint_store._rebuild_task
+                assert rebuild is not None
+                await asyncio.sleep(0.1)
+                assert not rebuild.done()
+                # until the new filter is ready, hints are added to both
+                await hint_store.add_hints(hints[120:])
+                assert hint_store.hint_filter.num_bits == 100 * hint_store_module.FILTER_BITS_PER_HINT
+            await rebuild
+            assert hint_store._rebuild_task is None
+            assert hint_store.hint_filter.num_bits == 240 * hint_store_module.FILTER_BITS_PER_HINT
+            for coin_id, hint in hints:
+                assert hint_store.hint_filter.might_contain(hint)
+                assert await hint_store.get_coin_ids(hint) == [coin_id]
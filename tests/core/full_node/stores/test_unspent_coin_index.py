@@ -0,0 +1,64 @@
+from chia.full_node.unspent_coin_index import ENTRY_OVERHEAD, RECORD_FORMAT, UnspentCoinIndex
+from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.coin_record import CoinRecord
+from chia.util.ints import uint32, uint64
+
+
+def make_record(i: int, coinbase: bool = False) -> CoinRecord:
+    coin = Coin(bytes32(i.to_bytes(32, "big")), bytes32(b"\x01" * 32), uint64(i * 1000))
+    return CoinRecord(coin, uint32(i), uint32(0), coinbase, uint64(1600000000 + i))
+
+
+def test_add_get_remove() -> None:
+    index = UnspentCoinIndex(1000000)
+    records = [make_record(i, i % 2 == 0) for i in range(100)]
+    for r in records:
+        index.add(r)
+
+    assert len(index) == 100
+    for r in records:
+        assert index.get(r.name) == r
+
+    index.remove(records[10].name)
+    assert records[10].name not in index
+    assert index.get(records[10].name) is None
+
+    # removing a coin we don't have is a no-op
+    index.remove(records[10].name)
+    assert len(index) == 99
+
+    # the freed slot is reused
+    index.add(records[10])
+    assert index.get(records[10].name) == records[10]
+    assert index.memory_usage() == 100 * (RECORD_FORMAT.size + ENTRY_OVERHEAD)
+    assert index.hits == 101
+    assert index.misses == 1
+
+
+def test_eviction() -> None:
+    index = UnspentCoinIndex(10 * (RECORD_FORMAT.size + ENTRY_OVERHEAD))
+    assert index.capacity == 10
+    records = [make_record(i) for i in range(15)]
+    for r in records[:10]:
+        index.add(r)
+    # looking up a coin makes it the most recently used one
+    assert index.get(records[0].name) == records[0]
+    for r in records[10:]:
+        index.add(r)
+
+    assert len(index) == 10
+    assert index.evictions == 5
+    assert index.memory_usage() <= index.max_bytes
+    # the least recently used coins are evicted first
+    for r in records[1:6]:
+        assert index.get(r.name) is None
+    for r in records[:1] + records[6:]:
+        assert index.get(r.name) == r
+
+
+def test_disabled() -> None:
+    index = UnspentCoinIndex(0)
+    index.add(make_record(1))
+    assert len(index) == 0
+    assert index.get(make_record(1).name) is None
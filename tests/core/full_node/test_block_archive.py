@@ -0,0 +1,101 @@
+import os
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from chia.full_node.block_archive import BlockArchive
+
+
+def test_append_and_read(tmp_path: Path) -> None:
+    archive = BlockArchive(tmp_path / "blocks")
+    blobs = [bytes([i]) * (i + 1) for i in range(20)]
+    locations = [archive.append(blob) for blob in blobs]
+
+    offset = 0
+    for blob, (file_no, blob_offset) in zip(blobs, locations):
+        assert file_no == 0
+        assert blob_offset == offset
+        offset += len(blob)
+        assert archive.read(file_no, blob_offset, len(blob)) == blob
+
+    # reads after more blocks have been appended to an already mapped segment
+    blob = b"foobar"
+    file_no, offset = archive.append(blob)
+    assert archive.read(file_no, offset, len(blob)) == blob
+
+    with pytest.raises(ValueError):
+        archive.read(file_no, offset, len(blob) + 1)
+    archive.close()
+
+
+def test_remap(tmp_path: Path) -> None:
+    archive = BlockArchive(tmp_path)
+    file_no, offset = archive.append(b"foo")
+    view = archive.read(file_no, offset, 3)
+    old_map = archive._maps[file_no]
+
+    # the old map is still in use when the segment is remapped
+    file_no, offset = archive.append(b"bar")
+    assert archive.read(file_no, offset, 3) == b"bar"
+    assert archive._retired_maps == [old_map]
+    assert view == b"foo"
+    view.release()
+
+    # and closed on the next remap, once it's no longer in use
+    current_map = archive._maps[file_no]
+    file_no, offset = archive.append(b"baz")
+    assert archive.read(file_no, offset, 3) == b"baz"
+    assert archive._retired_maps == []
+    assert old_map.closed and current_map.closed
+    archive.close()
+
+
+def test_sync(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    synced: List[int] = []
+    real_fsync = os.fsync
+
+    def fsync(fd: int) -> None:
+        synced.append(fd)
+        real_fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", fsync)
+    archive = BlockArchive(tmp_path)
+    archive.sync()
+    assert synced == []
+    archive.append(b"foo")
+    archive.sync()
+    assert len(synced) == 1
+    # nothing was appended since the last sync
+    archive.sync()
+    assert len(synced) == 1
+    archive.close()
+
+
+def test_segments(tmp_path: Path) -> None:
+    archive = BlockArchive(tmp_path, segment_size=100)
+    blobs = [bytes([i]) * 40 for i in range(10)]
+    locations = [archive.append(blob) for blob in blobs]
+    # two blobs fit in each segment
+    assert [loc[0] for loc in locations] == [0, 0, 1, 1, 2, 2, 3, 3, 4, 4]
+    assert [loc[1] for loc in locations] == [0, 40] * 5
+
+    # a blob larger than a segment gets a segment of its own
+    big_blob = b"x" * 150
+    assert archive.append(big_blob) == (5, 0)
+    assert archive.append(b"y") == (6, 0)
+
+    # views into the segments remain valid until they're released, even when
+    # the archive is closed
+    view = archive.read(3, 0, 40)
+    archive.close()
+    assert view == blobs[6]
+    view.release()
+
+    # the archive resumes appending to the last segment
+    archive = BlockArchive(tmp_path, segment_size=100)
+    assert archive.append(b"z") == (6, 1)
+    for blob, (file_no, offset) in zip(blobs, locations):
+        assert archive.read(file_no, offset, len(blob)) == blob
+    assert archive.read(5, 0, 150) == big_blob
+    archive.close()
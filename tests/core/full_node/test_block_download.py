@@ -0,0 +1,254 @@
+import asyncio
+from typing import Dict, List, Optional, Set
+
+import pytest
+
+from blspy import G2Element
+
+from chia.full_node.block_download import (
+    BlockDownloader,
+    HeaderBlockDownloader,
+    PeerSyncStats,
+    ValidatedHeaders,
+    parse_respond_blocks,
+    select_peer,
+)
+from chia.protocols.full_node_protocol import RejectBlocks, RequestBlocks, RespondBlocks
+from chia.protocols.protocol_message_types import ProtocolMessageTypes
+from chia.protocols.wallet_protocol import RejectHeaderBlocks, RequestHeaderBlocks, RespondHeaderBlocks
+from chia.server.outbound_message import make_msg
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.full_block import FullBlock
+from chia.util.generator_tools import get_block_header, get_header_digest
+from chia.util.ints import uint32
+from chia.util.recursive_replace import recursive_replace
+
+
+class FakePeer:
+    def __init__(self, name: int, blocks: List[FullBlock], delay: float = 0, fail: Optional[Set[int]] = None):
+        self.peer_node_id = bytes([name]) * 32
+        self.peer_host = f"peer-{name}"
+        self.blocks = blocks
+        self.delay = delay
+        # the start heights of the requests this peer won't respond to
+        self.fail = fail if fail is not None else set()
+        self.closed = False
+        self.bytes_read = 0
+        self.requests: List[int] = []
+        self.concurrent = 0
+        self.max_concurrent = 0
+
+    async def request_blocks(self, request: RequestBlocks, timeout: int, parse_response: bool = True):
+        assert not parse_response
+        self.requests.append(request.start_height)
+        self.concurrent += 1
+        self.max_concurrent = max(self.max_concurrent, self.concurrent)
+        try:
+            # later ranges respond first, to exercise the reordering
+            await asyncio.sleep(self.delay / (request.start_height + 1))
+        finally:
+            self.concurrent -= 1
+        if request.start_height in self.fail:
+            return None
+        if request.start_height == 64 and self.peer_host == "peer-9":
+            return make_msg(ProtocolMessageTypes.reject_blocks, RejectBlocks(request.start_height, request.end_height))
+        self.bytes_read += 1000 * (request.end_height - request.start_height + 1)
+        return make_msg(
+            ProtocolMessageTypes.respond_blocks,
+            RespondBlocks(
+                request.start_height,
+                request.end_height,
+                self.blocks[request.start_height : request.end_height + 1],
+            ),
+        )
+
+    async def request_header_blocks(self, request: RequestHeaderBlocks, timeout: int):
+        self.requests.append(request.start_height)
+        await asyncio.sleep(self.delay / (request.start_height + 1))
+        if request.start_height in self.fail:
+            return None
+        if request.start_height == 64 and self.peer_host == "peer-9":
+            return RejectHeaderBlocks(request.start_height, request.end_height)
+        blocks = self.blocks[request.start_height : request.end_height + 1]
+        return RespondHeaderBlocks(
+            request.start_height, request.end_height, [get_block_header(b, [], []) for b in blocks]
+        )
+
+    async def close(self, ban_time: int = 0):
+        self.closed = True
+
+
+async def download(downloader: BlockDownloader) -> List[FullBlock]:
+    queue: asyncio.Queue = asyncio.Queue(maxsize=2)
+    blocks: List[FullBlock] = []
+
+    async def consume():
+        while True:
+            res = await queue.get()
+            if res is None:
+                return
+            if isinstance(downloader, HeaderBlockDownloader):
+                assert res[2] == []
+            else:
+                assert res[2] == [bytes(b) for b in res[1]]
+            blocks.extend(res[1])
+
+    consumer = asyncio.create_task(consume())
+    try:
+        await downloader.run(queue)
+    finally:
+        await queue.put(None)
+        await consumer
+    return blocks
+
+
+@pytest.mark.asyncio
+async def test_parallel_download_in_order(default_400_blocks):
+    blocks = default_400_blocks[:200]
+    peers = [FakePeer(i, blocks, delay=0.01) for i in range(4)]
+    peer_stats: Dict[bytes32, PeerSyncStats] = {}
+    downloader = BlockDownloader(0, 199, 32, lambda: peers, max_in_flight=4, peer_stats=peer_stats)
+    received = await download(downloader)
+
+    assert [b.height for b in received] == list(range(200))
+    # every range was requested exactly once, spread over all peers
+    requests = sorted(h for p in peers for h in p.requests)
+    assert requests == list(range(0, 200, 32))
+    assert all(len(p.requests) > 0 for p in peers)
+    # but never more than one at a time from the same peer
+    assert all(p.max_concurrent == 1 for p in peers)
+
+    # the requests are measured
+    assert sum(s.requests for s in peer_stats.values()) == 7
+    for p in peers:
+        stats = peer_stats[p.peer_node_id]
+        assert stats.failures == 0
+        assert stats.latency is not None and stats.latency > 0
+        assert stats.bytes_per_second is not None and stats.bytes_per_second > 0
+
+
+@pytest.mark.asyncio
+async def test_retry_on_other_peer(default_400_blocks):
+    blocks = default_400_blocks[:100]
+    bad_peer = FakePeer(1, blocks, fail={32})
+    rejecting_peer = FakePeer(9, blocks)
+    good_peer = FakePeer(2, blocks, delay=0.01)
+    peers = [bad_peer, rejecting_peer, good_peer]
+    downloader = BlockDownloader(10, 99, 27, lambda: peers, max_in_flight=3)
+    received = await download(downloader)
+
+    assert [b.height for b in received] == list(range(10, 100))
+    # peers that don't respond are closed and dropped, peers that reject a
+    # request are kept
+    if 32 in bad_peer.requests:
+        assert bad_peer.closed
+        assert bad_peer not in peers
+    assert rejecting_peer in peers
+
+
+@pytest.mark.asyncio
+async def test_all_peers_fail(default_400_blocks):
+    blocks = default_400_blocks[:100]
+    peers = [FakePeer(i, blocks, fail={64}) for i in range(3)]
+    downloader = BlockDownloader(0, 99, 32, lambda: peers, max_in_flight=2)
+    with pytest.raises(RuntimeError, match="failed fetching 64 to 95"):
+        await download(downloader)
+    assert peers == []
+
+
+@pytest.mark.asyncio
+async def test_wrong_blocks(default_400_blocks):
+    blocks = default_400_blocks[:64]
+    lying_peer = FakePeer(1, default_400_blocks[1:65])
+    good_peer = FakePeer(2, blocks)
+    downloader = BlockDownloader(0, 63, 32, lambda: [lying_peer, good_peer], max_in_flight=2)
+    received = await download(downloader)
+
+    assert received == blocks
+    assert not lying_peer.closed
+    assert uint32(0) in good_peer.requests and uint32(32) in good_peer.requests
+
+
+@pytest.mark.asyncio
+async def test_download_headers(default_400_blocks):
+    blocks = default_400_blocks[:100]
+    peers = [FakePeer(1, blocks, fail={32}), FakePeer(9, blocks), FakePeer(2, blocks, delay=0.01)]
+    downloader = HeaderBlockDownloader(0, 99, 32, lambda: peers, max_in_flight=3)
+    received = await download(downloader)
+
+    assert [b.header_hash for b in received] == [b.header_hash for b in blocks]
+    assert [get_header_digest(b) for b in received] == [get_header_digest(b) for b in blocks]
+
+
+@pytest.mark.asyncio
+async def test_blocks_match_validated_headers(default_400_blocks):
+    blocks = default_400_blocks[:64]
+    validated_headers = ValidatedHeaders()
+    assert validated_headers.end_height is None
+    for b in blocks[10:]:
+        validated_headers.append(b.height, b.header_hash, get_header_digest(b))
+    assert (validated_headers.start_height, validated_headers.end_height, len(validated_headers)) == (10, 63, 54)
+    assert validated_headers.header_hash(40) == blocks[40].header_hash
+    assert validated_headers.digest(40) == get_header_digest(blocks[40])
+    assert validated_headers.header_hash(9) is None
+    assert validated_headers.digest(64) is None
+
+    # a peer with a different block at height 40
+    forked = blocks.copy()
+    forked[40] = recursive_replace(blocks[40], "foliage.foliage_block_data_signature", G2Element())
+    forked_peer = FakePeer(1, forked)
+    good_peer = FakePeer(2, blocks, delay=0.01)
+    downloader = BlockDownloader(
+        10, 63, 32, lambda: [forked_peer, good_peer], max_in_flight=2, validated_headers=validated_headers
+    )
+    received = await download(downloader)
+
+    assert received == blocks[10:]
+    assert not forked_peer.closed
+    assert 10 in good_peer.requests
+
+
+def test_parse_respond_blocks(default_400_blocks):
+    blocks = default_400_blocks[10:20]
+    data = bytes(RespondBlocks(uint32(10), uint32(19), blocks))
+    start, end, parsed, block_bytes = parse_respond_blocks(data)
+    assert (start, end) == (10, 19)
+    assert parsed == blocks
+    assert block_bytes == [bytes(b) for b in blocks]
+    with pytest.raises(ValueError):
+        parse_respond_blocks(data + b"\x00")
+
+
+def test_peer_sync_stats():
+    stats = PeerSyncStats()
+    stats.record(1000, 1.0)
+    assert stats.latency == 1.0
+    assert stats.bytes_per_second == 1000
+    stats.record(4000, 2.0)
+    assert 1.0 < stats.latency < 2.0
+    assert 1000 < stats.bytes_per_second < 2000
+    stats.record_failure()
+    assert stats.get_stats() == {
+        "latency": stats.latency,
+        "bytes_per_second": stats.bytes_per_second,
+        "requests": 3,
+        "failures": 1,
+    }
+
+
+def test_select_peer_prefers_fast_peers():
+    fast, slow, new, failing = [FakePeer(i, []) for i in range(4)]
+    peer_stats: Dict[bytes32, PeerSyncStats] = {}
+    for peer, rate in [(fast, 100000), (slow, 1000), (failing, 100000)]:
+        peer_stats[peer.peer_node_id] = PeerSyncStats()
+        peer_stats[peer.peer_node_id].record(rate, 1.0)
+    for _ in range(5):
+        peer_stats[failing.peer_node_id].record_failure()
+
+    picks = [select_peer([fast, slow, new, failing], peer_stats) for _ in range(2000)]
+    # unmeasured peers are assumed to be as fast as the fastest one
+    assert picks.count(fast) > 500
+    assert picks.count(new) > 500
+    assert picks.count(slow) < 100
+    assert picks.count(failing) < 100
+    assert select_peer([slow], peer_stats) is slow
@@ -1,4 +1,5 @@
 import pytest
+import shutil
 import struct
 from chia.full_node.block_height_map import BlockHeightMap, SesCache
 from chia.types.blockchain_format.sub_epoch_summary import SubEpochSummary
@@ -420,3 +421,127 @@ class TestBlockHeightMap:
             assert height_map.get_ses(6) == gen_ses(6)
             with pytest.raises(KeyError) as _:
                 height_map.get_ses(8)
+
+    @pytest.mark.asyncio
+    async def test_rollback_truncates_file(self, tmp_dir, db_version):
+
+        async with DBConnection(db_version) as db_wrapper:
+
+            await setup_db(db_wrapper)
+            await setup_chain(db_wrapper, 10)
+
+            height_map = await BlockHeightMap.create(tmp_dir, db_wrapper)
+            assert (tmp_dir / "height-to-hash").stat().st_size >= 11 * 32
+
+            height_map.rollback(5)
+            assert (tmp_dir / "height-to-hash").stat().st_size == 6 * 32
+
+            # new heights are written to the file in place
+            height_map.update_height(6, gen_block_hash(106), None)
+            height_map.update_height(7, gen_block_hash(107), None)
+            with open(tmp_dir / "height-to-hash", "rb") as f:
+                content = f.read()
+            assert content[5 * 32 : 6 * 32] == gen_block_hash(5)
+            assert content[6 * 32 : 7 * 32] == gen_block_hash(106)
+            assert content[7 * 32 : 8 * 32] == gen_block_hash(107)
+            assert not height_map.contains_height(8)
+
+    @pytest.mark.asyncio
+    async def test_file_in_use(self, tmp_dir, db_version):
+
+        async with DBConnection(db_version) as db_wrapper:
+
+            await setup_db(db_wrapper)
+            await setup_chain(db_wrapper, 10)
+
+            height_map = await BlockHeightMap.create(tmp_dir, db_wrapper)
+            height_map.update_height(11, gen_block_hash(11), None)
+
+            # the second instance can't use the file, it keeps its own copy of
+            # the height-to-hash map in memory
+            height_map2 = await BlockHeightMap.create(tmp_dir, db_wrapper)
+            for height in range(11):
+                assert height_map2.get_hash(height) == gen_block_hash(height)
+            assert not height_map2.contains_height(11)
+
+            height_map2.rollback(2)
+            height_map2.update_height(3, gen_block_hash(103), None)
+            assert height_map2.get_hash(3) == gen_block_hash(103)
+
+            for height in range(12):
+                assert height_map.get_hash(height) == gen_block_hash(height)
+
+    @pytest.mark.asyncio
+    async def test_close(self, tmp_dir, db_version):
+
+        async with DBConnection(db_version) as db_wrapper:
+
+            await setup_db(db_wrapper)
+            await setup_chain(db_wrapper, 10)
+
+            height_map = await BlockHeightMap.create(tmp_dir, db_wrapper)
+            height_map.update_height(11, gen_block_hash(11), None)
+            height_map.close()
+
+            # the map is kept in memory once closed
+            height_map.update_height(12, gen_block_hash(12), None)
+            assert height_map.get_hash(11) == gen_block_hash(11)
+
+            # the file is released and can be used by the next instance. The
+            # heights added after closing aren't in it
+            with open(tmp_dir / "height-to-hash", "rb") as f:
+                content = f.read()
+            assert len(content) == 12 * 32
+            assert content[11 * 32 :] == gen_block_hash(11)
+            height_map2 = await BlockHeightMap.create(tmp_dir, db_wrapper)
+            height_map2.update_height(11, gen_block_hash(111), None)
+            height_map2.close()
+            with open(tmp_dir / "height-to-hash", "rb") as f:
+                assert f.read()[11 * 32 :] == gen_block_hash(111)
+
+    @pytest.mark.asyncio
+    async def test_unflushed_changes(self, tmp_dir, db_version):
+
+        async with DBConnection(db_version) as db_wrapper:
+            await setup_db(db_wrapper)
+            await setup_chain(db_wrapper, 2000, ses_every=20)
+
+            height_map = await BlockHeightMap.create(tmp_dir, db_wrapper)
+            await height_map.maybe_flush()
+
+            # a reorg modifies the flushed part of the file in place. The
+            # modified entry is at a sub epoch summary height, so it would stop
+            # the loading from the DB. Copying the file before it's flushed
+            # again is what's on disk if the node crashes at this point
+            height_map.rollback(99)
+            height_map.update_height(100, gen_block_hash(10100), None)
+            crash_dir = tmp_dir / "crash"
+            crash_dir.mkdir()
+            shutil.copy(tmp_dir / "height-to-hash", crash_dir / "height-to-hash")
+            shutil.copy(tmp_dir / "height-to-hash.stamp", crash_dir / "height-to-hash.stamp")
+            height_map.close()
+
+            height_map = await BlockHeightMap.create(crash_dir, db_wrapper)
+            for height in range(2000):
+                assert height_map.get_hash(height) == gen_block_hash(height)
+            height_map.close()
+
+            # the part of the file that was flushed last is checked against the
+            # stamp, in case it didn't make it to disk in full
+            with open(crash_dir / "height-to-hash", "r+b") as f:
+                f.seek(100 * 32)
+                f.write(gen_block_hash(10100))
+            height_map = await BlockHeightMap.create(crash_dir, db_wrapper)
+            for height in range(2000):
+                assert height_map.get_hash(height) == gen_block_hash(height)
+            height_map.close()
+
+            # a file without a stamp isn't trusted either
+            (crash_dir / "height-to-hash.stamp").unlink()
+            with open(crash_dir / "height-to-hash", "r+b") as f:
+                f.seek(100 * 32)
+                f.write(gen_block_hash(10100))
+            height_map = await BlockHeightMap.create(crash_dir, db_wrapper)
+            for height in range(2000):
+                assert height_map.get_hash(height) == gen_block_hash(height)
+            height_map.close()
@@ -0,0 +1,55 @@
+import random
+from typing import Dict, List, Optional, Tuple
+
+from chia.full_node.fee_rate_index import FeeRateIndex
+
+
+def min_fee_rate_for(items: List[Tuple[float, int]], cost: int) -> Optional[float]:
+    removed = 0
+    for fee_per_cost, item_cost in sorted(items):
+        removed += item_cost
+        if removed >= cost:
+            return fee_per_cost
+    return None
+
+
+def test_fee_rate_index() -> None:
+    index = FeeRateIndex()
+    assert index.total_cost == 0
+    assert index.min_fee_rate_for(1) is None
+
+    index.add(2.5, 100)
+    index.add(1.0, 50)
+    index.add(2.5, 30)
+    assert index.total_cost == 180
+    assert index.min_fee_rate_for(50) == 1.0
+    assert index.min_fee_rate_for(51) == 2.5
+    assert index.min_fee_rate_for(180) == 2.5
+    assert index.min_fee_rate_for(181) is None
+
+    index.remove(1.0, 50)
+    assert index.min_fee_rate_for(1) == 2.5
+    index.remove(2.5, 100)
+    assert index.total_cost == 30
+    index.remove(2.5, 30)
+    assert index.total_cost == 0
+    assert index.min_fee_rate_for(1) is None
+
+
+def test_fee_rate_index_random() -> None:
+    rng = random.Random(1337)
+    index = FeeRateIndex()
+    items: Dict[int, Tuple[float, int]] = {}
+    for i in range(3000):
+        if len(items) > 0 and rng.random() < 0.4:
+            fee_per_cost, cost = items.pop(rng.choice(list(items.keys())))
+            index.remove(fee_per_cost, cost)
+        else:
+            # few distinct fee rates, so that many items share one
+            items[i] = (rng.randrange(50) / 7, rng.randrange(1, 1000))
+            index.add(*items[i])
+
+        total = sum(cost for _, cost in items.values())
+        assert index.total_cost == total
+        for cost in [1, rng.randrange(1, total + 2), total, total + 1]:
+            assert index.min_fee_rate_for(cost) == min_fee_rate_for(list(items.values()), cost)
@@ -9,7 +9,9 @@ import pytest
 from blspy import G2Element
 from clvm.casts import int_to_bytes
 
+from chia.consensus.blockchain import ReceiveBlockResult
 from chia.consensus.pot_iterations import is_overflow_block
+from chia.full_node.block_download import ValidatedHeaders
 from chia.full_node.bundle_tools import detect_potential_template_generator
 from chia.full_node.full_node_api import FullNodeAPI
 from chia.full_node.signage_point import SignagePoint
@@ -22,6 +24,7 @@ from chia.server.outbound_message import Message
 from chia.simulator.simulator_protocol import FarmNewBlockProtocol
 from chia.types.blockchain_format.classgroup import ClassgroupElement
 from chia.types.blockchain_format.program import Program, SerializedProgram
+from chia.types.blockchain_format.sized_bytes import bytes32
 from chia.types.blockchain_format.vdf import CompressibleVDFField, VDFProof
 from chia.types.coin_spend import CoinSpend
 from chia.types.condition_opcodes import ConditionOpcode
@@ -996,6 +999,68 @@ class TestFullNodeProtocol:
         assert msg is not None
         assert msg.data == bytes(fnp.RespondTransaction(spend_bundle))
 
+    @pytest.mark.asyncio
+    async def test_precomputed_generator(self, wallet_nodes, bt, self_hostname, monkeypatch):
+        full_node_1, full_node_2, server_1, server_2, wallet_a, wallet_receiver = wallet_nodes
+        wallet_ph = wallet_a.get_new_puzzlehash()
+        blocks = await full_node_1.get_all_full_blocks()
+
+        blocks = bt.get_consecutive_blocks(
+            3,
+            block_list_input=blocks,
+            guarantee_transaction_block=True,
+            farmer_reward_puzzle_hash=wallet_ph,
+            pool_reward_puzzle_hash=wallet_ph,
+        )
+        for block in blocks[-3:]:
+            await full_node_1.full_node.respond_block(fnp.RespondBlock(block))
+
+        peak_hash = full_node_1.full_node.mempool_manager.peak.header_hash
+        assert full_node_1.full_node.get_precomputed_generator(peak_hash) is None
+
+        # let the rebuild after the new peak finish
+        if full_node_1.full_node._precompute_generator_task is not None:
+            await full_node_1.full_node._precompute_generator_task
+
+        builds = 0
+        build_generator = full_node_1.full_node._build_generator
+
+        async def counting_build_generator(last_tb_header_hash):
+            nonlocal builds
+            builds += 1
+            return await build_generator(last_tb_header_hash)
+
+        monkeypatch.setattr(full_node_1.full_node, "_build_generator", counting_build_generator)
+        monkeypatch.setattr(full_node_1.full_node, "generator_precompute_delay", 1)
+
+        reward_coins = list(blocks[-1].get_included_reward_coins())
+        spend_bundles = [
+            wallet_a.generate_signed_transaction(100, wallet_receiver.get_new_puzzlehash(), coin)
+            for coin in reward_coins
+        ]
+        for spend_bundle in spend_bundles:
+            status, err = await full_node_1.full_node.respond_transaction(spend_bundle, spend_bundle.name(), test=True)
+            assert status == MempoolInclusionStatus.SUCCESS and err is None
+
+        # the generator is built in the background after the mempool changes, once for both transactions
+        await time_out_assert(10, lambda: full_node_1.full_node.get_precomputed_generator(peak_hash) is not None)
+        assert builds == 1
+        precomputed = full_node_1.full_node.get_precomputed_generator(peak_hash)
+        assert precomputed.spend_bundle == SpendBundle.aggregate(spend_bundles)
+        assert precomputed.npc_result.error is None
+        assert precomputed.npc_result.cost > 0
+
+        # declare_proof_of_space takes it as is, without building anything
+        async def no_build_generator(last_tb_header_hash):
+            raise AssertionError("the block generator was built again")
+
+        monkeypatch.setattr(full_node_1.full_node, "_build_generator", no_build_generator)
+        assert await full_node_1.full_node.get_block_generator(peak_hash) is precomputed
+
+        # a new peak makes it stale
+        await full_node_1.farm_new_transaction_block(FarmNewBlockProtocol(wallet_ph))
+        assert full_node_1.full_node.get_precomputed_generator(peak_hash) is None
+
     @pytest.mark.asyncio
     async def test_respond_transaction_fail(self, wallet_nodes, bt, self_hostname):
         full_node_1, full_node_2, server_1, server_2, wallet_a, wallet_receiver = wallet_nodes
@@ -1146,6 +1211,178 @@ class TestFullNodeProtocol:
         assert fetched_blocks[-1].transactions_generator is not None
         assert std_hash(fetched_blocks[-1]) == std_hash(blocks_t[-1])
 
+    @pytest.mark.asyncio
+    async def test_receive_block_batch_pipelined(self, wallet_nodes, bt, self_hostname):
+        full_node_1, full_node_2, server_1, server_2, wallet_a, wallet_receiver = wallet_nodes
+        peer = await connect_and_get_peer(server_1, server_2, self_hostname)
+        blocks = await full_node_1.get_all_full_blocks()
+        num_blocks = len(blocks)
+        blocks = bt.get_consecutive_blocks(40, block_list_input=blocks)
+        batch_1 = blocks[num_blocks : num_blocks + 20]
+        batch_2 = blocks[num_blocks + 20 :]
+
+        # the second batch is pre-validated before the first one is added
+        node = full_node_1.full_node
+        pre_validation_1 = await node.start_block_batch_pre_validation(batch_1)
+        pre_validation_2 = await node.start_block_batch_pre_validation(
+            batch_2, None, list(zip(pre_validation_1[0], pre_validation_1[1]))
+        )
+        success, advanced_peak, _, _ = await node.receive_block_batch(batch_1, peer, None, None, pre_validation_1)
+        assert success and advanced_peak
+        success, advanced_peak, _, _ = await node.receive_block_batch(batch_2, peer, None, None, pre_validation_2)
+        assert success and advanced_peak
+        assert node.blockchain.get_peak().header_hash == blocks[-1].header_hash
+
+        # when a batch is invalid, the one pre-validated on top of it is
+        # rejected too
+        blocks = bt.get_consecutive_blocks(10, block_list_input=blocks)
+        bad_block = recursive_replace(
+            blocks[-8], "reward_chain_block.total_iters", blocks[-8].reward_chain_block.total_iters + 1
+        )
+        batch_1 = blocks[-10:-8] + [bad_block] + blocks[-7:-5]
+        batch_2 = blocks[-5:]
+        pre_validation_1 = await node.start_block_batch_pre_validation(batch_1)
+        pre_validation_2 = await node.start_block_batch_pre_validation(
+            batch_2, None, list(zip(pre_validation_1[0], pre_validation_1[1]))
+        )
+        success, _, _, _ = await node.receive_block_batch(batch_1, peer, None, None, pre_validation_1)
+        assert not success
+        success, _, _, _ = await node.receive_block_batch(batch_2, peer, None, None, pre_validation_2)
+        assert not success
+        assert node.blockchain.get_peak().header_hash == blocks[-11].header_hash
+
+    @pytest.mark.asyncio
+    async def test_receive_block_batch_assume_valid(self, wallet_nodes, bt, self_hostname):
+        full_node_1, full_node_2, server_1, server_2, wallet_a, wallet_receiver = wallet_nodes
+        peer = await connect_and_get_peer(server_1, server_2, self_hostname)
+        node = full_node_1.full_node
+        blocks = await full_node_1.get_all_full_blocks()
+        num_blocks = len(blocks)
+        blocks = bt.get_consecutive_blocks(
+            3,
+            block_list_input=blocks,
+            guarantee_transaction_block=True,
+            farmer_reward_puzzle_hash=bt.pool_ph,
+            pool_reward_puzzle_hash=bt.pool_ph,
+        )
+        wt = bt.get_pool_wallet_tool()
+        tx = wt.generate_signed_transaction(
+            10, wt.get_new_puzzlehash(), list(blocks[-1].get_included_reward_coins())[0]
+        )
+        blocks = bt.get_consecutive_blocks(
+            1, block_list_input=blocks, guarantee_transaction_block=True, transaction_data=tx
+        )
+
+        # a block with an invalid signature, but otherwise valid
+        bad_block = recursive_replace(blocks[-1], "transactions_info.aggregated_signature", G2Element.generator())
+        bad_block = recursive_replace(
+            bad_block, "foliage_transaction_block.transactions_info_hash", bad_block.transactions_info.get_hash()
+        )
+        bad_block = recursive_replace(
+            bad_block, "foliage.foliage_transaction_block_hash", bad_block.foliage_transaction_block.get_hash()
+        )
+        new_m = bad_block.foliage.foliage_transaction_block_hash
+        new_fsb_sig = bt.get_plot_signature(new_m, bad_block.reward_chain_block.proof_of_space.plot_public_key)
+        bad_block = recursive_replace(bad_block, "foliage.foliage_transaction_block_signature", new_fsb_sig)
+        blocks = bt.get_consecutive_blocks(3, block_list_input=blocks[:-1] + [bad_block])
+        batch = blocks[num_blocks:]
+        trusted_block = blocks[-2]
+
+        success, _, _, _ = await node.receive_block_batch(batch, peer, None)
+        assert not success
+        # the batch doesn't lead to the assumed valid block
+        assume_valid = (trusted_block.height, bytes32(b"\1" * 32))
+        success, _, _, _ = await node.receive_block_batch(batch, peer, None, None, None, assume_valid)
+        assert not success
+        assert not node.blockchain.contains_block(bad_block.header_hash)
+
+        # the signature isn't validated below the assumed valid block
+        assume_valid = (trusted_block.height, trusted_block.header_hash)
+        success, advanced_peak, _, _ = await node.receive_block_batch(batch, peer, None, None, None, assume_valid)
+        assert success and advanced_peak
+        assert node.blockchain.get_peak().header_hash == blocks[-1].header_hash
+
+    @pytest.mark.asyncio
+    async def test_get_assume_valid_block(self, wallet_nodes, bt):
+        full_node_1, full_node_2, server_1, server_2, wallet_a, wallet_receiver = wallet_nodes
+        node = full_node_1.full_node
+        validated_headers = ValidatedHeaders()
+        for height in range(5, 10):
+            validated_headers.append(height, bytes32([height] * 32), bytes32([0] * 32))
+
+        assert node.get_assume_valid_block(validated_headers) is None
+        node.config["assume_valid_height"] = 7
+        node.config["assume_valid_header_hash"] = bytes32([7] * 32).hex()
+        try:
+            assert node.get_assume_valid_block(validated_headers) == (7, bytes32([7] * 32))
+            # the block's ancestors can't be known without syncing the headers first
+            assert node.get_assume_valid_block(None) is None
+            # the headers lead to a different block at that height
+            node.config["assume_valid_header_hash"] = bytes32([1] * 32).hex()
+            assert node.get_assume_valid_block(validated_headers) is None
+            # the block isn't in the range we're syncing
+            node.config["assume_valid_height"] = 11
+            node.config["assume_valid_header_hash"] = bytes32([11] * 32).hex()
+            assert node.get_assume_valid_block(validated_headers) is None
+        finally:
+            del node.config["assume_valid_height"]
+            del node.config["assume_valid_header_hash"]
+
+    @pytest.mark.asyncio
+    async def test_receive_block_batch_group_commit(self, wallet_nodes, bt, self_hostname, monkeypatch):
+        full_node_1, full_node_2, server_1, server_2, wallet_a, wallet_receiver = wallet_nodes
+        peer = await connect_and_get_peer(server_1, server_2, self_hostname)
+        node = full_node_1.full_node
+        blocks = await full_node_1.get_all_full_blocks()
+        num_blocks = len(blocks)
+        blocks = bt.get_consecutive_blocks(10, block_list_input=blocks)
+        batch = blocks[num_blocks:]
+        bad_block = batch[3]
+
+        original_receive_block = node.blockchain.receive_block
+        original_add_full_block = node.block_store.add_full_block
+
+        async def receive_invalid_block(block, *args, **kwargs):
+            if block.header_hash == bad_block.header_hash:
+                return ReceiveBlockResult.INVALID_BLOCK, Err.INVALID_BLOCK_SOLUTION, None, ([], {})
+            return await original_receive_block(block, *args, **kwargs)
+
+        async def fail_adding_block(header_hash, block, block_record):
+            await original_add_full_block(header_hash, block, block_record)
+            if header_hash == bad_block.header_hash:
+                raise RuntimeError("failure while adding the block")
+
+        node.sync_store.set_long_sync(True)
+        try:
+            # the blocks before an invalid block are committed
+            monkeypatch.setattr(node.blockchain, "receive_block", receive_invalid_block)
+            success, _, _, _ = await node.receive_block_batch(batch, peer, None)
+            assert not success
+            monkeypatch.undo()
+            assert node.blockchain.get_peak().header_hash == batch[2].header_hash
+            assert await node.block_store.get_peak() == (batch[2].header_hash, batch[2].height)
+            assert await node.block_store.get_block_record(bad_block.header_hash) is None
+
+            # when adding a block fails, its savepoint is rolled back and the
+            # blocks before it are committed
+            batch = blocks[num_blocks + 3 :]
+            bad_block = batch[2]
+            monkeypatch.setattr(node.block_store, "add_full_block", fail_adding_block)
+            with pytest.raises(RuntimeError):
+                await node.receive_block_batch(batch, peer, None)
+            monkeypatch.undo()
+            assert node.blockchain.get_peak().header_hash == batch[1].header_hash
+            assert await node.block_store.get_peak() == (batch[1].header_hash, batch[1].height)
+            assert await node.block_store.get_block_record(batch[1].header_hash) is not None
+            assert await node.block_store.get_block_record(bad_block.header_hash) is None
+            assert not node.blockchain.contains_block(bad_block.header_hash)
+
+            success, advanced_peak, _, _ = await node.receive_block_batch(batch, peer, None)
+            assert success and advanced_peak
+            assert await node.block_store.get_peak() == (blocks[-1].header_hash, blocks[-1].height)
+        finally:
+            node.sync_store.set_long_sync(False)
+
     @pytest.mark.asyncio
     async def test_new_unfinished_block(self, wallet_nodes, bt, self_hostname):
         full_node_1, full_node_2, server_1, server_2, wallet_a, wallet_receiver = wallet_nodes
@@ -1,14 +1,17 @@
+import asyncio
 import dataclasses
 import logging
 from time import time
 
-from typing import Dict, List, Optional, Tuple, Callable
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Callable
 
 from clvm.casts import int_to_bytes
 import pytest
+import pytest_asyncio
 
 import chia.server.ws_connection as ws
 
+from chia.clvm.spend_sim import SimBlockRecord, SimClient, SpendSim
 from chia.full_node.mempool import Mempool
 from chia.full_node.full_node_api import FullNodeAPI
 from chia.protocols import full_node_protocol, wallet_protocol
@@ -24,7 +27,7 @@ from chia.types.condition_with_args import ConditionWithArgs
 from chia.types.spend_bundle import SpendBundle
 from chia.types.mempool_item import MempoolItem
 from chia.util.condition_tools import conditions_for_solution, pkm_pairs
-from chia.util.errors import Err
+from chia.util.errors import Err, ValidationError
 from chia.util.ints import uint64, uint32
 from chia.util.hash import std_hash
 from chia.types.mempool_inclusion_status import MempoolInclusionStatus
@@ -2535,3 +2538,175 @@ class TestPkmPairs:
         pks, msgs = pkm_pairs(conds, b"foobar")
         assert [bytes(pk) for pk in pks] == [bytes(self.pk2), bytes(self.pk1)]
         assert msgs == [b"msg2", b"msg1" + self.h1 + b"foobar"]
+
+
+ANYONE_CAN_SPEND = Program.to(1)
+
+
+def anyone_can_spend(coin: Coin, conditions: List) -> SpendBundle:
+    return SpendBundle([CoinSpend(coin, ANYONE_CAN_SPEND, Program.to(conditions))], G2Element())
+
+
+@pytest_asyncio.fixture(scope="function")
+async def sim_with_coins() -> AsyncIterator[Tuple[SpendSim, SimClient, List[Coin]]]:
+    """
+    A SpendSim with the rewards of 3 blocks, which anyone can spend
+    """
+    sim = await SpendSim.create()
+    try:
+        for _ in range(3):
+            await sim.farm_block(ANYONE_CAN_SPEND.get_tree_hash())
+        sim_client = SimClient(sim)
+        coin_records = await sim_client.get_coin_records_by_puzzle_hash(ANYONE_CAN_SPEND.get_tree_hash())
+        yield sim, sim_client, [cr.coin for cr in coin_records]
+    finally:
+        await sim.close()
+
+
+class TestMempoolReorg:
+    @pytest.mark.asyncio
+    async def test_revalidate_affected_items(self, sim_with_coins):
+        sim, sim_client, coins = sim_with_coins
+        coins = coins[:2]
+        bundles = [anyone_can_spend(coin, []) for coin in coins]
+        for bundle in bundles:
+            status, error = await sim_client.push_tx(bundle)
+            assert status == MempoolInclusionStatus.SUCCESS and error is None
+        kept_item = sim.mempool_manager.get_mempool_item(bundles[1].name())
+        assert kept_item is not None
+
+        # a reorg to a peak that doesn't build on the previous one, where only the first coin changed
+        height = sim.get_height()
+        await sim.mempool_manager.coin_store._set_spent([coins[0].name()], uint32(height + 1))
+        changed = await sim.mempool_manager.coin_store.get_coin_record(coins[0].name())
+        assert changed is not None
+        new_peak = SimBlockRecord.create([], uint32(height + 1), sim.timestamp)
+        await sim.mempool_manager.new_peak(new_peak, [changed])
+        assert sim.mempool_manager.get_mempool_item(bundles[0].name()) is None
+        assert sim.mempool_manager.get_mempool_item(bundles[1].name()) is kept_item
+
+        # without the coin changes, every item is validated again
+        new_peak = SimBlockRecord.create([], uint32(height + 2), sim.timestamp)
+        await sim.mempool_manager.new_peak(new_peak, None)
+        item = sim.mempool_manager.get_mempool_item(bundles[1].name())
+        assert item is not None and item is not kept_item
+
+
+class TestCreateBundleFromMempool:
+    @pytest.mark.asyncio
+    async def test_skips_items_that_dont_fit(self, sim_with_coins):
+        sim, sim_client, coins = sim_with_coins
+        coins = coins[:3]
+
+        def spend(coin: Coin, outputs: int, fee: int) -> SpendBundle:
+            amount = (coin.amount - fee) // outputs
+            return anyone_can_spend(
+                coin, [[ConditionOpcode.CREATE_COIN, bytes32([i] * 32), amount] for i in range(outputs)]
+            )
+
+        # the largest item pays the most per cost, the two smaller ones come after it
+        bundles = [spend(coins[0], 6, 10000000000), spend(coins[1], 1, 10000000), spend(coins[2], 1, 1000000)]
+        for bundle in bundles:
+            status, error = await sim_client.push_tx(bundle)
+            assert status == MempoolInclusionStatus.SUCCESS and error is None
+        items = [sim.mempool_manager.get_mempool_item(bundle.name()) for bundle in bundles]
+        assert items[0].fee_per_cost > items[1].fee_per_cost > items[2].fee_per_cost
+        max_cost = items[1].cost + items[2].cost
+        assert items[0].cost > max_cost
+        # the limit is computed from the factor, leave room for rounding
+        sim.mempool_manager.limit_factor = (max_cost + 0.5) / sim.defaults.MAX_BLOCK_COST_CLVM
+
+        peak_hash = sim.mempool_manager.peak.header_hash
+        result = await sim.mempool_manager.create_bundle_from_mempool(peak_hash)
+        assert result is not None
+        assert set(cs.coin for cs in result[0].coin_spends) == {coins[1], coins[2]}
+        # the template is reused until the mempool changes
+        assert await sim.mempool_manager.create_bundle_from_mempool(peak_hash) is result
+        sim.mempool_manager.mempool.remove_from_pool(items[2])
+        result = await sim.mempool_manager.create_bundle_from_mempool(peak_hash)
+        assert result is not None
+        assert [cs.coin for cs in result[0].coin_spends] == [coins[1]]
+
+    @pytest.mark.asyncio
+    async def test_time_budget(self, sim_with_coins):
+        sim, sim_client, coins = sim_with_coins
+        # two coins of the same amount, so spending them costs the same
+        by_amount: Dict[int, List[Coin]] = {}
+        for coin in coins:
+            by_amount.setdefault(coin.amount, []).append(coin)
+        same_amount = next(c for c in by_amount.values() if len(c) >= 2)[:2]
+        coins = [next(c for c in coins if c not in same_amount)] + same_amount
+
+        def spend(coin: Coin, outputs: int, fee: int) -> SpendBundle:
+            amount = (coin.amount - fee) // outputs
+            return anyone_can_spend(
+                coin, [[ConditionOpcode.CREATE_COIN, bytes32([i] * 32), amount] for i in range(outputs)]
+            )
+
+        # the first item doesn't fit, the two after it do. They have the same
+        # fee per cost
+        bundles = [spend(coins[0], 6, 10000000000), spend(coins[1], 1, 10000000), spend(coins[2], 1, 10000000)]
+        for bundle in bundles:
+            status, error = await sim_client.push_tx(bundle)
+            assert status == MempoolInclusionStatus.SUCCESS and error is None
+        items = [sim.mempool_manager.get_mempool_item(bundle.name()) for bundle in bundles]
+        assert items[1].fee_per_cost == items[2].fee_per_cost
+        manager = sim.mempool_manager
+        manager.limit_factor = (items[1].cost + items[2].cost + 0.5) / sim.defaults.MAX_BLOCK_COST_CLVM
+        manager.block_fill_time_budget = 6
+
+        now = 1000.0
+
+        def clock() -> float:
+            # every look at the clock takes 4 seconds
+            nonlocal now
+            now += 4
+            return now
+
+        # the deadline is set when the first item is skipped, and checked
+        # before every item after that, even within the same fee per cost. It
+        # passes before the third one
+        result = manager.create_block_template(manager.mempool.items_by_fee_per_cost(), clock)
+        assert result is not None
+        assert len(result[0].coin_spends) == 1
+        assert result[0].coin_spends[0].coin in coins[1:]
+
+
+class TestPreValidateSpendBundle:
+    @pytest.mark.asyncio
+    async def test_concurrent_spend_bundles_are_batched(self, sim_with_coins):
+        sim, sim_client, coins = sim_with_coins
+        bundles = [anyone_can_spend(coin, [[ConditionOpcode.CREATE_COIN, bytes32([0] * 32), 1]]) for coin in coins[:4]]
+        # this one requires a signature it doesn't have
+        bad_bundle = anyone_can_spend(
+            coins[4], [[ConditionOpcode.AGG_SIG_UNSAFE, bytes(G1Element.generator()), b"msg"]]
+        )
+
+        manager = sim.mempool_manager
+        results = await asyncio.gather(
+            *(manager.pre_validate_spendbundle(bundle, None, bundle.name()) for bundle in bundles + [bad_bundle]),
+            return_exceptions=True,
+        )
+        for bundle, result in zip(bundles, results):
+            assert isinstance(result, NPCResult) and result.error is None
+            assert result.conds.spends[0].coin_id == bundle.coin_spends[0].coin.name()
+        assert isinstance(results[-1], ValidationError) and results[-1].code == Err.BAD_AGGREGATE_SIGNATURE
+        assert len(manager._pre_validation_batch) == 0
+
+    @pytest.mark.asyncio
+    async def test_shut_down_cancels_pre_validation(self, sim_with_coins):
+        sim, sim_client, coins = sim_with_coins
+        bundle = anyone_can_spend(coins[0], [])
+        manager = sim.mempool_manager
+        manager.pre_validation_batch_delay = 60
+        pending = asyncio.create_task(manager.pre_validate_spendbundle(bundle, None, bundle.name()))
+        await asyncio.sleep(0)
+        task = manager._pre_validation_task
+        assert task is not None and not task.done()
+
+        manager.shut_down()
+        with pytest.raises(asyncio.CancelledError):
+            await pending
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert len(manager._pre_validation_batch) == 0
@@ -1,7 +1,6 @@
 import pytest
 import aiosqlite
 import random
-from pathlib import Path
 from typing import List, Tuple
 
 from tests.setup_nodes import test_constants
@@ -71,7 +70,7 @@ class TestDbUpgrade:
                     hint_store1 = None
 
                 bc = await Blockchain.create(
-                    coin_store1, block_store1, test_constants, hint_store1, Path("."), reserved_cores=0
+                    coin_store1, block_store1, test_constants, hint_store1, in_file.parent, reserved_cores=0
                 )
 
                 for block in blocks:
@@ -142,7 +142,9 @@ async def make_db(db_file: Path, blocks: List[FullBlock]) -> None:
         coin_store = await CoinStore.create(db_wrapper, uint32(0))
         hint_store = await HintStore.create(db_wrapper)
 
-        bc = await Blockchain.create(coin_store, block_store, test_constants, hint_store, Path("."), reserved_cores=0)
+        bc = await Blockchain.create(
+            coin_store, block_store, test_constants, hint_store, db_file.parent, reserved_cores=0
+        )
 
         for block in blocks:
             results = PreValidationResult(None, uint64(1), None, False)
@@ -101,6 +101,16 @@ class TestRpc:
             assert block == blocks[-1]
             assert (await client.get_block(bytes([1] * 32))) is None
 
+            cache_stats = await client.get_cache_stats()
+            assert cache_stats["block_cache"]["parsed"]["hits"] > 0
+            assert cache_stats["block_cache"]["parsed"]["bytes"] <= cache_stats["block_cache"]["max_bytes"]
+            assert cache_stats["bls_pairing_cache"]["bytes"] <= cache_stats["bls_pairing_cache"]["max_bytes"]
+
+            db_stats = await client.get_db_stats(count=5)
+            assert db_stats["pool"]["read_connections"] >= db_stats["pool"]["min_read_connections"]
+            assert db_stats["pool"]["writer_lock_count"] > 0
+            assert 0 < len(db_stats["statements"]) <= 5
+
             assert (await client.get_block_record_by_height(2)).header_hash == blocks[2].header_hash
 
             assert len((await client.get_block_records(0, 100))) == num_blocks * 2
@@ -0,0 +1,21 @@
+from chia.util.bloom_filter import BloomFilter
+
+
+class TestBloomFilter:
+    def test_bloom_filter(self):
+        f = BloomFilter(10000)
+        keys = [i.to_bytes(32, "big") for i in range(500)]
+        for k in keys:
+            f.add(k)
+        for k in keys:
+            assert f.might_contain(k)
+
+        false_positives = sum(1 for i in range(1000, 11000) if f.might_contain(i.to_bytes(32, "big")))
+        # with 20 bits per key and 4 hashes, the false positive rate is ~0.1%
+        assert false_positives < 100
+
+    def test_tiny_filter(self):
+        f = BloomFilter(0)
+        assert not f.might_contain(b"foo")
+        f.add(b"foo")
+        assert f.might_contain(b"foo")
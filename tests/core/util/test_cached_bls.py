@@ -38,3 +38,28 @@ class TestCachedBLS(unittest.TestCase):
         assert cached_bls.aggregate_verify(pks_half, msgs_half, agg_sig_half, False, local_cache)
         # Verify more messages (partial cache hit)
         assert cached_bls.aggregate_verify(pks, msgs, agg_sig, False, local_cache)
+
+    def test_pairing_cache(self):
+        n_keys = 10
+        seed = b"c" * 31
+        sks = [AugSchemeMPL.key_gen(seed + bytes([i])) for i in range(n_keys)]
+        pks = [bytes(sk.get_g1()) for sk in sks]
+        msgs = [("msg-%d" % (i,)).encode() for i in range(n_keys)]
+        agg_sig = AugSchemeMPL.aggregate([AugSchemeMPL.sign(sk, msg) for sk, msg in zip(sks, msgs)])
+
+        # room for half of the pairings
+        cache = cached_bls.PairingCache(n_keys // 2 * cached_bls.PAIRING_CACHE_ENTRY_SIZE)
+        assert cached_bls.aggregate_verify(pks, msgs, agg_sig, True, cache)
+        stats = cache.get_stats()
+        assert stats["entries"] == n_keys // 2
+        assert stats["bytes"] == stats["max_bytes"]
+        assert stats["misses"] == n_keys
+        assert stats["evictions"] == n_keys // 2
+
+        # the most recent pairings are hits
+        assert cached_bls.aggregate_verify(pks[n_keys // 2 :], msgs[n_keys // 2 :], agg_sig, True, cache) is False
+        assert cache.get_stats()["hits"] == n_keys // 2
+
+        cache.resize(2 * cached_bls.PAIRING_CACHE_ENTRY_SIZE)
+        assert len(cache) == 2
+        assert cache.get_stats()["bytes"] == 2 * cached_bls.PAIRING_CACHE_ENTRY_SIZE
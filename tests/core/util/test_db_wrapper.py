@@ -1,11 +1,14 @@
 import asyncio
 import contextlib
+import tempfile
+from pathlib import Path
 from typing import List
 
 import aiosqlite
 import pytest
 
-from chia.util.db_wrapper import DBWrapper2
+import chia.util.db_wrapper
+from chia.util.db_wrapper import DBStats, DBWrapper2, fetch_many, timed_connect
 from tests.util.db_connection import DBConnection
 
 
@@ -127,6 +130,73 @@ async def test_partial_failure() -> None:
     assert values == [42, 1337, 1, 42]
 
 
+@pytest.mark.asyncio
+async def test_on_rollback() -> None:
+    rolled_back: List[str] = []
+    async with DBConnection(2) as db_wrapper:
+        await setup_table(db_wrapper)
+        try:
+            async with db_wrapper.write_db():
+                db_wrapper.on_rollback(lambda: rolled_back.append("outer"))
+                async with db_wrapper.write_db():
+                    db_wrapper.on_rollback(lambda: rolled_back.append("committed"))
+                try:
+                    async with db_wrapper.write_db():
+                        db_wrapper.on_rollback(lambda: rolled_back.append("failed"))
+                        raise RuntimeError("failure within a sub-transaction")
+                except RuntimeError:
+                    pass
+                # only the failed savepoint was rolled back so far
+                assert rolled_back == ["failed"]
+                raise RuntimeError("failure of the whole transaction")
+        except RuntimeError:
+            pass
+        # the savepoint that succeeded is rolled back with the enclosing transaction
+        assert rolled_back == ["failed", "committed", "outer"]
+
+        async with db_wrapper.write_db():
+            db_wrapper.on_rollback(lambda: rolled_back.append("not rolled back"))
+        assert rolled_back == ["failed", "committed", "outer"]
+
+
+@pytest.mark.asyncio
+async def test_before_commit() -> None:
+    calls: List[int] = []
+
+    async def callback() -> None:
+        async with db_wrapper.read_db() as conn:
+            async with conn.execute("SELECT value FROM counter") as cursor:
+                calls.append(await get_value(cursor))
+
+    async def failing_callback() -> None:
+        raise RuntimeError("failure before commit")
+
+    async with DBConnection(2) as db_wrapper:
+        await setup_table(db_wrapper)
+        async with db_wrapper.write_db():
+            await increment_counter(db_wrapper)
+            db_wrapper.before_commit(callback)
+            async with db_wrapper.write_db():
+                db_wrapper.before_commit(callback)
+            # not called before the outermost transaction commits
+            assert calls == []
+        # called once, within the transaction
+        assert calls == [1]
+
+        with pytest.raises(RuntimeError):
+            async with db_wrapper.write_db():
+                await increment_counter(db_wrapper)
+                db_wrapper.before_commit(failing_callback)
+        # the failure rolls back the transaction
+        async with db_wrapper.read_db() as conn:
+            async with conn.execute("SELECT value FROM counter") as cursor:
+                assert await get_value(cursor) == 1
+
+        async with db_wrapper.write_db():
+            pass
+        assert calls == [1]
+
+
 @pytest.mark.asyncio
 async def test_readers_nests() -> None:
     async with DBConnection(2) as db_wrapper:
@@ -223,3 +293,185 @@ async def test_mixed_readers_writers(acquire_outside: bool) -> None:
     assert values[0] == 1
     assert values[-1] == 2
     assert len(values) == concurrent_task_count
+
+
+@pytest.mark.asyncio
+async def test_read_pool_grows_and_shrinks(monkeypatch) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = Path(tmp_dir) / "test.sqlite"
+        stats = DBStats()
+
+        async def connect_reader() -> aiosqlite.Connection:
+            return await timed_connect(db_path, stats)
+
+        db_wrapper = DBWrapper2(
+            await timed_connect(db_path, stats),
+            db_version=2,
+            stats=stats,
+            reader_factory=connect_reader,
+            max_read_connections=4,
+        )
+        try:
+            await db_wrapper.add_connection(await connect_reader())
+            await setup_table(db_wrapper)
+
+            # readers hold on to their connections until released, so the
+            # ones waiting for a connection grow the pool to its limit
+            release = asyncio.Event()
+            values: List[int] = []
+
+            async def hold_reader() -> None:
+                async with db_wrapper.read_db() as conn:
+                    async with conn.execute("SELECT value FROM counter") as cursor:
+                        values.append(await get_value(cursor))
+                    await release.wait()
+
+            readers = [asyncio.create_task(hold_reader()) for _ in range(5)]
+            while len(values) < 4:
+                await asyncio.sleep(0.01)
+            release.set()
+            await asyncio.gather(*readers)
+            assert values == [0] * 5
+
+            pool_stats = db_wrapper.get_pool_stats()
+            assert pool_stats["pool_grown"] == 3
+            assert pool_stats["read_connections"] == 4
+            assert pool_stats["read_connections_in_use"] == 0
+            assert pool_stats["read_wait_count"] > 0
+            assert pool_stats["writer_lock_count"] == 1
+
+            # once readers haven't had to wait for a while, the extra
+            # connections are closed as they're released
+            monkeypatch.setattr(chia.util.db_wrapper, "POOL_SHRINK_IDLE", 0)
+            for _ in range(5):
+                await sum_counter(db_wrapper, values)
+            pool_stats = db_wrapper.get_pool_stats()
+            assert pool_stats["pool_shrunk"] == 3
+            assert pool_stats["read_connections"] == 1
+        finally:
+            await db_wrapper.close()
+
+
+@pytest.mark.asyncio
+async def test_read_pool_release_at_grow_timeout(monkeypatch) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = Path(tmp_dir) / "test.sqlite"
+
+        async def connect_reader() -> aiosqlite.Connection:
+            return await aiosqlite.connect(db_path)
+
+        db_wrapper = DBWrapper2(await aiosqlite.connect(db_path), reader_factory=connect_reader, max_read_connections=2)
+        try:
+            await db_wrapper.add_connection(await connect_reader())
+            # the waiting reader times out in the same event loop iteration
+            # as the connection is handed to it
+            monkeypatch.setattr(chia.util.db_wrapper, "POOL_GROW_WAIT", 0)
+            conn = await db_wrapper._get_read_connection()
+            waiting = asyncio.create_task(db_wrapper._get_read_connection())
+            await asyncio.sleep(0)
+            assert db_wrapper.get_pool_stats()["readers_waiting"] == 1
+            await db_wrapper._release_read_connection(conn)
+
+            # the reader takes the connection it was handed, instead of
+            # dropping it and growing the pool
+            assert await waiting is conn
+            pool_stats = db_wrapper.get_pool_stats()
+            assert pool_stats["pool_grown"] == 0
+            assert pool_stats["read_connections"] == 1
+            assert pool_stats["read_connections_in_use"] == 1
+            assert pool_stats["readers_waiting"] == 0
+            await db_wrapper._release_read_connection(conn)
+            assert db_wrapper.get_pool_stats()["read_connections_in_use"] == 0
+        finally:
+            await db_wrapper.close()
+
+
+@pytest.mark.asyncio
+async def test_read_pool_waiters_in_order() -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = Path(tmp_dir) / "test.sqlite"
+        db_wrapper = DBWrapper2(await aiosqlite.connect(db_path))
+        try:
+            await db_wrapper.add_connection(await aiosqlite.connect(db_path))
+            order: List[str] = []
+
+            async def reader(name: str) -> None:
+                async with db_wrapper.read_db():
+                    order.append(name)
+
+            async with db_wrapper.read_db():
+                waiting = asyncio.create_task(reader("waiting"))
+                await asyncio.sleep(0)
+
+            # the released connection was handed to the waiting reader, a new
+            # reader can't take it before the waiting one gets to run
+            await reader("new")
+            await waiting
+            assert order == ["waiting", "new"]
+
+            # cancelled readers don't hold on to the connection they're handed
+            async with db_wrapper.read_db():
+                cancelled = asyncio.create_task(reader("cancelled"))
+                await asyncio.sleep(0)
+            cancelled.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await cancelled
+            await reader("after cancel")
+            assert order == ["waiting", "new", "after cancel"]
+            assert db_wrapper.get_pool_stats()["read_connections_in_use"] == 0
+        finally:
+            await db_wrapper.close()
+
+
+@pytest.mark.asyncio
+async def test_statement_stats() -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        stats = DBStats(slow_query_seconds=0)
+        async with timed_connect(Path(tmp_dir) / "test.sqlite", stats) as conn:
+            await conn.execute("CREATE TABLE t(value INTEGER)")
+            await conn.executemany("INSERT INTO t VALUES(?)", [(i,) for i in range(10)])
+            for i in range(3):
+                async with conn.execute("SELECT value FROM t WHERE value IN (?, ?)", (i, i + 1)) as cursor:
+                    assert len(list(await cursor.fetchall())) == 2
+            await conn.execute_fetchall("SELECT value FROM t WHERE value IN (?,?,?)", (1, 2, 3))
+
+        expensive = stats.most_expensive(10)
+        assert len(expensive) == 3
+        assert stats.most_expensive(1) == expensive[:1]
+        counts = {s["sql"]: s["count"] for s in expensive}
+        assert counts == {
+            "CREATE TABLE t(value INTEGER)": 1,
+            "INSERT INTO t VALUES(?)": 1,
+            "SELECT value FROM t WHERE value IN (?, ...)": 4,
+        }
+        for s in expensive:
+            assert s["total_time"] >= s["max_time"] >= 0
+
+
+def test_statement_stats_limit(monkeypatch) -> None:
+    monkeypatch.setattr(chia.util.db_wrapper, "MAX_STATEMENT_STATS", 2)
+    stats = DBStats()
+    stats.record_statement("SELECT 1", 0.1)
+    stats.record_statement("SELECT value FROM t WHERE value IN (?,?)", 0.1)
+    # once the limit is reached, statements are normalized
+    for i in range(3, 10):
+        stats.record_statement("SELECT value FROM t WHERE value IN (" + ",".join(["?"] * i) + ")", 0.1)
+    assert len(stats.statements) == 3
+    assert stats.statements["SELECT value FROM t WHERE value IN (?, ...)"].count == 7
+    counts = {s["sql"]: s["count"] for s in stats.most_expensive(10)}
+    assert counts == {"SELECT 1": 1, "SELECT value FROM t WHERE value IN (?, ...)": 8}
+
+
+@pytest.mark.asyncio
+async def test_fetch_many() -> None:
+    async with DBConnection(2) as db_wrapper:
+        async with db_wrapper.write_db() as conn:
+            await conn.execute("CREATE TABLE t(key INTEGER PRIMARY KEY, value INTEGER)")
+            await conn.executemany("INSERT INTO t VALUES(?, ?)", [(i, i * 2) for i in range(2000)])
+
+        async with db_wrapper.read_db() as conn:
+            # more keys than fit in a single statement
+            keys = list(range(0, 4000, 2))
+            rows = await fetch_many(conn, "SELECT key, value FROM t WHERE key IN ({}) AND value<?", keys, (3000,))
+            assert sorted(tuple(r) for r in rows) == [(k, k * 2) for k in range(0, 1500, 2)]
+            assert await fetch_many(conn, "SELECT key FROM t WHERE key IN ({})", []) == []
@@ -1,6 +1,6 @@
 import unittest
 
-from chia.util.lru_cache import LRUCache
+from chia.util.lru_cache import LRUCache, SizedLRUCache
 
 
 class TestLRUCache(unittest.TestCase):
@@ -52,3 +52,38 @@ class TestLRUCache(unittest.TestCase):
         assert len(cache.cache) == 5
         assert cache.get(b"0") is None
         assert cache.get(b"1") == 1
+
+    def test_sized_lru_cache(self):
+        cache = SizedLRUCache(100)
+
+        assert cache.get(b"0") is None
+        assert cache.misses == 1
+
+        cache.put(b"0", 0, 40)
+        cache.put(b"1", 1, 40)
+        assert cache.size == 80
+        assert cache.get(b"0") == 0
+        assert cache.hits == 1
+
+        # 1 is least recently used
+        cache.put(b"2", 2, 40)
+        assert cache.size == 80
+        assert cache.evictions == 1
+        assert cache.get(b"1") is None
+        assert cache.get(b"0") == 0
+        assert cache.get(b"2") == 2
+
+        # replacing an entry updates the size
+        cache.put(b"2", 3, 10)
+        assert cache.size == 50
+        assert cache.get(b"2") == 3
+
+        # values larger than the whole budget are not cached
+        cache.put(b"3", 3, 101)
+        assert cache.get(b"3") is None
+        assert cache.size == 50
+
+        cache.remove(b"0")
+        cache.remove(b"0")
+        assert cache.size == 10
+        assert len(cache) == 1
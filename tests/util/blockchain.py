@@ -30,7 +30,7 @@ async def create_blockchain(constants: ConsensusConstants, db_version: int):
     coin_store = await CoinStore.create(wrapper)
     store = await BlockStore.create(wrapper)
     hint_store = await HintStore.create(wrapper)
-    bc1 = await Blockchain.create(coin_store, store, constants, hint_store, Path("."), 2)
+    bc1 = await Blockchain.create(coin_store, store, constants, hint_store, Path(tempfile.mkdtemp()), 2)
     assert bc1.get_peak() is None
     return bc1, wrapper, db_path
 
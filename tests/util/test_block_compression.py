@@ -0,0 +1,60 @@
+import random
+from typing import List
+
+import pytest
+import zstd
+
+from chia.util.block_compression import BlockCompressor, frame_dict_id, train_dictionary
+
+
+def make_samples(count: int) -> List[bytes]:
+    rng = random.Random(1337)
+    header = bytes(rng.getrandbits(8) for _ in range(200))
+    # structurally repetitive blobs, with some random content, like blocks
+    return [header + i.to_bytes(4, "big") + bytes(rng.getrandbits(8) for _ in range(64)) + header for i in range(count)]
+
+
+def test_legacy_blocks() -> None:
+    compressor = BlockCompressor()
+    assert compressor.current_dict_id is None
+    blob = b"foobar" * 100
+
+    # without a dictionary we produce plain zstd frames
+    compressed = compressor.compress(blob)
+    assert frame_dict_id(compressed) == 0
+    assert zstd.decompress(compressed) == blob
+    assert compressor.decompress(zstd.compress(blob)) == blob
+
+
+def test_dictionary_roundtrip() -> None:
+    samples = make_samples(1000)
+    dict_data = train_dictionary(samples, 1, 4096)
+
+    compressor = BlockCompressor({1: dict_data})
+    assert compressor.current_dict_id == 1
+    for s in samples[:10]:
+        compressed = compressor.compress(s)
+        assert frame_dict_id(compressed) == 1
+        assert compressor.decompress(compressed) == s
+        assert len(compressed) < len(zstd.compress(s))
+
+    # blocks compressed before the dictionary was added can still be read
+    assert compressor.decompress(zstd.compress(samples[0])) == samples[0]
+
+    # a newer dictionary is used for compression, the old one can still be
+    # used for decompression
+    old_blob = compressor.compress(samples[0])
+    compressor.add_dictionary(2, train_dictionary(samples, 2, 4096))
+    assert compressor.current_dict_id == 2
+    assert frame_dict_id(compressor.compress(samples[0])) == 2
+    assert compressor.decompress(old_blob) == samples[0]
+
+    # we can't decompress a block if we don't have its dictionary
+    with pytest.raises(ValueError, match="unknown dictionary"):
+        BlockCompressor().decompress(old_blob)
+
+
+def test_mismatching_dict_id() -> None:
+    dict_data = train_dictionary(make_samples(1000), 3, 4096)
+    with pytest.raises(ValueError, match="mismatching ID"):
+        BlockCompressor({4: dict_data})
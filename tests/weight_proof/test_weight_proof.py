@@ -491,6 +491,33 @@ class TestWeightProof:
         assert valid
         assert fork_point != 0
 
+    @pytest.mark.asyncio
+    async def test_weight_proof_validation_pool(self, default_1000_blocks):
+        blocks = default_1000_blocks
+        header_cache, height_to_hash, sub_blocks, summaries = await load_blocks_dont_validate(blocks)
+        wpf = WeightProofHandler(test_constants, BlockCache(sub_blocks, header_cache, height_to_hash, summaries))
+        wps = [await wpf._create_proof_of_weight(blocks[height].header_hash) for height in [600, 800, -1]]
+        wpf_verify = WeightProofHandler(test_constants, BlockCache(sub_blocks, header_cache, height_to_hash, {}))
+        try:
+            # several weight proofs validated at once share the pool
+            results = await asyncio.gather(*(wpf_verify.validate_weight_proof(wp) for wp in wps))
+            assert [valid for valid, _, _ in results] == [True, True, True]
+            pool = wpf_verify.get_validation_pool()
+            valid, _, _ = await wpf_verify.validate_weight_proof(wps[-1])
+            assert valid
+            assert wpf_verify.get_validation_pool() is pool
+            assert len(pool._shutdown_files) == 0
+        finally:
+            wpf_verify.shut_down()
+
+        # a new pool is created if it's needed after shutting down
+        try:
+            valid, _, _ = await wpf_verify.validate_weight_proof(wps[0])
+            assert valid
+            assert wpf_verify.get_validation_pool() is not pool
+        finally:
+            wpf_verify.shut_down()
+
     @pytest.mark.skip("used for debugging")
     @pytest.mark.asyncio
     async def test_weight_proof_from_database(self):
@@ -2,7 +2,6 @@
 
 import sqlite3
 import sys
-import zstd
 import click
 from pathlib import Path
 
@@ -13,6 +12,7 @@ from time import time
 from chia_rs import run_generator, MEMPOOL_MODE
 
 from chia.types.full_block import FullBlock
+from chia.util.block_compression import BlockCompressor, load_dictionaries
 from chia.types.blockchain_format.program import Program
 from chia.consensus.default_constants import DEFAULT_CONSTANTS
 from chia.wallet.puzzles.rom_bootstrap_generator import get_generator
@@ -57,6 +57,7 @@ def run_gen(env_data: bytes, block_program_args: bytes, flags: uint32):
 )
 def main(file: Path, mempool_mode: bool):
     c = sqlite3.connect(file)
+    compressor = BlockCompressor(load_dictionaries(c))
 
     rows = c.execute("SELECT header_hash, height, block FROM full_blocks ORDER BY height")
 
@@ -65,7 +66,7 @@ def main(file: Path, mempool_mode: bool):
     for r in rows:
         hh: bytes = r[0]
         height = r[1]
-        block = FullBlock.from_bytes(zstd.decompress(r[2]))
+        block = FullBlock.from_bytes(compressor.decompress(r[2]))
 
         if len(height_to_hash) <= height:
             assert len(height_to_hash) == height
@@ -79,7 +80,7 @@ def main(file: Path, mempool_mode: bool):
             while height_to_hash[h] != prev_hh:
                 height_to_hash[h] = prev_hh
                 ref = c.execute("SELECT block FROM full_blocks WHERE header_hash=?", (prev_hh,))
-                ref_block = FullBlock.from_bytes(zstd.decompress(ref.fetchone()[0]))
+                ref_block = FullBlock.from_bytes(compressor.decompress(ref.fetchone()[0]))
                 prev_hh = ref_block.prev_header_hash
                 h -= 1
                 if h < 0:
@@ -96,7 +97,7 @@ def main(file: Path, mempool_mode: bool):
         start_time = time()
         for h in block.transactions_generator_ref_list:
             ref = c.execute("SELECT block FROM full_blocks WHERE header_hash=?", (height_to_hash[h],))
-            ref_block = FullBlock.from_bytes(zstd.decompress(ref.fetchone()[0]))
+            ref_block = FullBlock.from_bytes(compressor.decompress(ref.fetchone()[0]))
             block_program_args += b"\xff"
             block_program_args += Program.to(bytes(ref_block.transactions_generator)).as_bin()
             num_refs += 1
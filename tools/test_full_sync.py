@@ -3,20 +3,21 @@
 import asyncio
 import cProfile
 import logging
+import sqlite3
 import tempfile
 import time
-from contextlib import contextmanager
+from contextlib import closing, contextmanager
 from pathlib import Path
 from typing import Iterator
 
 import aiosqlite
 import click
-import zstd
 
 from chia.cmds.init_funcs import chia_init
 from chia.consensus.default_constants import DEFAULT_CONSTANTS
 from chia.full_node.full_node import FullNode
 from chia.types.full_block import FullBlock
+from chia.util.block_compression import BlockCompressor, load_dictionaries
 from chia.util.config import load_config
 from tools.test_constants import test_constants as TEST_CONSTANTS
 
@@ -88,6 +89,8 @@ async def run_sync_test(file: Path, db_version, profile: bool, single_thread: bo
             print()
             counter = 0
             height = 0
+            with closing(sqlite3.connect(file)) as db:
+                compressor = BlockCompressor(load_dictionaries(db))
             async with aiosqlite.connect(file) as in_db:
                 await in_db.execute("pragma query_only")
                 rows = await in_db.execute(
@@ -99,7 +102,7 @@ async def run_sync_test(file: Path, db_version, profile: bool, single_thread: bo
                 start_time = time.monotonic()
                 async for r in rows:
                     with enable_profiler(profile, counter):
-                        block = FullBlock.from_bytes(zstd.decompress(r[2]))
+                        block = FullBlock.from_bytes(compressor.decompress(r[2]))
 
                         block_batch.append(block)
                         if len(block_batch) < 32: